@@ -0,0 +1,172 @@
+"""
+Admission control cho các tool truy vấn DB (query_DeviceInfo, get_complete_location_guide).
+
+Giờ cao điểm nhiều phiên chat cùng gọi query_DeviceInfo: thay vì dồn hết vào SQL Server
+(ai cũng chậm), mỗi process chỉ cho DB_ADMISSION_LIMIT truy vấn chạy đồng thời; request
+tới sau xếp hàng trong hàng đợi có giới hạn:
+
+- Hàng đợi ưu tiên: phiên đã được phục vụ truy vấn DB (đang giữa hội thoại) đứng trước
+  phiên mới; cùng mức ưu tiên thì FIFO
+- Hàng đợi đầy: request mới bị từ chối ngay, trừ khi nó ưu tiên hơn request cuối hàng
+  (request đó bị đẩy ra và nhận "busy")
+- Chờ quá DB_ADMISSION_TIMEOUT giây: trả ngay {"status": "busy", "retry_after_seconds": ...}
+  để agent báo người dùng thử lại, không treo phiên chat
+
+Cấu hình:
+    DB_ADMISSION_LIMIT=8        # mặc định theo TOOL_CONCURRENCY_QUERY_DEVICEINFO
+    DB_ADMISSION_QUEUE=32
+    DB_ADMISSION_TIMEOUT=2.0
+
+Metric: tool_admission_queue_depth, tool_admission_in_flight, tool_admission_wait_seconds,
+tool_admission_total{pool, priority, outcome}.
+"""
+import os
+import heapq
+import asyncio
+import weakref
+import itertools
+import contextlib
+
+from . import metrics
+
+config = {
+    'LIMIT': int(os.getenv('DB_ADMISSION_LIMIT')) if os.getenv('DB_ADMISSION_LIMIT') else None,
+    'QUEUE': int(os.getenv('DB_ADMISSION_QUEUE', '32')),
+    'TIMEOUT': float(os.getenv('DB_ADMISSION_TIMEOUT', '2.0')),
+}
+
+# Số nhỏ được phục vụ trước
+PRIORITY_ACTIVE = 0
+PRIORITY_NEW = 1
+PRIORITY_NAMES = {PRIORITY_ACTIVE: "active", PRIORITY_NEW: "new"}
+# Session state: phiên đã được nhận truy vấn DB ít nhất một lần
+SESSION_KEY = "db_admitted"
+
+
+class Busy(Exception):
+    """Request không được nhận: hàng đợi đầy, bị request ưu tiên hơn đẩy ra, hoặc chờ quá timeout."""
+
+    def __init__(self, pool: str, reason: str, retry_after: float):
+        super().__init__(f"{pool} is busy ({reason})")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def result(self) -> dict:
+        """Kết quả tool có cấu trúc cho agent (không memo vì status khác success)."""
+        return {
+            "status": "busy",
+            "message": "The device database is busy. Ask the user to try again in a few seconds.",
+            "reason": self.reason,
+            "retry_after_seconds": round(self.retry_after, 1),
+        }
+
+
+_ADMISSIONS = metrics.counter("tool_admission_total", "Admission decisions for DB-backed tools",
+                              ("pool", "priority", "outcome"))
+_WAIT_SECONDS = metrics.histogram("tool_admission_wait_seconds", "Time spent queued before admission or rejection",
+                                  ("pool",), buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0))
+_controllers = weakref.WeakSet()
+
+
+class AdmissionController:
+    """Semaphore với hàng đợi ưu tiên có giới hạn và timeout chờ (gắn với một event loop)."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = []  # heap (priority, seq, future)
+        self._seq = itertools.count()
+        _controllers.add(self)
+
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    @contextlib.asynccontextmanager
+    async def admit(self, priority: int = PRIORITY_NEW):
+        """async with controller.admit(priority): ... ; raise Busy nếu không được nhận."""
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int):
+        label = PRIORITY_NAMES.get(priority, str(priority))
+        # Slot chỉ được trả về hàng đợi khi hàng đợi rỗng, nên còn slot nghĩa là không ai đang chờ
+        if self.active < self.limit:
+            self.active += 1
+            _ADMISSIONS.inc(pool=self.name, priority=label, outcome="immediate")
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            worst = max(self._waiters)
+            if worst[0] <= priority:
+                _ADMISSIONS.inc(pool=self.name, priority=label, outcome="queue_full")
+                raise Busy(self.name, "queue_full", self.timeout)
+            self._remove(worst)
+            worst[2].set_exception(Busy(self.name, "displaced", self.timeout))
+            _ADMISSIONS.inc(pool=self.name, priority=PRIORITY_NAMES.get(worst[0], str(worst[0])),
+                            outcome="displaced")
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        future = loop.create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+        timer = loop.call_later(self.timeout, self._expire, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Slot đã được chuyển cho request này đúng lúc nó bị huỷ: trả lại cho người sau
+                self._release()
+            else:
+                self._remove(entry)
+            raise
+        except Busy as e:
+            _WAIT_SECONDS.observe(loop.time() - started, pool=self.name)
+            if e.reason == "timeout":
+                _ADMISSIONS.inc(pool=self.name, priority=label, outcome="timeout")
+            raise
+        finally:
+            timer.cancel()
+        _WAIT_SECONDS.observe(loop.time() - started, pool=self.name)
+        _ADMISSIONS.inc(pool=self.name, priority=label, outcome="queued")
+
+    def _remove(self, entry):
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            return
+        heapq.heapify(self._waiters)
+
+    def _expire(self, entry):
+        if not entry[2].done():
+            self._remove(entry)
+            entry[2].set_exception(Busy(self.name, "timeout", self.timeout))
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Chuyển thẳng slot cho request ưu tiên nhất đang chờ (active giữ nguyên)
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+def _totals(attribute) -> dict:
+    totals = {}
+    for controller in list(_controllers):
+        totals[controller.name] = totals.get(controller.name, 0) + attribute(controller)
+    return totals
+
+
+metrics.gauge("tool_admission_queue_depth", "Requests waiting for a DB admission slot", ("pool",),
+              fn=lambda: _totals(AdmissionController.queue_depth))
+metrics.gauge("tool_admission_in_flight", "Admitted DB requests currently running", ("pool",),
+              fn=lambda: _totals(lambda c: c.active))
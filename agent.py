@@ -1,18 +1,25 @@
 from google.adk.agents.llm_agent import Agent
 from dotenv import load_dotenv
-from .tools import (
+from .async_tools import (
+    find_guides_for_status,
     get_complete_location_guide,
+    get_guide,
     get_poverty_app_download_guide,
     process_pdf_files,
     query_DeviceInfo,
-    determine_folder_type_from_device_name
 )
+from .tools import determine_folder_type_from_device_name
+from .fast_path import render_fast_path, start_model_timer, record_model_latency
+from .pre_router import route_username
+from .tool_memo import memo_before_tool, memo_after_tool
 
 load_dotenv()
 
 agent_tools = [
     get_complete_location_guide,
     get_poverty_app_download_guide,
+    get_guide,
+    find_guides_for_status,
     process_pdf_files,
     query_DeviceInfo,
     determine_folder_type_from_device_name
@@ -33,7 +40,7 @@ WORKFLOW:
    - IMMEDIATELY call get_complete_location_guide(userid="X") - no confirmation needed
 
 2. USE get_complete_location_guide (PREFERRED for General/Location issues):
-   - Returns: device_name, status_message (CRITICAL - read this for error), guide, images[], folder_type
+   - Returns: device_name, guide_id, status_message (CRITICAL - read this for error), suggested_guides[], guide, images[], folder_type
    - If JSON error: call process_pdf_files(), then retry get_complete_location_guide
    - If images[] has items: MUST display ALL using ![Ảnh X](url) format
    - Match images to steps by step_number
@@ -42,11 +49,15 @@ WORKFLOW:
    - This is the PRIMARY source for the error/problem
    - Could be location, network, app, system, or any phone error
    - Base your entire response on what status_message says
+   - suggested_guides[] is a ranked shortlist of guides matching status_message (highest score first)
+   - If the top suggested guide is not the location guide, call `get_guide(guide_id=...)` with its guide_id
+   - For a status message from elsewhere, call `find_guides_for_status(status_message="...")` to get the shortlist
 
 4. SPECIAL CASE: "Quản lý Hộ Nghèo" App Download
    - If user asks specifically about downloading/installing "Hộ Nghèo" app:
    - OR if status_message indicates app installation issue:
    - Call `get_poverty_app_download_guide()`
+   - Output `rendered_markdown` from the result verbatim when present
    - Display steps exactly in this format for each step:
      [Instruction Text]
      <img src="url" width="100"/>
@@ -60,8 +71,14 @@ WORKFLOW:
      Bước 2: Nhập tìm kiếm...
      <img src="http://localhost:8765/image_2.jpg" width="100"/>
 
-5. DISPLAY IMAGES (MANDATORY when available):
+5. OTHER TROUBLESHOOTING GUIDES (network, app crash, permissions...):
+   - If status_message or the user describes a problem not covered above and no guide was suggested, call `get_guide()` to list guides
+   - Pick the guide whose title/keywords match, then call `get_guide(guide_id="...")`
+   - Output `rendered_markdown` from the result verbatim
+
+6. DISPLAY IMAGES (MANDATORY when available):
    - Format: "Bước X\n\n<img src="url" width="300"/>"
+   - If the tool result has `rendered_markdown`, output it verbatim - it is already in this format
    - Use exact URL from images[].url field
    - Show image right after corresponding step text, with a blank line between step text and image
    - If images[] is empty, show text guide only
@@ -72,9 +89,17 @@ CRITICAL RULES:
 - Always prefer get_complete_location_guide (1 call vs 4 separate calls)
 - Display images automatically when available - don't ask permission
 - If JSON error: call process_pdf_files() then retry
+- If a tool returns status "busy": tell the user in one short Vietnamese sentence that the system is busy and to try again in a few seconds; do not call process_pdf_files or other tools
 - Reply in Vietnamese, step-by-step, actionable instructions
 - Do not output tables or raw data from PDF; always format as step-by-step guide with images
 - Your final response must consist ONLY of the formatted steps and images, without any introductory text, explanations, or additional content. Start directly with "Bước 1\n\n![Ảnh 1](url)" and continue for each step.
 """,
     tools=agent_tools,
+    # Nhận ra username bằng regex: gọi thẳng get_complete_location_guide, bỏ lượt model đầu
+    # Turn chỉ gồm kết quả tool hướng dẫn: trả rendered_markdown, không gọi model lần hai
+    before_model_callback=[route_username, render_fast_path, start_model_timer],
+    after_model_callback=[record_model_latency],
+    # Memo kết quả tool trong session: lần gọi lặp lại cùng args trả ngay
+    before_tool_callback=[memo_before_tool],
+    after_tool_callback=[memo_after_tool],
 )
\ No newline at end of file
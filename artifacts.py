@@ -0,0 +1,198 @@
+"""
+Thư mục artifact dùng chung giữa nhiều worker process của agent.
+
+Artifact là mọi thứ sinh ra từ tài liệu gốc: ios/android_instructions.json,
+IOS_Instruction/, Android_Instruction/, help_rasoathongheo_ai.json, extracted_images/,
+JSON của guide trong manifest, guide_index.json và guides.bundle (xem guide_bundle.py).
+Mặc định nằm cạnh agent như trước.
+
+Nhiều worker:
+    ARTIFACT_DIR=/srv/guide-artifacts   # thư mục chung (cùng máy hoặc ổ mạng hỗ trợ lock)
+    ARTIFACT_READ_ONLY=1                # worker chỉ đọc, không bao giờ tự trích xuất
+
+    python -m <tên thư mục agent>.artifacts build          # process builder: tạo artifact còn thiếu
+    python -m <tên thư mục agent>.artifacts build --force  # tạo lại tất cả
+    python -m <tên thư mục agent>.artifacts status
+
+Mỗi artifact được build dưới một file lock (<ARTIFACT_DIR>/.locks/<tên>.lock): process
+tới sau chờ lock rồi thấy artifact đã có, không build lại lần nữa.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import contextlib
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+config = {
+    'DIR': os.path.abspath(os.getenv('ARTIFACT_DIR') or PACKAGE_DIR),
+    'READ_ONLY': os.getenv('ARTIFACT_READ_ONLY', '').lower() in ('1', 'true', 'yes'),
+}
+
+
+def artifact_dir() -> str:
+    return config['DIR']
+
+
+def artifact_path(*parts) -> str:
+    return os.path.join(config['DIR'], *parts)
+
+
+def read_only() -> bool:
+    return config['READ_ONLY']
+
+
+def read_only_error(name: str) -> dict:
+    return {
+        "status": "error",
+        "message": f"Artifact '{name}' has not been built yet; this worker is read-only "
+                   f"(run the artifacts build command on the builder).",
+    }
+
+
+def _lock_file(f):
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        while True:
+            try:
+                # LK_LOCK tự thử lại ~10 giây rồi raise: lặp tới khi có lock
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    import fcntl
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f):
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def write_json(path: str, data, **kwargs):
+    """Ghi JSON qua file tạm + rename: worker đang đọc không bao giờ thấy file ghi dở."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def file_lock(name: str):
+    """Lock độc quyền giữa các process (flock / msvcrt), theo tên artifact."""
+    lock_dir = artifact_path(".locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, f"{name}.lock"), 'a+b') as f:
+        started = time.perf_counter()
+        _lock_file(f)
+        waited = time.perf_counter() - started
+        if waited > 0.1:
+            logging.info(f"Waited {waited:.1f}s for artifact lock {name}")
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+def build(name: str, builder) -> dict:
+    """Build artifact dưới lock (tool process_pdf_files, lệnh build --force)."""
+    if read_only():
+        return read_only_error(name)
+    with file_lock(name):
+        return builder()
+
+
+def ensure(name: str, ready, builder) -> dict:
+    """Build artifact nếu chưa có; process chờ lock xong mà artifact đã có thì không build lại."""
+    if ready():
+        return {"status": "success"}
+    if read_only():
+        return read_only_error(name)
+    with file_lock(name):
+        if ready():
+            return {"status": "success"}
+        return builder()
+
+
+def _builders(tools) -> list:
+    """[(tên artifact, ready(), builder())] của mọi artifact mà agent dùng."""
+    builders = [
+        ("location", lambda: all(os.path.exists(tools._location_json_path(t)) for t in ("IOS", "Android")),
+         tools._build_location_artifacts),
+        ("app_guide", lambda: not tools._app_guide_needs_extraction(), tools._build_app_guide),
+    ]
+    registry = tools.get_registry()
+    for entry in registry.entries():
+        if entry.builtin or not entry.docx:
+            continue
+        source = registry.source_path(entry)
+        builders.append((f"guide-{entry.id}", lambda source=source: os.path.exists(source),
+                         lambda guide_id=entry.id: tools._build_guide(guide_id)))
+    return builders
+
+
+def build_all(force: bool = False) -> dict:
+    """Build mọi artifact còn thiếu (hoặc tất cả khi force), rồi build lại guide index và guide bundle."""
+    from . import tools, guide_bundle
+
+    results = {}
+    for name, ready, builder in _builders(tools):
+        started = time.perf_counter()
+        if force:
+            with file_lock(name):
+                result = builder()
+        else:
+            result = ensure(name, ready, builder)
+        results[name] = {**result, "seconds": round(time.perf_counter() - started, 3)}
+    with file_lock("guide_index"):
+        tools._rebuild_guide_index()
+    started = time.perf_counter()
+    try:
+        bundle = guide_bundle.rebuild()
+        results["guide_bundle"] = {"status": "success", **bundle}
+    except Exception as e:
+        results["guide_bundle"] = {"status": "error", "message": str(e)}
+    results["guide_bundle"]["seconds"] = round(time.perf_counter() - started, 3)
+    return results
+
+
+def status() -> dict:
+    from . import tools, guide_bundle
+
+    bundle = guide_bundle.get_bundle()
+    return {
+        "artifact_dir": artifact_dir(),
+        "read_only": read_only(),
+        "artifacts": {name: ready() for name, ready, _ in _builders(tools)},
+        "guide_bundle": bundle.stats() if bundle is not None else None,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build or inspect shared guide artifacts.")
+    parser.add_argument("command", choices=("build", "status"))
+    parser.add_argument("--force", action="store_true", help="Build lại cả artifact đã có")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "status":
+        print(json.dumps(status(), ensure_ascii=False, indent=2))
+        return 0
+    if read_only():
+        parser.error("ARTIFACT_READ_ONLY is set; run the build on the builder process")
+    results = build_all(force=args.force)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    return 0 if all(r.get("status") == "success" for r in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""
+Phiên bản async của các tool trong tools.py để đăng ký với ADK Agent.
+
+- Truy vấn DB chạy trên thread pool riêng ("tool-db")
+- Đọc JSON / format response chạy trên thread pool I/O ("tool-io")
+- Trích xuất PDF/DOCX (nặng CPU) chạy trên process pool ("spawn") qua extract_worker.py:
+  process con không import __init__/google.adk và nhận config của process này theo tham số.
+  Worker chết (BrokenProcessPool) thì pool được tạo lại và job chạy lại một lần
+- Mỗi tool có giới hạn concurrency riêng, nên một lần rebuild PDF chậm
+  không làm chậm truy vấn DB của người dùng khác.
+
+Giới hạn concurrency cấu hình qua biến môi trường TOOL_CONCURRENCY_<TÊN TOOL>, ví dụ:
+    TOOL_CONCURRENCY_QUERY_DEVICEINFO=8
+    TOOL_CONCURRENCY_PROCESS_PDF_FILES=1
+
+Truy vấn SQL Server còn qua admission control (admission.py): hàng đợi có giới hạn, phiên
+đang giữa hội thoại được ưu tiên, chờ quá lâu thì trả {"status": "busy"} ngay.
+"""
+import os
+import sys
+import site
+import asyncio
+import logging
+import functools
+import threading
+import multiprocessing
+import weakref
+import contextvars
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import tools
+from .image_server import refresh_path_index
+from . import guide_bundle
+from . import admission
+from . import artifacts
+from . import extract_worker
+from .tracing import span
+
+config = {
+    'DB_THREADS': int(os.getenv('TOOL_DB_THREADS', '8')),
+    'IO_THREADS': int(os.getenv('TOOL_IO_THREADS', '8')),
+    'EXTRACT_PROCESSES': int(os.getenv('TOOL_EXTRACT_PROCESSES', '1')),
+}
+
+_DEFAULT_CONCURRENCY = {
+    'query_DeviceInfo': 8,
+    'get_complete_location_guide': 16,
+    'get_poverty_app_download_guide': 16,
+    # Rebuild artifacts tuần tự: tránh hai process cùng ghi IOS_Instruction/...
+    'process_pdf_files': 1,
+    'extract_app_guide': 1,
+    'get_guide': 16,
+    'extract_guide': 1,
+}
+
+_db_executor = ThreadPoolExecutor(max_workers=config['DB_THREADS'], thread_name_prefix="tool-db")
+_io_executor = ThreadPoolExecutor(max_workers=config['IO_THREADS'], thread_name_prefix="tool-io")
+_extract_executor = None
+_extract_executor_lock = threading.Lock()
+# asyncio.Semaphore gắn với event loop, nên giữ một bộ semaphore cho mỗi loop
+_loop_semaphores = weakref.WeakKeyDictionary()
+_loop_admission = weakref.WeakKeyDictionary()
+
+
+def _concurrency_limit(name: str) -> int:
+    return int(os.getenv(f"TOOL_CONCURRENCY_{name.upper()}", _DEFAULT_CONCURRENCY[name]))
+
+
+def _limit(name: str) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphores = _loop_semaphores.setdefault(loop, {})
+    if name not in semaphores:
+        semaphores[name] = asyncio.Semaphore(_concurrency_limit(name))
+    return semaphores[name]
+
+
+def _db_admission() -> admission.AdmissionController:
+    loop = asyncio.get_running_loop()
+    controller = _loop_admission.get(loop)
+    if controller is None:
+        controller = _loop_admission[loop] = admission.AdmissionController(
+            'query_DeviceInfo', admission.config['LIMIT'] or _concurrency_limit('query_DeviceInfo'),
+            admission.config['QUEUE'], admission.config['TIMEOUT'])
+    return controller
+
+
+def _session_priority(tool_context) -> int:
+    """Phiên đã được phục vụ truy vấn DB (đang giữa hội thoại) được ưu tiên hơn phiên mới."""
+    if tool_context is not None and tool_context.state.get(admission.SESSION_KEY):
+        return admission.PRIORITY_ACTIVE
+    return admission.PRIORITY_NEW
+
+
+def _get_extract_executor() -> ProcessPoolExecutor:
+    global _extract_executor
+    with _extract_executor_lock:
+        if _extract_executor is None:
+            # "spawn" thay vì fork: process agent đã có nhiều thread (ADK, image server).
+            # addsitedir: process con import được extract_worker bằng tên top-level
+            _extract_executor = ProcessPoolExecutor(
+                max_workers=config['EXTRACT_PROCESSES'],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=site.addsitedir,
+                initargs=(artifacts.PACKAGE_DIR,),
+            )
+        return _extract_executor
+
+
+def _drop_extract_executor(executor: ProcessPoolExecutor):
+    """Bỏ pool đã hỏng; lần gọi _get_extract_executor sau tạo pool mới."""
+    global _extract_executor
+    with _extract_executor_lock:
+        if _extract_executor is executor:
+            _extract_executor = None
+    executor.shutdown(wait=False)
+
+
+def _worker_module():
+    """extract_worker nạp dưới tên top-level để pickle tham chiếu không kéo theo package."""
+    module = sys.modules.get(extract_worker.WORKER_MODULE)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(extract_worker.WORKER_MODULE, extract_worker.__file__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[extract_worker.WORKER_MODULE] = module
+    return module
+
+
+def _extract_job(fn, *args) -> dict:
+    """Job cho extract_worker.run: chỉ gồm tên hàm, tham số và config dạng dict thường."""
+    package = tools.__package__
+    return {
+        "package": package,
+        "package_dir": artifacts.PACKAGE_DIR,
+        "fn": fn.__name__,
+        "args": args,
+        "config": {name: dict(sys.modules[f"{package}.{name}"].config)
+                   for name in extract_worker.CONFIG_MODULES},
+        "app_guide_paths": tools._app_guide_paths(),
+    }
+
+
+async def _run_extract_job(job: dict):
+    """Chạy job trên process pool; pool hỏng (worker bị kill/crash) thì tạo lại và thử lại một lần."""
+    run = _worker_module().run
+    for attempt in range(2):
+        executor = _get_extract_executor()
+        try:
+            return await _run_in(executor, run, job)
+        except BrokenProcessPool:
+            _drop_extract_executor(executor)
+            if attempt:
+                raise
+            logging.warning(f"Extraction pool broken while running {job['fn']}; restarting it")
+
+
+async def _run_in(executor, fn, *args):
+    loop = asyncio.get_running_loop()
+    if isinstance(executor, ProcessPoolExecutor):
+        return await loop.run_in_executor(executor, functools.partial(fn, *args))
+    # run_in_executor không mang contextvars sang thread: copy để span con nối đúng span cha
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args))
+
+
+async def _run_extraction(fn, *args) -> dict:
+    """Chạy hàm trích xuất trên process pool rồi refresh index ảnh trong process này."""
+    if artifacts.read_only():
+        # Worker chỉ đọc không trích xuất: khỏi tốn công spawn process
+        return artifacts.read_only_error(fn.__name__)
+    try:
+        with span("extract.worker", fn=fn.__name__):
+            result = await _run_extract_job(_extract_job(fn, *args))
+    except Exception as e:
+        logging.error(f"Extraction {fn.__name__} failed in worker process: {e}")
+        return {"status": "error", "message": str(e)}
+    refresh_path_index()
+    # Process trích xuất có thể đã build lại guide bundle
+    guide_bundle.invalidate()
+    return result
+
+
+async def _guide_ready(guide_id: str) -> bool:
+    """tools._guide_ready stat file / đọc manifest: chạy trên thread tool-io, không chặn event loop."""
+    return await _run_in(_io_executor, tools._guide_ready, guide_id)
+
+
+# --- CORE TOOLS (ASYNC) ---
+
+async def query_DeviceInfo(userid: str, tool_context=None) -> dict:
+    """Get device info from DB."""
+    with span("tool.query_DeviceInfo") as s:
+        # Replica cục bộ không chạm SQL Server: không cần xếp hàng
+        data = await _run_in(_io_executor, tools._replica_lookup, userid)
+        s.set_attribute("replica_hit", data is not None)
+        if data is not None:
+            result = {"status": "success", "data": data}
+        else:
+            try:
+                async with _db_admission().admit(_session_priority(tool_context)):
+                    result = await _run_in(_db_executor, tools._query_device_live, userid)
+            except admission.Busy as e:
+                s.set_attribute("result_status", "busy")
+                return e.result()
+        s.set_attribute("result_status", result.get("status"))
+        if tool_context is not None and result.get("status") == "success":
+            tool_context.state[admission.SESSION_KEY] = True
+        return result
+
+
+async def process_pdf_files() -> dict:
+    """Extract location guides from PDF."""
+    async with _limit('process_pdf_files'):
+        return await _run_extraction(tools.process_pdf_files)
+
+
+async def _ensure_location_guide(folder_type: str):
+    """None nếu guide đã sẵn sàng, ngược lại dict lỗi của lần trích xuất."""
+    guide_id = tools._location_guide_id(folder_type)
+    if await _guide_ready(guide_id):
+        return None
+    async with _limit('process_pdf_files'):
+        # Kiểm tra lại: có thể request khác vừa rebuild xong trong lúc chờ
+        if not await _guide_ready(guide_id):
+            extracted = await _run_extraction(tools._extract_guide, guide_id)
+            # Không để _build_location_guide tự trích xuất đồng bộ trên thread tool-io
+            if extracted.get("status") != "success":
+                return extracted
+    return None
+
+
+async def location_guide_for_device(device_name: str, status_message: str = None) -> dict:
+    """Guide định vị cho DeviceName đã biết, không truy vấn DB (dùng bởi tool_memo.py)."""
+    folder_type = tools.determine_folder_type_from_device_name(device_name)
+    extracted = await _ensure_location_guide(folder_type)
+    if extracted is not None:
+        return extracted
+    async with _limit('get_complete_location_guide'):
+        return await _run_in(_io_executor, tools._build_location_guide, device_name, folder_type, status_message)
+
+
+async def get_complete_location_guide(userid: str, tool_context=None) -> dict:
+    """Get location enable guide for user's device."""
+    with span("tool.get_complete_location_guide") as s:
+        dev_info = await query_DeviceInfo(userid, tool_context)
+        if dev_info.get("status") == "busy":
+            s.set_attribute("result_status", "busy")
+            return dev_info
+        if dev_info.get("status") != "success" or not dev_info.get("data"):
+            s.set_attribute("result_status", "error")
+            return {"status": "error", "message": "Device info not found"}
+
+        row = dev_info['data'][0]
+        return await location_guide_for_device(row.get('DeviceName', ''), tools._status_message(row))
+
+
+async def get_poverty_app_download_guide() -> dict:
+    """
+    Get instructions for downloading "Hộ Nghèo" app (Quản lý hộ nghèo).
+    Automagically extracts from DOCX if JSON not present.
+    """
+    with span("tool.get_poverty_app_download_guide") as s:
+        ready = await _guide_ready("app_download")
+        s.set_attribute("cache_hit", ready)
+        if not ready:
+            async with _limit('extract_app_guide'):
+                if not await _guide_ready("app_download"):
+                    extracted = await _run_extraction(tools._extract_app_guide)
+                    if extracted.get("status") != "success":
+                        return extracted
+        async with _limit('get_poverty_app_download_guide'):
+            return await _run_in(_io_executor, tools._read_app_guide)
+
+
+async def find_guides_for_status(status_message: str) -> dict:
+    """
+    Find the guides that best match a device statusMessage (ranked shortlist with scores).
+    Use the top guide_id with get_guide to show the fix.
+    """
+    # Lần tra đầu có thể phải nạp/build index từ đĩa
+    return await _run_in(_io_executor, tools.find_guides_for_status, status_message)
+
+
+async def get_guide(guide_id: str = "") -> dict:
+    """
+    Get any registered troubleshooting guide (network, app crash, permissions, location...) by guide_id.
+    Call with an empty guide_id to list available guides (guide_id, title, keywords).
+    """
+    guide_id = (guide_id or "").strip()
+    with span("tool.get_guide", guide_id=guide_id) as s:
+        catalog = await _run_in(_io_executor, tools._guide_catalog_response, guide_id)
+        if catalog is not None:
+            return catalog
+        ready = await _guide_ready(guide_id)
+        s.set_attribute("cache_hit", ready)
+        if not ready:
+            async with _limit('extract_guide'):
+                if not await _guide_ready(guide_id):
+                    extracted = await _run_extraction(tools._extract_guide, guide_id)
+                    if extracted.get("status") != "success":
+                        return extracted
+        async with _limit('get_guide'):
+            return await _run_in(_io_executor, tools._read_guide, guide_id)
@@ -0,0 +1,316 @@
+"""
+Batch extraction cho cả thư mục tài liệu hướng dẫn (DOCX/PDF):
+1. Nhận một thư mục hoặc glob pattern, ví dụ: manuals/ hoặc "manuals/*.docx"
+2. Trích xuất song song với số worker giới hạn (--workers)
+3. Bỏ qua file không thay đổi kể từ lần chạy trước (dựa vào manifest + sha256)
+4. In summary dạng JSON ra stdout (thời gian, số ảnh, lỗi cho từng file)
+
+Usage:
+    python batch_extract.py manuals/ --out build/ --workers 4
+    python batch_extract.py "manuals/**/*.pdf" --force --summary summary.json
+    python batch_extract.py manuals/ --force --profile --profile-dir profiles/
+"""
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import logging
+import argparse
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import profiling
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SUPPORTED_EXTENSIONS = ('.docx', '.pdf')
+MANIFEST_NAME = ".batch_manifest.json"
+# Tăng khi logic trích xuất thay đổi để các file cũ được trích xuất lại
+EXTRACTOR_VERSION = 3
+
+
+def find_source_files(target: str, recursive: bool = False) -> list:
+    """Trả về danh sách file DOCX/PDF (đã sort) từ thư mục hoặc glob pattern."""
+    if os.path.isdir(target):
+        pattern = os.path.join(target, "**", "*") if recursive else os.path.join(target, "*")
+        candidates = glob.glob(pattern, recursive=recursive)
+    else:
+        candidates = glob.glob(target, recursive=True)
+
+    files = []
+    for path in candidates:
+        name = os.path.basename(path)
+        # Bỏ qua file lock của Word (~$abc.docx)
+        if name.startswith("~$") or not os.path.isfile(path):
+            continue
+        if name.lower().endswith(SUPPORTED_EXTENSIONS):
+            files.append(os.path.abspath(path))
+    return sorted(set(files))
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def output_paths(source: str, out_dir: str) -> tuple:
+    """(json_path, images_dir) cho một file nguồn."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return (
+        os.path.join(out_dir, f"{stem.lower()}.json"),
+        os.path.join(out_dir, f"{stem}_images"),
+    )
+
+
+def find_collisions(sources: list) -> dict:
+    """source -> các source khác ghi cùng JSON/thư mục ảnh (x.docx và x.pdf, a/x.docx và b/x.docx)."""
+    groups = {}
+    for source in sources:
+        # output_paths chỉ dùng stem (JSON viết thường): so sánh không phân biệt hoa thường
+        stem = os.path.splitext(os.path.basename(source))[0].lower()
+        groups.setdefault(stem, []).append(source)
+    return {
+        source: [other for other in group if other != source]
+        for group in groups.values() if len(group) > 1
+        for source in group
+    }
+
+
+def load_manifest(out_dir: str) -> dict:
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return {}
+
+
+def save_manifest(out_dir: str, manifest: dict):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def is_unchanged(source: str, out_dir: str, entry: dict) -> bool:
+    """So sánh với manifest: stat trước (rẻ), sha256 khi stat khác."""
+    if not entry or entry.get("extractor_version") != EXTRACTOR_VERSION:
+        return False
+    json_path, _ = output_paths(source, out_dir)
+    if not os.path.exists(json_path):
+        return False
+    st = os.stat(source)
+    if entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+        return True
+    return entry.get("sha256") == file_sha256(source)
+
+
+@profiling.profiled("extract_pdf_sequential")
+def extract_pdf_sequential(pdf_path, output_folder, folder_type_label):
+    """
+    Tương tự extract_docx_data.extract_content_sequential nhưng cho PDF:
+    text và ảnh được sắp theo vị trí trên trang, text phía trên ảnh được gán cho ảnh đó.
+    """
+    import pdfplumber
+    from image_variants import generate_variants, save_image
+
+    os.makedirs(output_folder, exist_ok=True)
+    results = []
+    current_step = 1
+    current_text_buffer = []
+    image_counter = 1
+
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            blocks = [(line['top'], 'text', line['text']) for line in page.extract_text_lines()]
+            blocks += [(img['top'], 'image', img) for img in page.images]
+            blocks.sort(key=lambda b: b[0])
+
+            for _, kind, payload in blocks:
+                if kind == 'text':
+                    text = payload.strip()
+                    step_match = re.search(r'^(?:Bước|Step)\s*(\d+)', text, re.IGNORECASE)
+                    if step_match:
+                        current_step = int(step_match.group(1))
+                    if text:
+                        current_text_buffer.append(text)
+                    continue
+
+                bbox = (payload['x0'], payload['top'], payload['x1'], payload['bottom'])
+                try:
+                    image = page.within_bbox(bbox).to_image().original
+                except Exception as e:
+                    logging.error(f"Error rendering image on page {page.page_number}: {e}")
+                    continue
+                image_path = os.path.join(output_folder, f"image_{image_counter}.jpg")
+                save_image(image.convert('RGB'), image_path, "JPEG", quality=85)
+                generate_variants(image_path)
+                image_counter += 1
+                results.append({
+                    "step_number": current_step,
+                    "text": "\n".join(current_text_buffer).strip(),
+                    "image_path": image_path,
+                    "folder_type": folder_type_label
+                })
+                current_text_buffer = []
+
+    if current_text_buffer:
+        full_text = "\n".join(current_text_buffer).strip()
+        if full_text:
+            results.append({
+                "step_number": current_step,
+                "text": full_text,
+                "image_path": "",
+                "folder_type": folder_type_label
+            })
+    return results
+
+
+def extract_one(source: str, out_dir: str, folder_type_label: str = None) -> dict:
+    """Trích xuất một file; luôn trả về record (không raise) để summary đầy đủ."""
+    started = time.perf_counter()
+    json_path, images_dir = output_paths(source, out_dir)
+    label = folder_type_label or os.path.splitext(os.path.basename(source))[0].upper()
+    record = {"source": source, "json_path": json_path, "images_dir": images_dir}
+    try:
+        if source.lower().endswith('.docx'):
+            from extract_docx_data import extract_content_sequential
+            data = extract_content_sequential(source, images_dir, label)
+        else:
+            data = extract_pdf_sequential(source, images_dir, label)
+
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, json_path)
+
+        record.update({
+            "status": "extracted",
+            "steps": len(data),
+            "images": sum(1 for step in data if step.get("image_path")),
+        })
+    except Exception as e:
+        logging.error(f"Failed to extract {source}: {e}")
+        record.update({"status": "failed", "error": f"{type(e).__name__}: {e}"})
+    record["seconds"] = round(time.perf_counter() - started, 4)
+    return record
+
+
+def run_batch(target: str, out_dir: str, workers: int = None, force: bool = False,
+              recursive: bool = False, folder_type_label: str = None) -> dict:
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    sources = find_source_files(target, recursive=recursive)
+    manifest = load_manifest(out_dir)
+    workers = max(1, workers or min(4, os.cpu_count() or 1))
+
+    records = []
+    pending = []
+    # Hai file cùng output sẽ ghi đè nhau từ hai worker: báo lỗi trước khi submit, không trích xuất
+    collisions = find_collisions(sources)
+    for source in sources:
+        if source in collisions:
+            logging.error(f"Output name collision: {source} and {', '.join(collisions[source])}")
+            json_path, images_dir = output_paths(source, out_dir)
+            records.append({
+                "source": source,
+                "status": "failed",
+                "json_path": json_path,
+                "images_dir": images_dir,
+                "error": f"Output name collides with {', '.join(collisions[source])}; rename one of the files",
+                "seconds": 0.0,
+            })
+            continue
+        entry = manifest.get(source)
+        if not force and is_unchanged(source, out_dir, entry):
+            records.append({
+                "source": source,
+                "status": "skipped",
+                "json_path": entry.get("json_path"),
+                "images": entry.get("images", 0),
+                "steps": entry.get("steps", 0),
+                "seconds": 0.0,
+            })
+        else:
+            pending.append(source)
+
+    if pending:
+        logging.info(f"Extracting {len(pending)} file(s) with {workers} worker(s)...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(extract_one, src, out_dir, folder_type_label): src for src in pending}
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except BrokenProcessPool as e:
+                    # Worker bị kill (OOM, crash trong thư viện native): các file còn lại cũng fail
+                    source = futures[future]
+                    logging.error(f"Worker process died while extracting {source}: {e}")
+                    record = {"source": source, "status": "failed",
+                              "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+                records.append(record)
+                if record["status"] == "extracted":
+                    st = os.stat(record["source"])
+                    manifest[record["source"]] = {
+                        "sha256": file_sha256(record["source"]),
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "json_path": record["json_path"],
+                        "images": record["images"],
+                        "steps": record["steps"],
+                        "extractor_version": EXTRACTOR_VERSION,
+                    }
+        save_manifest(out_dir, manifest)
+
+    records.sort(key=lambda r: r["source"])
+    counts = {"extracted": 0, "skipped": 0, "failed": 0}
+    for record in records:
+        counts[record["status"]] += 1
+    return {
+        "target": target,
+        "out_dir": os.path.abspath(out_dir),
+        "workers": workers,
+        "total_seconds": round(time.perf_counter() - started, 4),
+        "counts": counts,
+        "files": records,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch extract DOCX/PDF instruction manuals.")
+    parser.add_argument("target", help="Thư mục hoặc glob pattern (ví dụ: 'manuals/*.docx')")
+    parser.add_argument("--out", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="Thư mục output (mặc định: thư mục của agent)")
+    parser.add_argument("--workers", type=int, default=None, help="Số worker tối đa")
+    parser.add_argument("--force", action="store_true", help="Trích xuất lại kể cả khi file không đổi")
+    parser.add_argument("--recursive", action="store_true", help="Duyệt cả thư mục con")
+    parser.add_argument("--label", default=None, help="folder_type cho các step (mặc định: tên file)")
+    parser.add_argument("--summary", default=None, help="Ghi summary JSON ra file thay vì chỉ stdout")
+    parser.add_argument("--profile", nargs="?", const="cpu,mem", default=None,
+                        help="Profile từng file trích xuất: cpu, mem hoặc cpu,mem (mặc định)")
+    parser.add_argument("--profile-dir", default=None, help="Thư mục ghi profile (mặc định PROFILE_DIR)")
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiling.enable(args.profile, args.profile_dir)
+
+    summary = run_batch(args.target, args.out, workers=args.workers, force=args.force,
+                        recursive=args.recursive, folder_type_label=args.label)
+    output = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+    return 1 if summary["counts"]["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Helpers dùng chung cho các script benchmark.
+
+Các module của agent dùng relative import (from .db import ...), nên cần được import
+như submodule của một package. import_package_module() đăng ký thư mục agent dưới tên
+package cố định mà không chạy __init__.py (tránh import google.adk khi chỉ benchmark tools).
+"""
+import os
+import sys
+import json
+import time
+import types
+import importlib
+import subprocess
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "guide_agent"
+# ARTIFACT_DIR của agent khi benchmark: case cold xoá JSON/ảnh đã trích xuất rồi trích xuất lại,
+# nên không bao giờ chạy trên thư mục agent hay ARTIFACT_DIR thật
+SCRATCH_ARTIFACT_DIR = os.path.join(PACKAGE_DIR, "benchmarks", "fixtures", "artifacts")
+
+
+def import_package_module(name: str):
+    """import_package_module("tools") -> module tools.py của agent (ARTIFACT_DIR = SCRATCH_ARTIFACT_DIR)."""
+    if PACKAGE_NAME not in sys.modules:
+        # Phải đặt trước khi artifacts.py được import: config đọc env lúc import
+        os.makedirs(SCRATCH_ARTIFACT_DIR, exist_ok=True)
+        os.environ['ARTIFACT_DIR'] = SCRATCH_ARTIFACT_DIR
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Percentile theo nearest-rank trên list đã sort."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def latency_summary(latencies) -> dict:
+    """Thống kê latency (giây) -> dict ms."""
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 3),
+        "p50_ms": round(1000 * percentile(values, 50), 3),
+        "p95_ms": round(1000 * percentile(values, 95), 3),
+        "p99_ms": round(1000 * percentile(values, 99), 3),
+        "max_ms": round(1000 * values[-1], 3),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PACKAGE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(results: dict, path: str = None) -> str:
+    """Ghi kết quả JSON (mặc định benchmarks/results/<name>-<commit>.json)."""
+    results.setdefault("commit", git_revision())
+    results.setdefault("timestamp", time.strftime("%Y-%m-%dT%H:%M:%S"))
+    if path is None:
+        results_dir = os.path.join(PACKAGE_DIR, "benchmarks", "results")
+        os.makedirs(results_dir, exist_ok=True)
+        path = os.path.join(results_dir, f"{results.get('name', 'bench')}-{results['commit']}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
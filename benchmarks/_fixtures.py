@@ -0,0 +1,120 @@
+"""
+Fixture cho benchmark: DB thiết bị giả (sqlite) và tài liệu DOCX hướng dẫn giả.
+
+FakeDeviceDB thay tools.get_connection bằng kết nối sqlite3 cùng schema cột mà
+query_DeviceInfo đọc (UserID, DeviceName, StatusMessage, ...). sqlite3 và pyodbc đều
+dùng placeholder "?", nên câu SQL của tool chạy nguyên vẹn.
+"""
+import os
+import io
+import random
+import sqlite3
+import contextlib
+
+from _common import PACKAGE_DIR, SCRATCH_ARTIFACT_DIR
+
+FIXTURE_ROOT = os.path.join(PACKAGE_DIR, "benchmarks", "fixtures")
+
+DEVICE_NAMES = (
+    "iPhone 12", "iPhone 13 Pro", "iPhone SE", "iPad Air",
+    "Samsung Galaxy A52", "Samsung Galaxy S21", "OPPO A57", "Xiaomi Redmi Note 11", "Vivo Y21",
+)
+STATUS_MESSAGES = (
+    "Không lấy được vị trí", "GPS bị tắt", "Chưa cấp quyền vị trí cho ứng dụng",
+    "Chưa cài ứng dụng Hộ Nghèo", "Lỗi mạng", "OK",
+)
+
+
+def fixture_path(*parts) -> str:
+    path = os.path.join(FIXTURE_ROOT, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def user_id(index: int) -> str:
+    return f"user{index:06d}"
+
+
+class FakeDeviceDB:
+    """Bảng thiết bị trong file sqlite; connect() thay cho db.get_connection()."""
+
+    def __init__(self, path: str = None, users: int = 10000, table: str = "DeviceInfo", seed: int = 7):
+        self.path = path or fixture_path("devices.sqlite")
+        self.users = users
+        self.table = table
+        self._build(seed)
+
+    def _build(self, seed: int):
+        conn = sqlite3.connect(self.path)
+        try:
+            existing = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name=?", (self.table,)
+            ).fetchone()
+            if existing and conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] == self.users:
+                return
+            rng = random.Random(seed)
+            conn.execute(f"DROP TABLE IF EXISTS {self.table}")
+            conn.execute(
+                f"CREATE TABLE {self.table} (UserID TEXT, DeviceName TEXT, DeviceModel TEXT, "
+                "OSVersion TEXT, StatusMessage TEXT, LastUpdated TEXT)"
+            )
+            rows = []
+            for i in range(self.users):
+                name = rng.choice(DEVICE_NAMES)
+                rows.append((
+                    user_id(i), name, name.split()[-1], f"{rng.randint(9, 17)}.{rng.randint(0, 6)}",
+                    rng.choice(STATUS_MESSAGES), f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                ))
+            conn.executemany(f"INSERT INTO {self.table} VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute(f"CREATE INDEX idx_{self.table}_user ON {self.table}(UserID)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    @contextlib.contextmanager
+    def installed(self, tools_module):
+        """Trong khối with, tools.query_DeviceInfo đọc từ DB giả."""
+        saved = tools_module.get_connection, tools_module.config.get('TABLE')
+        tools_module.get_connection = self.connect
+        tools_module.config['TABLE'] = self.table
+        try:
+            yield self
+        finally:
+            tools_module.get_connection, tools_module.config['TABLE'] = saved
+
+
+def make_guide_docx(path: str, steps: int = 8, image_size=(1080, 1920), title: str = "Hướng dẫn") -> str:
+    """DOCX dạng tài liệu hướng dẫn: đoạn 'Bước N: ...' kèm một ảnh chụp màn hình mỗi bước."""
+    from docx import Document
+    from docx.shared import Inches
+    from PIL import Image
+
+    if os.path.exists(path):
+        return path
+    document = Document()
+    document.add_heading(title, level=1)
+    for step in range(1, steps + 1):
+        document.add_paragraph(f"Bước {step}: Mở Cài đặt và chọn mục số {step} để tiếp tục.")
+        buffer = io.BytesIO()
+        Image.new('RGB', image_size, (40 * step % 255, 140, 90)).save(buffer, "PNG")
+        buffer.seek(0)
+        document.add_picture(buffer, width=Inches(2))
+    document.save(path)
+    return path
+
+
+def app_guide_fixture_paths() -> tuple:
+    """Thay cho tools._app_guide_paths(): (json_path, docx_path, images_dir) trong fixtures.
+
+    JSON và ảnh nằm trong SCRATCH_ARTIFACT_DIR theo đúng layout của tools._app_guide_paths()
+    để image server phục vụ được URL của ảnh; chỉ DOCX nguồn là tài liệu giả.
+    """
+    os.makedirs(SCRATCH_ARTIFACT_DIR, exist_ok=True)
+    return (
+        os.path.join(SCRATCH_ARTIFACT_DIR, "help_rasoathongheo_ai.json"),
+        make_guide_docx(fixture_path("docs", "guide.docx")),
+        os.path.join(SCRATCH_ARTIFACT_DIR, "extracted_images"),
+    )
@@ -0,0 +1,181 @@
+"""
+Benchmark concurrency của image server: chế độ "single" (TCPServer cũ) so với "threaded".
+
+Mỗi client mô phỏng một trang hướng dẫn tải --images-per-page ảnh, lặp --pages lần.
+Kịch bản "slow client" mở thêm một connection gửi request rất chậm để đo mức độ
+một client chậm chặn các client khác. Kịch bản "idle keep-alive" mở trước
+--idle-connections connection (mặc định IMAGE_SERVER_WORKERS + 4), mỗi connection tải một
+ảnh rồi để rảnh như tab browser còn mở, sau đó mới đo các client thường.
+
+Usage:
+    python benchmarks/bench_image_server.py --clients 8 --pages 20
+    python benchmarks/bench_image_server.py --modes threaded --slow-client --output out.json
+    python benchmarks/bench_image_server.py --modes threaded --idle-connections 32
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import http.client
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import SCRATCH_ARTIFACT_DIR, import_package_module, latency_summary, write_results
+
+# Image server phục vụ từ ARTIFACT_DIR = SCRATCH_ARTIFACT_DIR (xem import_package_module)
+FIXTURE_DIR = os.path.join(SCRATCH_ARTIFACT_DIR, "bench_images")
+
+
+def ensure_fixture_images(count: int = 8, size=(1080, 1920)) -> list:
+    """Tạo ảnh JPEG giả kích thước màn hình điện thoại, trả về URL path tương đối."""
+    from PIL import Image
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    paths = []
+    for i in range(1, count + 1):
+        path = os.path.join(FIXTURE_DIR, f"bench_{i}.jpg")
+        if not os.path.exists(path):
+            Image.new('RGB', size, (30 * i % 255, 120, 200)).save(path, "JPEG", quality=85)
+        paths.append("/" + os.path.relpath(path, SCRATCH_ARTIFACT_DIR).replace(os.sep, '/'))
+    return paths
+
+
+def _client(port, paths, pages, latencies, errors, barrier):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    barrier.wait()
+    for _ in range(pages):
+        for path in paths:
+            started = time.perf_counter()
+            try:
+                conn.request("GET", path, headers={"Accept": "image/jpeg"})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(type(e).__name__)
+                conn.close()
+                continue
+            latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def _slow_client(port, path, stop_event):
+    """Gửi request từng byte một, mô phỏng client mạng di động rất chậm."""
+    try:
+        sock = socket.create_connection(("127.0.0.1", port), timeout=30)
+    except OSError:
+        return
+    request = f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+    try:
+        for byte in request:
+            if stop_event.is_set():
+                break
+            sock.sendall(bytes([byte]))
+            time.sleep(0.05)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+def _open_idle_connections(port, path, count) -> list:
+    """Connection keep-alive đã tải xong một ảnh và để rảnh (không đóng)."""
+    connections = []
+    for _ in range(count):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        try:
+            conn.request("GET", path, headers={"Accept": "image/jpeg"})
+            conn.getresponse().read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            continue
+        connections.append(conn)
+    return connections
+
+
+def run_scenario(image_server, mode, clients, pages, paths, slow_client=False, idle_connections=0) -> dict:
+    server = image_server.create_image_server(0, mode=mode, host="127.0.0.1")
+    port = server.server_address[1]
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    stop_event = threading.Event()
+    slow_thread = None
+    if slow_client:
+        slow_thread = threading.Thread(target=_slow_client, args=(port, paths[0], stop_event), daemon=True)
+        slow_thread.start()
+        time.sleep(0.1)
+
+    idle = _open_idle_connections(port, paths[0], idle_connections)
+
+    latencies, errors = [], []
+    barrier = threading.Barrier(clients + 1)
+    threads = [
+        threading.Thread(target=_client, args=(port, paths, pages, latencies, errors, barrier))
+        for _ in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    stop_event.set()
+    if slow_thread:
+        slow_thread.join()
+    for conn in idle:
+        conn.close()
+    server.shutdown()
+    server.server_close()
+
+    return {
+        "mode": mode,
+        "clients": clients,
+        "slow_client": slow_client,
+        "idle_connections": len(idle),
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": round(elapsed, 4),
+        "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency": latency_summary(latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Image server concurrency benchmark")
+    parser.add_argument("--modes", default="single,threaded")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--images-per-page", type=int, default=6)
+    parser.add_argument("--slow-client", action="store_true", help="Thêm một client gửi request rất chậm")
+    parser.add_argument("--idle-connections", type=int, default=None,
+                        help="Số connection keep-alive rảnh mở trước (mặc định IMAGE_SERVER_WORKERS + 4, 0 = bỏ qua)")
+    parser.add_argument("--output", default=None, help="File JSON kết quả")
+    args = parser.parse_args(argv)
+
+    image_server = import_package_module("image_server")
+    paths = ensure_fixture_images(args.images_per_page)
+    idle_connections = (image_server.config['WORKERS'] + 4 if args.idle_connections is None
+                        else args.idle_connections)
+
+    scenarios = []
+    for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+        for idle in ([0, idle_connections] if idle_connections else [0]):
+            result = run_scenario(image_server, mode, args.clients, args.pages, paths, args.slow_client, idle)
+            scenarios.append(result)
+            label = f"{mode}+idle{idle}" if idle else mode
+            print(f"{label:>15}: {result['requests_per_second']:>8} req/s  "
+                  f"p50={result['latency'].get('p50_ms')}ms  p99={result['latency'].get('p99_ms')}ms  "
+                  f"errors={result['errors']}", file=sys.stderr)
+
+    path = write_results({"name": "image_server", "scenarios": scenarios}, args.output)
+    print(json.dumps({"results": path, "scenarios": scenarios}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Hit-rate và latency của pre-router (pre_router.py) trên corpus câu có nhãn.
+
+Corpus JSONL, mỗi dòng: {"text": ..., "asked": true|false, "expected": "<username>"|null}
+    asked: lượt trước agent vừa hỏi "Tên đăng nhập của bạn là gì?"
+    expected: username đúng, null nếu pre-router phải để model xử lý
+    may_fallback: câu có username nhưng để model xử lý cũng chấp nhận được (tests/test_pre_router.py)
+
+Báo cáo:
+    hit_rate        routed đúng / số câu có username
+    false_routes    routed sai username hoặc routed câu lẽ ra phải fallback (lỗi đắt nhất)
+    saved_model_seconds   routed đúng x --model-seconds (ước lượng một lượt model)
+
+Usage:
+    python benchmarks/bench_pre_router.py
+    python benchmarks/bench_pre_router.py --min-confidence 0.7 --verbose
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import PACKAGE_DIR, import_package_module, latency_summary, write_results
+
+DEFAULT_CORPUS = os.path.join(PACKAGE_DIR, "benchmarks", "corpus", "pre_router.jsonl")
+
+
+def load_corpus(path: str) -> list:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(pre_router, corpus, min_confidence: float, repeat: int) -> dict:
+    latencies = []
+    outcomes = {"routed_correct": 0, "routed_wrong": 0, "missed": 0, "fallback_correct": 0}
+    by_rule = {}
+    mistakes = []
+    for item in corpus:
+        text, asked, expected = item["text"], bool(item.get("asked")), item.get("expected")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            decision = pre_router.detect_username(text, asked)
+            latencies.append(time.perf_counter() - started)
+        routed = decision.username if decision.confidence >= min_confidence else None
+
+        if routed is not None and routed == expected:
+            outcome = "routed_correct"
+        elif routed is not None:
+            outcome = "routed_wrong"
+        elif expected is not None:
+            outcome = "missed"
+        else:
+            outcome = "fallback_correct"
+        outcomes[outcome] += 1
+        by_rule.setdefault(decision.rule, {}).setdefault(outcome, 0)
+        by_rule[decision.rule][outcome] += 1
+        if outcome in ("routed_wrong", "missed"):
+            mistakes.append({"text": text, "asked": asked, "expected": expected, "decision": decision._asdict()})
+
+    with_username = sum(1 for item in corpus if item.get("expected") is not None)
+    routed = outcomes["routed_correct"] + outcomes["routed_wrong"]
+    return {
+        "utterances": len(corpus),
+        "with_username": with_username,
+        "outcomes": outcomes,
+        "hit_rate": round(outcomes["routed_correct"] / with_username, 4) if with_username else 0.0,
+        "precision": round(outcomes["routed_correct"] / routed, 4) if routed else 0.0,
+        "false_routes": outcomes["routed_wrong"],
+        "by_rule": by_rule,
+        "latency": latency_summary(latencies),
+        "mistakes": mistakes,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-router hit-rate / latency report")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--min-confidence", type=float, default=None,
+                        help="Mặc định lấy PRE_ROUTER_MIN_CONFIDENCE")
+    parser.add_argument("--repeat", type=int, default=200, help="Số lần chạy mỗi câu để đo latency")
+    parser.add_argument("--model-seconds", type=float, default=2.5,
+                        help="Latency ước lượng của một lượt model trích username")
+    parser.add_argument("--verbose", action="store_true", help="In các câu bị route sai / bỏ sót")
+    parser.add_argument("--output", default=None, help="File JSON kết quả")
+    args = parser.parse_args(argv)
+
+    pre_router = import_package_module("pre_router")
+    min_confidence = args.min_confidence if args.min_confidence is not None else pre_router.config['MIN_CONFIDENCE']
+    report = evaluate(pre_router, load_corpus(args.corpus), min_confidence, args.repeat)
+    report["min_confidence"] = min_confidence
+    report["saved_model_seconds"] = round(report["outcomes"]["routed_correct"] * args.model_seconds, 2)
+
+    print(f"hit_rate={report['hit_rate']:.1%}  precision={report['precision']:.1%}  "
+          f"false_routes={report['false_routes']}  p50={report['latency']['p50_ms']}ms  "
+          f"p99={report['latency']['p99_ms']}ms", file=sys.stderr)
+    if args.verbose:
+        for mistake in report["mistakes"]:
+            print(f"  {mistake}", file=sys.stderr)
+
+    path = write_results({"name": "pre_router", "report": report}, args.output)
+    print(json.dumps({"results": path, **{k: v for k, v in report.items() if k != "mistakes"}},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
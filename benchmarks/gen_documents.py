@@ -0,0 +1,327 @@
+"""
+Sinh tài liệu hướng dẫn tổng hợp cỡ lớn để đo các extractor khi tài liệu lớn dần.
+
+PDF (pymupdf): bảng model 3 cột giống Location_Instruction.pdf (ModelCode, ModelName,
+    How_to_Enable_Location, header lặp lại mỗi trang) rồi các đoạn "Bước N" kèm ảnh.
+DOCX (python-docx): hàng nghìn đoạn "Bước N" với ảnh nhiều định dạng (PNG RGB, PNG RGBA,
+    PNG palette, JPEG) và một phần ảnh lặp lại (cùng bytes -> cùng image part).
+
+Usage:
+    python benchmarks/gen_documents.py generate --scales 1,10,100
+    python benchmarks/gen_documents.py measure --scales 1,10,100
+    python benchmarks/gen_documents.py generate --docx-steps 5000 --pdf-models 2000 --out /tmp/docs
+
+measure chạy từng extractor trên từng file trong một process con riêng (peak RSS sạch),
+ghi thời gian, peak RSS, peak tracemalloc và số step/ảnh vào benchmarks/results/scaling-<commit>.json.
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import PACKAGE_DIR, import_package_module, write_results
+from _fixtures import FIXTURE_ROOT
+
+DEFAULT_OUT = os.path.join(FIXTURE_ROOT, "scale")
+# Kích thước ở scale 1, xấp xỉ tài liệu thật của repo
+BASE_PDF_MODELS = 40
+BASE_PDF_IMAGES = 8
+BASE_DOCX_STEPS = 30
+
+IMAGE_SIZE = (540, 960)
+IMAGE_MODES = ("png_rgb", "png_rgba", "png_palette", "jpeg")
+
+PDF_FONT_CANDIDATES = (
+    os.getenv("GEN_PDF_FONT", ""),
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+)
+
+IOS_PATH = "Cài đặt > Quyền riêng tư & Bảo mật > Dịch vụ định vị > Bật Dịch vụ định vị > HỘ NGHÈO > Khi dùng ứng dụng"
+ANDROID_PATH = "Cài đặt > Vị trí > Bật Sử dụng vị trí > Quyền ứng dụng > HỘ NGHÈO > Cho phép"
+STEP_TEXTS = (
+    "Mở ứng dụng Cài đặt trên điện thoại.",
+    "Chọn mục Quyền riêng tư & Bảo mật.",
+    "Chọn Dịch vụ định vị và bật công tắc.",
+    "Tìm ứng dụng HỘ NGHÈO trong danh sách.",
+    "Chọn Khi dùng ứng dụng rồi quay lại màn hình chính.",
+)
+
+
+def _screenshot(rng: random.Random, mode: str, size=IMAGE_SIZE) -> bytes:
+    """Ảnh giả 'chụp màn hình' có nhiễu để dung lượng nén gần ảnh thật."""
+    from PIL import Image, ImageDraw
+
+    # Nhiễu ở 1/4 độ phân giải rồi phóng to: dung lượng nén gần ảnh chụp màn hình thật
+    noise = Image.effect_noise((size[0] // 4, size[1] // 4), rng.randint(20, 60))
+    base = noise.resize(size, Image.Resampling.NEAREST).convert("RGB")
+    draw = ImageDraw.Draw(base)
+    for _ in range(6):
+        x0, y0 = rng.randrange(size[0] - 60), rng.randrange(size[1] - 40)
+        draw.rectangle((x0, y0, x0 + rng.randint(40, 300), y0 + rng.randint(20, 80)),
+                       fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buffer = io.BytesIO()
+    if mode == "png_rgba":
+        rgba = base.convert("RGBA")
+        rgba.putalpha(Image.linear_gradient("L").resize(size))
+        rgba.save(buffer, "PNG")
+    elif mode == "png_palette":
+        base.convert("P", palette=Image.Palette.ADAPTIVE, colors=64).save(buffer, "PNG")
+    elif mode == "jpeg":
+        base.save(buffer, "JPEG", quality=85)
+    else:
+        base.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class ImagePool:
+    """Sinh ảnh mới hoặc lặp lại một ảnh đã sinh theo repeat_ratio."""
+
+    def __init__(self, rng: random.Random, repeat_ratio: float, modes=IMAGE_MODES):
+        self.rng = rng
+        self.repeat_ratio = repeat_ratio
+        self.modes = modes
+        self.generated = []
+
+    def next(self) -> bytes:
+        if self.generated and self.rng.random() < self.repeat_ratio:
+            return self.rng.choice(self.generated)
+        data = _screenshot(self.rng, self.modes[len(self.generated) % len(self.modes)])
+        self.generated.append(data)
+        return data
+
+
+def _pdf_font():
+    for path in PDF_FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def _fold(text: str) -> str:
+    import unicodedata
+    text = text.replace("đ", "d").replace("Đ", "D")
+    return "".join(c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c))
+
+
+def generate_pdf(path: str, models: int, images: int, repeat_ratio: float = 0.3, seed: int = 1) -> dict:
+    """Bảng `models` dòng (iPhone trước, Android sau) + `images` bước có ảnh."""
+    import pymupdf
+
+    rng = random.Random(seed)
+    pool = ImagePool(rng, repeat_ratio, modes=("png_rgb", "jpeg"))
+    font_path = _pdf_font()
+    # Font base-14 không có glyph tiếng Việt: không tìm được TTF thì ghi text không dấu
+    text_of = (lambda t: t) if font_path else _fold
+
+    doc = pymupdf.open()
+    width, height, margin = 595, 842, 36
+    columns = (("ModelCode", 90), ("ModelName", 140), ("How_to_Enable_Location", width - 2 * margin - 230))
+    row_height, font_size = 30, 7
+
+    def new_page():
+        page = doc.new_page(width=width, height=height)
+        if font_path:
+            page.insert_font(fontname="vn", fontfile=font_path)
+        return page
+
+    def draw_row(page, y, cells):
+        x = margin
+        for (_, col_width), cell in zip(columns, cells):
+            rect = pymupdf.Rect(x, y, x + col_width, y + row_height)
+            page.draw_rect(rect, color=(0, 0, 0), width=0.5)
+            page.insert_textbox(rect + (2, 2, -2, -2), text_of(cell), fontsize=font_size,
+                                fontname="vn" if font_path else "helv")
+            x += col_width
+
+    rows = []
+    ios_count = max(1, models // 3)
+    for i in range(models):
+        if i < ios_count:
+            rows.append((f"iPhone{12 + i % 4},{i % 8}", f"iPhone {12 + i % 4} ({i})", IOS_PATH))
+        else:
+            rows.append((f"SM-A{100 + i}", f"Samsung Galaxy A{i % 90} ({i})", ANDROID_PATH))
+
+    page, y = None, height
+    for row in rows:
+        if y + row_height > height - margin:
+            page, y = new_page(), margin
+            draw_row(page, y, [name for name, _ in columns])
+            y += row_height
+        draw_row(page, y, row)
+        y += row_height
+
+    image_height = 220
+    page, y = new_page(), margin
+    for step in range(1, images + 1):
+        if y + image_height + 30 > height - margin:
+            page, y = new_page(), margin
+        page.insert_text((margin, y + 12), text_of(f"Bước {step}: {STEP_TEXTS[(step - 1) % len(STEP_TEXTS)]}"),
+                         fontsize=10, fontname="vn" if font_path else "helv")
+        rect = pymupdf.Rect(margin, y + 20, margin + image_height * IMAGE_SIZE[0] / IMAGE_SIZE[1], y + 20 + image_height)
+        page.insert_image(rect, stream=pool.next())
+        y += image_height + 30
+
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return {"path": path, "models": models, "images": images, "unique_images": len(pool.generated),
+            "bytes": os.path.getsize(path)}
+
+
+def generate_docx(path: str, steps: int, image_every: int = 1, repeat_ratio: float = 0.3, seed: int = 2) -> dict:
+    """`steps` đoạn "Bước N: ..." , mỗi `image_every` bước một ảnh định dạng xoay vòng."""
+    from docx import Document
+    from docx.shared import Inches
+
+    rng = random.Random(seed)
+    pool = ImagePool(rng, repeat_ratio)
+    document = Document()
+    document.add_heading("Hướng dẫn xử lý sự cố", level=1)
+    images = 0
+    for step in range(1, steps + 1):
+        document.add_paragraph(f"Bước {step}: {STEP_TEXTS[(step - 1) % len(STEP_TEXTS)]}")
+        if step % image_every == 0:
+            document.add_picture(io.BytesIO(pool.next()), width=Inches(2))
+            images += 1
+    document.save(path)
+    return {"path": path, "steps": steps, "images": images, "unique_images": len(pool.generated),
+            "bytes": os.path.getsize(path)}
+
+
+def generate(out_dir: str, scales, repeat_ratio: float, pdf_models=None, docx_steps=None) -> list:
+    os.makedirs(out_dir, exist_ok=True)
+    documents = []
+    for scale in scales:
+        models = pdf_models or BASE_PDF_MODELS * scale
+        steps = docx_steps or BASE_DOCX_STEPS * scale
+        pdf_path = os.path.join(out_dir, f"location_x{scale}.pdf")
+        docx_path = os.path.join(out_dir, f"guide_x{scale}.docx")
+        for kind, target, make in (
+            ("pdf", pdf_path, lambda: generate_pdf(pdf_path, models, BASE_PDF_IMAGES * scale, repeat_ratio)),
+            ("docx", docx_path, lambda: generate_docx(docx_path, steps, repeat_ratio=repeat_ratio)),
+        ):
+            started = time.perf_counter()
+            info = make()
+            info.update({"kind": kind, "scale": scale, "generate_seconds": round(time.perf_counter() - started, 2)})
+            print(f"{os.path.basename(target):<24} {info['bytes'] / 1e6:>8.1f} MB  "
+                  f"{info['generate_seconds']}s", file=sys.stderr)
+            documents.append(info)
+    return documents
+
+
+# --- measure: chạy extractor trong process con ---
+
+EXTRACTORS = {
+    "docx": ("extract_docx_data.extract_content_sequential", "tools._extract_docx_data"),
+    "pdf": ("batch_extract.extract_pdf_sequential", "pdf_tables"),
+}
+
+
+def _pdf_tables(pdf_path):
+    """Phần đọc bảng của tools.process_pdf_files (process_pdf_files đọc đường dẫn cố định)."""
+    import pdfplumber
+    rows = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            for table in page.extract_tables():
+                rows.extend(table[1:])
+    return rows
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 1e6 if sys.platform == "darwin" else rss / 1e3, 1)
+
+
+def _run_extractor(name: str, source: str, out_dir: str) -> dict:
+    import tracemalloc
+
+    sys.path.insert(0, PACKAGE_DIR)
+    if name == "pdf_tables":
+        fn = _pdf_tables
+        call = lambda: fn(source)
+    elif name.startswith("tools."):
+        fn = getattr(import_package_module("tools"), name.split(".", 1)[1])
+        call = lambda: fn(source, out_dir, "SCALE")
+    else:
+        module, attr = name.rsplit(".", 1)
+        fn = getattr(__import__(module), attr)
+        call = lambda: fn(source, out_dir, "SCALE")
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = call()
+    seconds = time.perf_counter() - started
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+        "tracemalloc_peak_mb": round(traced_peak / 1e6, 1),
+        "records": len(result),
+        "images": sum(1 for r in result if isinstance(r, dict) and r.get("image_path")),
+    }
+
+
+def measure(out_dir: str, documents: list, timeout: float) -> list:
+    rows = []
+    for doc in documents:
+        for extractor in EXTRACTORS[doc["kind"]]:
+            extract_out = os.path.join(out_dir, "extracted", f"{os.path.basename(doc['path'])}.{extractor}")
+            command = [sys.executable, os.path.abspath(__file__), "_run", extractor, doc["path"], extract_out]
+            try:
+                proc = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+                result = json.loads(proc.stdout.strip().splitlines()[-1]) if proc.returncode == 0 else {
+                    "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+            except subprocess.TimeoutExpired:
+                result = {"error": f"timeout after {timeout}s"}
+            row = {"extractor": extractor, "kind": doc["kind"], "scale": doc["scale"],
+                   "document_mb": round(doc["bytes"] / 1e6, 2), **result}
+            print(f"{extractor:<48} x{doc['scale']:<5} {result.get('seconds', '-'):>8}s  "
+                  f"rss={result.get('peak_rss_mb', '-')}MB  {result.get('error', '')}", file=sys.stderr)
+            rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "_run":
+        print(json.dumps(_run_extractor(*argv[1:4])))
+        return
+
+    parser = argparse.ArgumentParser(description="Synthetic large-document generator for scaling tests")
+    parser.add_argument("command", choices=("generate", "measure"))
+    parser.add_argument("--scales", default="1,10", help="Hệ số kích thước so với tài liệu thật, ví dụ 1,10,100")
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="Tỉ lệ ảnh lặp lại")
+    parser.add_argument("--pdf-models", type=int, default=None, help="Ghi đè số dòng bảng PDF")
+    parser.add_argument("--docx-steps", type=int, default=None, help="Ghi đè số bước DOCX")
+    parser.add_argument("--timeout", type=float, default=1800, help="Timeout mỗi lần đo (giây)")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    documents = generate(args.out, scales, args.repeat_ratio, args.pdf_models, args.docx_steps)
+    if args.command == "generate":
+        print(json.dumps(documents, ensure_ascii=False, indent=2))
+        return
+    rows = measure(args.out, documents, args.timeout)
+    path = write_results({"name": "scaling", "documents": documents, "measurements": rows}, args.output)
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
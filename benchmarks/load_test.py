@@ -0,0 +1,348 @@
+"""
+Load harness: mô phỏng N phiên chat đồng thời gọi tool thật (async_tools) trên DB giả,
+rồi tải ảnh từ URL trả về qua image server - không gọi LLM.
+
+Mỗi phiên đi qua các stage:
+    db           query_DeviceInfo(userid)
+    guide_load   đọc guide định vị (hoặc guide tải app Hộ Nghèo, theo --app-guide-ratio)
+    render       dựng câu trả lời từ kết quả tool qua render fast path (thay lượt LLM)
+    image_fetch  GET toàn bộ image URL trong kết quả trên connection keep-alive của thread
+                 fetch (giữ mở giữa các phiên như trình duyệt, không mở lại mỗi phiên)
+
+Phiên đến theo quá trình Poisson với --rate phiên/giây (open loop). --ramp chạy lần lượt
+nhiều mức rate để tìm điểm bão hoà của một process agent: mức đầu tiên mà throughput
+đạt được < 90% số phiên thực tế đến hoặc p99 phiên vượt --slo-ms.
+
+Artifact (JSON guide, ảnh) được build ngay trong process trước warm-up. Warm-up lỗi, hoặc
+một mức rate mà mọi phiên đều lỗi, là lỗi của harness: dừng và exit 1 thay vì báo bão hoà.
+
+User ID: --users-dist uniform | zipf:<s> | hot:<tỉ lệ traffic>:<số user nóng>
+
+Usage:
+    python benchmarks/load_test.py --rate 20 --duration 30
+    python benchmarks/load_test.py --ramp 10,20,40,80,160 --duration 15 --users-dist zipf:1.1
+    python benchmarks/load_test.py --rate 50 --db-latency-ms 15 --app-guide-ratio 0.2
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import bisect
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import import_package_module, latency_summary, write_results
+from _fixtures import FakeDeviceDB, app_guide_fixture_paths, user_id
+
+STAGES = ("db", "guide_load", "render", "image_fetch", "session")
+
+
+class UserSampler:
+    """Sinh user ID theo phân phối cấu hình."""
+
+    def __init__(self, spec: str, users: int, seed: int = 3):
+        self.users = users
+        self.rng = random.Random(seed)
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        if kind == "zipf":
+            s = float(params or 1.0)
+            weights = [1.0 / (rank ** s) for rank in range(1, users + 1)]
+            total = sum(weights)
+            self.cumulative, running = [], 0.0
+            for w in weights:
+                running += w / total
+                self.cumulative.append(running)
+        elif kind == "hot":
+            share, _, hot_users = params.partition(":")
+            self.hot_share, self.hot_users = float(share or 0.8), int(hot_users or 100)
+        elif kind != "uniform":
+            raise ValueError(f"Unknown --users-dist {spec!r}")
+
+    def sample(self) -> str:
+        if self.kind == "zipf":
+            index = bisect.bisect_left(self.cumulative, self.rng.random())
+        elif self.kind == "hot" and self.rng.random() < self.hot_share:
+            index = self.rng.randrange(min(self.hot_users, self.users))
+        else:
+            index = self.rng.randrange(self.users)
+        return user_id(min(index, self.users - 1))
+
+
+class SlowDB(FakeDeviceDB):
+    """DB giả có thêm độ trễ mạng mỗi lần kết nối."""
+
+    def __init__(self, latency: float, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    def connect(self):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().connect()
+
+
+class HarnessError(RuntimeError):
+    """Harness không đo được gì (warm-up lỗi / mọi phiên lỗi): kết quả không có nghĩa."""
+
+
+class ImageFetcher:
+    """GET ảnh trên connection keep-alive riêng của mỗi thread, giữ mở giữa các phiên."""
+
+    def __init__(self, timeout: float = 30.0):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connection(self, host: str, port: int) -> http.client.HTTPConnection:
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get((host, port))
+        if conn is None:
+            conn = connections[(host, port)] = http.client.HTTPConnection(host, port, timeout=self.timeout)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _get(self, parts, path: str):
+        conn = self._connection(parts.hostname, parts.port)
+        try:
+            conn.request("GET", path, headers={"Accept": "image/webp,image/*"})
+            response = conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            # Server đóng connection rảnh (keep-alive timeout): lần sau mở lại
+            conn.close()
+            raise
+
+    def fetch(self, urls: list) -> int:
+        """GET tuần tự như trình duyệt; trả về số byte."""
+        total = 0
+        for url in urls:
+            parts = urlsplit(url)
+            path = parts.path + (f"?{parts.query}" if parts.query else "")
+            try:
+                status, body = self._get(parts, path)
+            except ConnectionError:
+                # Connection keep-alive bị server đóng giữa hai phiên: thử lại trên connection mới
+                status, body = self._get(parts, path)
+            total += len(body)
+            if status != 200:
+                raise RuntimeError(f"GET {path} -> {status}")
+        return total
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def _image_urls(result: dict) -> list:
+    if "images" in result:
+        return [image["url"] for image in result.get("images", []) if image.get("url")]
+    return [step["image_url"] for step in result.get("steps", []) if step.get("image_url")]
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.tools = import_package_module("tools")
+        self.async_tools = import_package_module("async_tools")
+        self.fast_path = import_package_module("fast_path")
+        self.db = SlowDB(args.db_latency_ms / 1000.0, users=args.users)
+        self.fetch_executor = ThreadPoolExecutor(max_workers=args.max_outstanding, thread_name_prefix="load-fetch")
+        self.fetcher = ImageFetcher()
+
+    def _render(self, tool_name: str, result: dict) -> str:
+        from google.genai import types
+        from google.adk.models import LlmRequest
+
+        request = LlmRequest(contents=[types.Content(role="user", parts=[
+            types.Part(function_response=types.FunctionResponse(name=tool_name, response=result))
+        ])])
+        response = self.fast_path.render_fast_path(_NullContext(), request)
+        if response is None:
+            raise RuntimeError(f"{tool_name} result not renderable")
+        return response.content.parts[0].text
+
+    async def session(self, userid: str, app_guide: bool, stats: dict):
+        timings = {}
+        started = time.perf_counter()
+
+        t = time.perf_counter()
+        device = await self.async_tools.query_DeviceInfo(userid)
+        timings["db"] = time.perf_counter() - t
+        if device.get("status") != "success" or not device.get("data"):
+            raise RuntimeError(f"query_DeviceInfo: {device.get('message', 'no data')}")
+
+        t = time.perf_counter()
+        if app_guide:
+            tool_name = "get_poverty_app_download_guide"
+            result = await self.async_tools.get_poverty_app_download_guide()
+        else:
+            tool_name = "get_complete_location_guide"
+            result = await self.async_tools.location_guide_for_device(device["data"][0].get("DeviceName", ""))
+        timings["guide_load"] = time.perf_counter() - t
+        if result.get("status") != "success":
+            raise RuntimeError(f"{tool_name}: {result.get('message')}")
+
+        t = time.perf_counter()
+        self._render(tool_name, result)
+        timings["render"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        stats["bytes"] += await loop.run_in_executor(self.fetch_executor, self.fetcher.fetch, _image_urls(result))
+        timings["image_fetch"] = time.perf_counter() - t
+
+        timings["session"] = time.perf_counter() - started
+        for stage, seconds in timings.items():
+            stats["latencies"][stage].append(seconds)
+
+    async def run_rate(self, rate: float, duration: float, sampler: UserSampler) -> dict:
+        stats = {"latencies": {stage: [] for stage in STAGES}, "bytes": 0, "errors": {}, "dropped": 0}
+        rng = random.Random(int(rate * 1000))
+        outstanding = set()
+
+        async def one(userid, app_guide):
+            try:
+                await self.session(userid, app_guide, stats)
+            except Exception as e:
+                key = f"{type(e).__name__}: {str(e)[:80]}"
+                stats["errors"][key] = stats["errors"].get(key, 0) + 1
+
+        started = time.perf_counter()
+        offered = 0
+        next_arrival = started
+        while True:
+            # Lịch đến tuyệt đối: sleep trễ thì các phiên quá hạn được bù ngay, không làm rate trôi
+            next_arrival += rng.expovariate(rate)
+            if next_arrival - started >= duration:
+                break
+            delay = next_arrival - time.perf_counter()
+            await asyncio.sleep(delay if delay > 0 else 0)
+            offered += 1
+            if len(outstanding) >= self.args.max_outstanding:
+                stats["dropped"] += 1
+                continue
+            task = asyncio.create_task(one(sampler.sample(), rng.random() < self.args.app_guide_ratio))
+            outstanding.add(task)
+            task.add_done_callback(outstanding.discard)
+        if outstanding:
+            await asyncio.gather(*outstanding)
+        elapsed = time.perf_counter() - started
+
+        completed = len(stats["latencies"]["session"])
+        return {
+            "offered_rate": rate,
+            "offered": offered,
+            # Poisson: số phiên thực tế đến trong cửa sổ đo lệch khỏi rate danh nghĩa
+            "arrival_rate": round(offered / elapsed, 2) if elapsed else 0.0,
+            "completed": completed,
+            "dropped": stats["dropped"],
+            "errors": stats["errors"],
+            "seconds": round(elapsed, 3),
+            "throughput": round(completed / elapsed, 2) if elapsed else 0.0,
+            "image_mb_per_second": round(stats["bytes"] / elapsed / 1e6, 2) if elapsed else 0.0,
+            "stages": {stage: latency_summary(values) for stage, values in stats["latencies"].items()},
+        }
+
+    def build_artifacts(self):
+        """Build JSON guide + ảnh ngay trong process (không qua process pool trích xuất)."""
+        tools = self.tools
+        for folder_type in ("IOS", "Android"):
+            result = tools._extract_guide(tools._location_guide_id(folder_type))
+            if result.get("status") != "success":
+                raise HarnessError(f"building {folder_type} location guide: {result.get('message')}")
+        if self.args.app_guide_ratio > 0:
+            result = tools._extract_app_guide()
+            if result.get("status") != "success":
+                raise HarnessError(f"building app guide: {result.get('message')}")
+        tools.refresh_path_index()
+
+    async def run(self, rates: list) -> dict:
+        sampler = UserSampler(self.args.users_dist, self.args.users)
+        self.build_artifacts()
+        # Warm-up: image server, cache guide trước khi đo
+        warmups = [self.async_tools.location_guide_for_device("iPhone"),
+                   self.async_tools.location_guide_for_device("Samsung")]
+        if self.args.app_guide_ratio > 0:
+            warmups.append(self.async_tools.get_poverty_app_download_guide())
+        for warmup in warmups:
+            result = await warmup
+            if result.get("status") != "success":
+                raise HarnessError(f"warm-up failed: {result.get('message')}")
+
+        levels, saturation = [], None
+        for rate in rates:
+            level = await self.run_rate(rate, self.args.duration, sampler)
+            levels.append(level)
+            p99 = level["stages"]["session"].get("p99_ms", 0)
+            print(f"rate={rate:>7}/s  arrivals={level['arrival_rate']:>7}/s  "
+                  f"throughput={level['throughput']:>7}/s  session p50="
+                  f"{level['stages']['session'].get('p50_ms')}ms p99={p99}ms  "
+                  f"dropped={level['dropped']} errors={sum(level['errors'].values())}", file=sys.stderr)
+            if not level["completed"] and level["errors"]:
+                top = max(level["errors"], key=level["errors"].get)
+                raise HarnessError(f"rate={rate}: every session failed ({top})")
+            if saturation is None and (level["throughput"] < 0.9 * level["arrival_rate"] or p99 > self.args.slo_ms):
+                saturation = rate
+        return {"levels": levels, "saturation_rate": saturation}
+
+
+class _NullContext:
+    """CallbackContext tối thiểu cho render_fast_path (chỉ cần state)."""
+
+    def __init__(self):
+        self.state = {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for tools + image server")
+    parser.add_argument("--rate", type=float, default=20.0, help="Số phiên mới mỗi giây")
+    parser.add_argument("--ramp", default=None, help="Danh sách rate, ví dụ 10,20,40,80")
+    parser.add_argument("--duration", type=float, default=20.0, help="Số giây chạy mỗi mức rate")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--users-dist", default="uniform", help="uniform | zipf:<s> | hot:<share>:<n>")
+    parser.add_argument("--app-guide-ratio", type=float, default=0.0,
+                        help="Tỉ lệ phiên hỏi hướng dẫn tải app Hộ Nghèo")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="Độ trễ giả lập mỗi lần kết nối DB")
+    parser.add_argument("--max-outstanding", type=int, default=256, help="Số phiên tối đa đang chạy")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="Ngưỡng p99 phiên để tính bão hoà")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    rates = [float(r) for r in args.ramp.split(",")] if args.ramp else [args.rate]
+    harness = Harness(args)
+    saved_app_guide_paths = harness.tools._app_guide_paths
+    # Guide tải app đọc từ DOCX giả trong benchmarks/fixtures
+    harness.tools._app_guide_paths = app_guide_fixture_paths
+    with harness.db.installed(harness.tools):
+        try:
+            report = asyncio.run(harness.run(rates))
+        except HarnessError as e:
+            print(f"load test aborted: {e}", file=sys.stderr)
+            return 1
+        finally:
+            harness.tools._app_guide_paths = saved_app_guide_paths
+            harness.fetcher.close()
+            harness.fetch_executor.shutdown(wait=False)
+            harness.tools.stop_image_server()
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    path = write_results({"name": "load_test", "config": config, **report}, args.output)
+    print(json.dumps({"results": path, "saturation_rate": report["saturation_rate"]}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""
+Benchmark suite offline cho tool và các đường trích xuất (kiểu asv: mỗi case có setup
+không tính giờ + hàm đo, chạy lặp và ghi thống kê).
+
+Không cần SQL Server: query_DeviceInfo đọc từ DB sqlite giả (_fixtures.FakeDeviceDB).
+Tài liệu DOCX giả được sinh trong benchmarks/fixtures/. Case thiếu dependency
+(ví dụ unstructured cho process_docx.parse_docx_to_json) được ghi "skipped".
+Case "async.*" await các wrapper trong async_tools.py (thread pool, admission control)
+trên một event loop dùng chung cho cả lần chạy.
+
+Usage:
+    python benchmarks/run_suite.py run                        # tất cả case
+    python benchmarks/run_suite.py run --filter guide --repeat 5
+    python benchmarks/run_suite.py list
+    python benchmarks/run_suite.py compare results/suite-abc123.json results/suite-def456.json
+
+Kết quả: benchmarks/results/suite-<commit>.json. compare in tỉ lệ p50 giữa hai lần chạy
+và exit 1 nếu có case chậm hơn --threshold.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import importlib
+from typing import Callable, NamedTuple, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import PACKAGE_DIR, import_package_module, latency_summary, write_results
+from _fixtures import FakeDeviceDB, app_guide_fixture_paths, fixture_path, make_guide_docx, user_id
+
+
+class Case(NamedTuple):
+    name: str
+    fn: Callable
+    setup: Optional[Callable] = None
+    repeat: int = 20
+    requires: tuple = ()
+
+
+class Context:
+    """Module của agent + fixture dùng chung giữa các case."""
+
+    def __init__(self, users: int):
+        sys.path.insert(0, PACKAGE_DIR)  # process_docx / extract_docx_data dùng import tuyệt đối
+        self.tools = import_package_module("tools")
+        self.async_tools = import_package_module("async_tools")
+        self.loop = asyncio.new_event_loop()
+        self.image_server = import_package_module("image_server")
+        self.db = FakeDeviceDB(users=users)
+        self.rng = random.Random(11)
+        self.docx = make_guide_docx(fixture_path("docs", "guide.docx"))
+
+    def random_user(self) -> str:
+        return user_id(self.rng.randrange(self.db.users))
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def out_dir(self, name: str) -> str:
+        return os.path.dirname(fixture_path("out", name, "x"))
+
+    def app_guide_paths(self) -> tuple:
+        return app_guide_fixture_paths()
+
+
+def _clear(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _has(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def build_cases(ctx: Context) -> list:
+    tools = ctx.tools
+    ios_json = tools._location_json_path("IOS")
+    app_json, _, app_images = ctx.app_guide_paths()
+
+    def location_guide():
+        return tools.get_complete_location_guide(ctx.random_user())
+
+    def drop_location_json():
+        _clear(ios_json)
+        _clear(tools._location_json_path("Android"))
+
+    def drop_app_guide():
+        _clear(app_json)
+        _clear(app_images)
+
+    def docx_case(name, extract):
+        out = ctx.out_dir(name)
+        return lambda: extract(out), lambda: _clear(out)
+
+    tools_extract, tools_extract_setup = docx_case(
+        "tools_docx", lambda out: tools._extract_docx_data(ctx.docx, out, "BENCH"))
+    sequential, sequential_setup = docx_case(
+        "extract_docx_data", lambda out: importlib.import_module("extract_docx_data").extract_content_sequential(
+            ctx.docx, out, "BENCH"))
+    images_only, images_only_setup = docx_case(
+        "process_docx_images", lambda out: importlib.import_module("process_docx").extract_images_from_docx(
+            ctx.docx, out))
+
+    def parse_docx():
+        process_docx = importlib.import_module("process_docx")
+        out = ctx.out_dir("process_docx_parse")
+        mapping = process_docx.extract_images_from_docx(ctx.docx, out)
+        return process_docx.parse_docx_to_json(ctx.docx, mapping, "IOS")
+
+    guide_index = import_package_module("guide_index")
+    status_messages = importlib.import_module("_fixtures").STATUS_MESSAGES
+
+    def status_lookup():
+        index = guide_index.get_index()
+        index._cache.clear()
+        return [index.lookup(message) for message in status_messages]
+
+    def image_throughput():
+        bench_image_server = importlib.import_module("bench_image_server")
+        paths = bench_image_server.ensure_fixture_images(6)
+        return bench_image_server.run_scenario(ctx.image_server, "threaded", clients=4, pages=5, paths=paths)
+
+    async_tools = ctx.async_tools
+
+    def async_location_guide():
+        return ctx.run_async(async_tools.get_complete_location_guide(ctx.random_user()))
+
+    def ensure_location_json():
+        # Bản async sẽ trích xuất trên process pool: build trước ngoài phần đo
+        if not tools._guide_ready(tools._location_guide_id("IOS")):
+            tools.process_pdf_files()
+
+    async def concurrent_queries(count):
+        return await asyncio.gather(*(async_tools.query_DeviceInfo(ctx.random_user()) for _ in range(count)))
+
+    def async_concurrent():
+        results = ctx.run_async(concurrent_queries(32))
+        busy = sum(1 for result in results if result.get("status") == "busy")
+        return {"status": "success", "busy": busy}
+
+    return [
+        Case("query_DeviceInfo", lambda: tools.query_DeviceInfo(ctx.random_user()), repeat=200),
+        Case("get_complete_location_guide.cold", location_guide, setup=drop_location_json, repeat=3,
+             requires=("pdfplumber",)),
+        Case("get_complete_location_guide.warm", location_guide, repeat=100),
+        Case("get_poverty_app_download_guide.cold", tools.get_poverty_app_download_guide,
+             setup=drop_app_guide, repeat=5, requires=("docx",)),
+        Case("get_poverty_app_download_guide.warm", tools.get_poverty_app_download_guide, repeat=100,
+             requires=("docx",)),
+        Case("process_pdf_files", tools.process_pdf_files, repeat=3, requires=("pdfplumber",)),
+        Case("docx.tools_extract_docx_data", tools_extract, setup=tools_extract_setup, repeat=5, requires=("docx",)),
+        Case("docx.extract_content_sequential", sequential, setup=sequential_setup, repeat=5, requires=("docx",)),
+        Case("docx.process_docx_extract_images", images_only, setup=images_only_setup, repeat=5,
+             requires=("docx",)),
+        Case("docx.process_docx_parse_to_json", parse_docx, repeat=3, requires=("docx", "unstructured")),
+        Case("guide_index.status_lookup", status_lookup, repeat=200),
+        Case("image_handler.throughput", image_throughput, repeat=1, requires=("PIL",)),
+        Case("async.query_DeviceInfo",
+             lambda: ctx.run_async(async_tools.query_DeviceInfo(ctx.random_user())), repeat=200),
+        Case("async.query_DeviceInfo.concurrent32", async_concurrent, repeat=20),
+        Case("async.get_complete_location_guide.warm", async_location_guide, setup=ensure_location_json,
+             repeat=100, requires=("pdfplumber",)),
+        Case("async.find_guides_for_status",
+             lambda: ctx.run_async(async_tools.find_guides_for_status(status_messages[0])), repeat=100),
+        Case("async.get_guide.catalog", lambda: ctx.run_async(async_tools.get_guide("")), repeat=100),
+    ]
+
+
+def run_case(case: Case, repeat: Optional[int]) -> dict:
+    missing = [module for module in case.requires if not _has(module)]
+    if missing:
+        return {"status": "skipped", "reason": f"missing {', '.join(missing)}"}
+
+    latencies = []
+    last = None
+    try:
+        for _ in range(repeat or case.repeat):
+            if case.setup:
+                case.setup()
+            started = time.perf_counter()
+            last = case.fn()
+            latencies.append(time.perf_counter() - started)
+    except Exception as e:
+        return {"status": "error", "reason": f"{type(e).__name__}: {e}"}
+
+    result = {"status": "ok", "latency": latency_summary(latencies)}
+    if isinstance(last, dict) and last.get("status") not in (None, "success"):
+        result["tool_status"] = last.get("status")
+        result["tool_message"] = last.get("message")
+    if case.name == "image_handler.throughput":
+        result["throughput"] = last
+    return result
+
+
+def cmd_run(args) -> int:
+    ctx = Context(args.users)
+    cases = [c for c in build_cases(ctx) if not args.filter or args.filter in c.name]
+    results = {}
+    with ctx.db.installed(ctx.tools):
+        saved_paths = ctx.tools._app_guide_paths
+        ctx.tools._app_guide_paths = ctx.app_guide_paths
+        try:
+            for case in cases:
+                results[case.name] = run_case(case, args.repeat)
+                summary = results[case.name].get("latency", {})
+                print(f"{case.name:<40} {results[case.name]['status']:<8} "
+                      f"p50={summary.get('p50_ms', '-')}ms  p95={summary.get('p95_ms', '-')}ms  "
+                      f"{results[case.name].get('reason', '')}", file=sys.stderr)
+        finally:
+            ctx.tools._app_guide_paths = saved_paths
+            ctx.image_server.stop_image_server()
+            ctx.loop.close()
+
+    path = write_results({"name": "suite", "users": args.users, "cases": results}, args.output)
+    print(path)
+    return 0
+
+
+def cmd_list(args) -> int:
+    for case in build_cases(Context(args.users)):
+        print(f"{case.name:<40} repeat={case.repeat:<4} requires={','.join(case.requires) or '-'}")
+    return 0
+
+
+def compare(baseline: dict, current: dict, threshold: float, metric: str = "p50_ms") -> list:
+    """[(case, baseline_ms, current_ms, ratio, regressed)] cho các case có ở cả hai lần chạy."""
+    rows = []
+    for name, result in current.get("cases", {}).items():
+        before = baseline.get("cases", {}).get(name, {}).get("latency", {}).get(metric)
+        after = result.get("latency", {}).get(metric)
+        if not before or after is None:
+            continue
+        ratio = after / before
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def cmd_compare(args) -> int:
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold, args.metric)
+    print(f"{baseline.get('commit')} -> {current.get('commit')} ({args.metric})")
+    for name, before, after, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ("  faster" if ratio < 1 - args.threshold else "")
+        print(f"{name:<40} {before:>10.3f} -> {after:>10.3f} ms  x{ratio:.2f}{flag}")
+    return 1 if any(row[4] for row in rows) else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark suite cho tools và extractors")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Chạy các case và ghi JSON kết quả")
+    run.add_argument("--filter", default=None, help="Chỉ chạy case có tên chứa chuỗi này")
+    run.add_argument("--repeat", type=int, default=None, help="Ghi đè số lần lặp của mọi case")
+    run.add_argument("--users", type=int, default=10000, help="Số user trong DB giả")
+    run.add_argument("--output", default=None)
+    run.set_defaults(func=cmd_run)
+
+    lst = sub.add_parser("list", help="Liệt kê các case")
+    lst.add_argument("--users", type=int, default=10000)
+    lst.set_defaults(func=cmd_list)
+
+    cmp_ = sub.add_parser("compare", help="So sánh hai file kết quả")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("current")
+    cmp_.add_argument("--threshold", type=float, default=0.10, help="Chậm hơn quá tỉ lệ này thì tính là regression")
+    cmp_.add_argument("--metric", default="p50_ms")
+    cmp_.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,475 @@
+"""
+Bản sao cục bộ (SQLite) của bảng thiết bị, để query_DeviceInfo không phải round trip tới
+SQL Server cho mỗi người dùng mới.
+
+- Lần đầu: bulk load cả TABLE (fetchmany theo batch) vào một bảng mới của replica, xong
+  mới chuyển sang đọc bảng đó
+- Sau đó: tìm các UserID có dòng với cột watermark (rowversion / ModifiedAt) >= watermark đã
+  lưu, rồi thay toàn bộ dòng của các UserID đó bằng dòng hiện tại trên DB nguồn. Replica giữ
+  mọi dòng của một UserID (người dùng nhiều thiết bị) theo thứ tự DB nguồn trả về, như
+  "SELECT * ... WHERE UserID = ?" của query_DeviceInfo. Watermark được commit cùng batch nên
+  sync dừng giữa chừng thì lần sau tiếp tục đúng chỗ
+- Bảng nguồn trống lúc bulk load (chưa có watermark): lần sync sau kéo mọi dòng có watermark,
+  không bulk load lại mỗi lần
+- Dòng bị xoá không đổi watermark: bulk load lại toàn bộ mỗi DEVICE_REPLICA_FULL_RESYNC_HOURS
+- query_DeviceInfo đọc replica khi lần sync thành công gần nhất chưa quá
+  DEVICE_REPLICA_MAX_STALENESS giây; UserID không có trong replica hoặc replica quá cũ
+  thì đọc DB thật như trước
+
+Cấu hình:
+    DEVICE_REPLICA=1
+    DEVICE_REPLICA_PATH=...               # mặc định device_replica.sqlite trong ARTIFACT_DIR
+    DEVICE_REPLICA_WATERMARK=ModifiedAt   # mặc định: cột đầu tiên có trong bảng trong
+                                          # RowVersion, ModifiedAt, UpdatedAt, LastModified, LastUpdated
+    DEVICE_REPLICA_SYNC_SECONDS=30
+    DEVICE_REPLICA_MAX_STALENESS=300
+
+Process agent (trừ worker ARTIFACT_READ_ONLY) tự chạy sync nền khi bật. Nhiều worker dùng
+chung file replica; sync được tuần tự hoá bằng file lock "device_replica". Chạy sync riêng:
+    python -m <tên thư mục agent>.device_replica sync [--full] [--loop]
+    python -m <tên thư mục agent>.device_replica status
+"""
+import os
+import sys
+import json
+import math
+import time
+import pathlib
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+from dotenv import load_dotenv
+
+from . import metrics
+from .artifacts import artifact_path, file_lock, read_only
+from .tracing import span
+
+load_dotenv()
+config = {
+    'ENABLED': os.getenv('DEVICE_REPLICA', '').lower() in ('1', 'true', 'yes'),
+    'PATH': os.path.abspath(os.getenv('DEVICE_REPLICA_PATH') or artifact_path('device_replica.sqlite')),
+    'TABLE': os.getenv('TABLE'),
+    'WATERMARK': os.getenv('DEVICE_REPLICA_WATERMARK'),
+    'SYNC_SECONDS': float(os.getenv('DEVICE_REPLICA_SYNC_SECONDS', '30')),
+    'MAX_STALENESS': float(os.getenv('DEVICE_REPLICA_MAX_STALENESS', '300')),
+    'FULL_RESYNC_SECONDS': float(os.getenv('DEVICE_REPLICA_FULL_RESYNC_HOURS', '24')) * 3600,
+    'BATCH_SIZE': int(os.getenv('DEVICE_REPLICA_BATCH_SIZE', '5000')),
+}
+
+_WATERMARK_CANDIDATES = ("rowversion", "modifiedat", "updatedat", "lastmodified", "lastupdated")
+# Cột ẩn: UserID dạng text để tra đúng như "WHERE UserID = ?" với str(userid) của DB thật
+_USER_KEY = "_user_key"
+# Meta được đọc lại tối đa mỗi giây, không phải mỗi lần tra
+_META_TTL = 1.0
+# Layout của bảng replica; khác với meta đã lưu thì bulk load lại
+# (2: mọi dòng của một UserID, không còn khoá duy nhất)
+REPLICA_FORMAT = 2
+# Số tham số mỗi câu "IN (...)" (SQL Server cho tối đa 2100)
+_IN_CHUNK = 500
+
+
+def _normalize(name: str) -> str:
+    return name.replace('_', '').lower()
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _to_sqlite(value):
+    """Giá trị pyodbc -> giá trị SQLite (ngày tháng/Decimal như convert_value_to_json_serializable)."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, bytearray):
+        return bytes(value)
+    if value is None or isinstance(value, (str, int, float, bytes)):
+        return value
+    return str(value)
+
+
+def _encode_watermark(value):
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        return {"bytes": bytes(value).hex()}
+    if isinstance(value, datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"date": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"decimal": str(value)}
+    return {"value": value}
+
+
+def _decode_watermark(tagged):
+    """Watermark đã lưu -> tham số đúng kiểu cho câu WHERE trên DB nguồn."""
+    if not tagged:
+        return None
+    kind, value = next(iter(tagged.items()))
+    return {
+        "bytes": bytes.fromhex,
+        "datetime": datetime.fromisoformat,
+        "date": date.fromisoformat,
+        "decimal": Decimal,
+    }.get(kind, lambda v: v)(value)
+
+
+def _chunks(values: list, size: int = _IN_CHUNK):
+    for offset in range(0, len(values), size):
+        yield values[offset:offset + size]
+
+
+class DeviceReplica:
+    """File SQLite replica: tra theo UserID (mỗi thread một connection chỉ đọc) và sync từ DB nguồn."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._meta = None
+        self._meta_at = 0.0
+
+    # --- đọc ---
+
+    def _reader(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(pathlib.Path(self.path).as_uri() + "?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def meta(self, max_age: float = 0.0) -> dict:
+        if self._meta is not None and time.monotonic() - self._meta_at < max_age:
+            return self._meta
+        try:
+            rows = self._reader().execute("SELECT key, value FROM meta").fetchall()
+        except sqlite3.Error:
+            # Chưa có file replica / chưa bulk load xong lần đầu
+            self._local.conn = None
+            rows = []
+        self._meta = {key: json.loads(value) for key, value in rows}
+        self._meta_at = time.monotonic()
+        return self._meta
+
+    def lag_seconds(self) -> float:
+        """Số giây từ lần sync thành công gần nhất (vô cùng nếu chưa sync lần nào)."""
+        last_sync = self.meta(_META_TTL).get("last_sync_at")
+        return max(0.0, time.time() - last_sync) if last_sync else math.inf
+
+    def lookup(self, userid: str) -> tuple:
+        """(các dòng của UserID, outcome); dòng là None khi phải đọc DB thật."""
+        meta = self.meta(_META_TTL)
+        if not meta.get("last_sync_at"):
+            return None, "empty"
+        if time.time() - meta["last_sync_at"] > config['MAX_STALENESS']:
+            return None, "stale"
+        columns = meta["columns"]
+        select = ", ".join(_quote(c) for c in columns)
+        rows = self._reader().execute(
+            f"SELECT {select} FROM {_quote(meta['table_name'])} WHERE {_USER_KEY} = ? ORDER BY rowid",
+            (str(userid),)
+        ).fetchall()
+        if not rows:
+            return None, "miss"
+        bool_columns = [i for i, c in enumerate(columns) if c in meta.get("bool_columns", ())]
+        data = []
+        for row in rows:
+            record = dict(zip(columns, row))
+            for i in bool_columns:
+                if row[i] is not None:
+                    record[columns[i]] = bool(row[i])
+            data.append(record)
+        return data, "hit"
+
+    # --- sync ---
+
+    def sync(self, source, table: str, full: bool = False) -> dict:
+        """Một lần sync từ connection nguồn: bulk load nếu cần, ngược lại kéo theo watermark."""
+        writer = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            writer.execute("PRAGMA journal_mode=WAL")
+            writer.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            meta = {key: json.loads(value) for key, value in writer.execute("SELECT key, value FROM meta")}
+            # Bảng cũ của lần bulk load trước: reader có thể còn dùng tên cũ trong meta cache tới _META_TTL
+            if meta.get("previous_table"):
+                writer.execute(f"DROP TABLE IF EXISTS {_quote(meta['previous_table'])}")
+                self._set_meta(writer, previous_table=None)
+
+            columns, description = self._source_columns(source, table)
+            needs_full = (
+                full or not meta.get("last_sync_at") or meta.get("table") != table
+                or meta.get("columns") != columns or meta.get("format") != REPLICA_FORMAT
+                or time.time() - meta.get("last_full_sync_at", 0) > config['FULL_RESYNC_SECONDS']
+            )
+            if needs_full:
+                result = self._full_load(source, table, writer, meta, columns, description)
+            else:
+                result = self._incremental(source, table, writer, meta, columns)
+        finally:
+            writer.close()
+        self._meta = None
+        return result
+
+    def _source_columns(self, source, table: str) -> tuple:
+        cursor = source.cursor()
+        try:
+            cursor.execute(f"SELECT * FROM {table} WHERE 1 = 0")
+            description = cursor.description
+        finally:
+            cursor.close()
+        return [c[0] for c in description], description
+
+    @staticmethod
+    def _pick_column(columns, configured, candidates, what) -> str:
+        by_normalized = {_normalize(c): c for c in columns}
+        for name in ([configured] if configured else candidates):
+            if _normalize(name) in by_normalized:
+                return by_normalized[_normalize(name)]
+        raise ValueError(f"Device table has no {what} column ({configured or ', '.join(candidates)})")
+
+    def _set_meta(self, writer, **values):
+        writer.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                           [(key, json.dumps(value)) for key, value in values.items()])
+
+    def _write_rows(self, writer, rows, user_index, insert_sql):
+        writer.executemany(insert_sql, [
+            (*(_to_sqlite(v) for v in row), None if row[user_index] is None else str(row[user_index]))
+            for row in rows
+        ])
+
+    @staticmethod
+    def _insert_sql(table_name, columns) -> str:
+        names = ", ".join(_quote(c) for c in [*columns, _USER_KEY])
+        return (f"INSERT INTO {_quote(table_name)} ({names}) "
+                f"VALUES ({', '.join('?' * (len(columns) + 1))})")
+
+    def _full_load(self, source, table, writer, meta, columns, description) -> dict:
+        watermark_column = self._pick_column(columns, config['WATERMARK'], _WATERMARK_CANDIDATES, "watermark")
+        user_column = self._pick_column(columns, None, ("UserID",), "UserID")
+        table_name = f"devices_{int(time.time() * 1000)}"
+        started = time.time()
+
+        cursor = source.cursor()
+        try:
+            # Watermark lấy TRƯỚC khi quét: dòng đổi trong lúc quét được lần sync sau kéo lại.
+            # None khi bảng trống: _incremental kéo mọi dòng ở lần sau
+            cursor.execute(f"SELECT MAX({watermark_column}) FROM {table}")
+            watermark = cursor.fetchone()[0]
+
+            column_defs = ", ".join(_quote(c) for c in columns)
+            writer.execute(f"CREATE TABLE {_quote(table_name)} ({column_defs}, {_USER_KEY} TEXT)")
+            insert_sql = self._insert_sql(table_name, columns)
+            user_index = columns.index(user_column)
+            cursor.arraysize = config['BATCH_SIZE']
+            cursor.execute(f"SELECT * FROM {table}")
+            rows = 0
+            writer.execute("BEGIN")
+            while True:
+                batch = cursor.fetchmany(config['BATCH_SIZE'])
+                if not batch:
+                    break
+                self._write_rows(writer, batch, user_index, insert_sql)
+                rows += len(batch)
+            writer.execute(f"CREATE INDEX {_quote(table_name + '_user')} ON {_quote(table_name)} ({_USER_KEY})")
+            now = time.time()
+            # Đổi bảng đọc và ghi meta trong cùng transaction: reader thấy bảng cũ hoặc bảng mới đầy đủ
+            self._set_meta(
+                writer, table=table, table_name=table_name, previous_table=meta.get("table_name"),
+                columns=columns, user_column=user_column, format=REPLICA_FORMAT,
+                watermark_column=watermark_column, watermark=_encode_watermark(watermark),
+                bool_columns=[c[0] for c in description if c[1] is bool],
+                last_sync_at=now, last_full_sync_at=now, rows=rows,
+            )
+            writer.execute("COMMIT")
+        except BaseException:
+            if writer.in_transaction:
+                writer.execute("ROLLBACK")
+            writer.execute(f"DROP TABLE IF EXISTS {_quote(table_name)}")
+            raise
+        finally:
+            cursor.close()
+        _ROWS.inc(rows, kind="full")
+        return {"status": "success", "kind": "full", "rows": rows, "seconds": round(time.time() - started, 3)}
+
+    def _incremental(self, source, table, writer, meta, columns) -> dict:
+        watermark_column = meta["watermark_column"]
+        user_column = meta["user_column"]
+        insert_sql = self._insert_sql(meta["table_name"], columns)
+        user_index = columns.index(user_column)
+        watermark = _decode_watermark(meta["watermark"])
+        started = time.time()
+
+        cursor = source.cursor()
+        rows = 0
+        try:
+            cursor.arraysize = config['BATCH_SIZE']
+            if watermark is None:
+                # Bảng nguồn trống ở lần bulk load: mọi dòng đều mới
+                cursor.execute(f"SELECT {user_column}, {watermark_column} FROM {table} "
+                               f"WHERE {watermark_column} IS NOT NULL ORDER BY {watermark_column}")
+            else:
+                # >= thay vì >: các dòng trùng watermark với dòng cuối lần trước (ModifiedAt cùng
+                # thời điểm) không bị bỏ sót; thay theo UserID nên kéo lại vẫn đúng
+                cursor.execute(f"SELECT {user_column}, {watermark_column} FROM {table} "
+                               f"WHERE {watermark_column} >= ? ORDER BY {watermark_column}", (watermark,))
+            # Đọc hết (chỉ hai cột) trước khi truy vấn tiếp trên cùng connection nguồn
+            changes = cursor.fetchall()
+            for offset in range(0, len(changes), config['BATCH_SIZE']):
+                batch = changes[offset:offset + config['BATCH_SIZE']]
+                users = list(dict.fromkeys(user for user, _ in batch if user is not None))
+                fresh = self._user_rows(cursor, table, user_column, users)
+                writer.execute("BEGIN")
+                for chunk in _chunks([str(user) for user in users]):
+                    writer.execute(f"DELETE FROM {_quote(meta['table_name'])} "
+                                   f"WHERE {_USER_KEY} IN ({', '.join('?' * len(chunk))})", chunk)
+                self._write_rows(writer, fresh, user_index, insert_sql)
+                self._set_meta(writer, watermark=_encode_watermark(batch[-1][1]))
+                writer.execute("COMMIT")
+                rows += len(fresh)
+        except BaseException:
+            if writer.in_transaction:
+                writer.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+        self._set_meta(writer, last_sync_at=time.time())
+        _ROWS.inc(rows, kind="incremental")
+        return {"status": "success", "kind": "incremental", "rows": rows,
+                "seconds": round(time.time() - started, 3)}
+
+    @staticmethod
+    def _user_rows(cursor, table, user_column, users) -> list:
+        """Mọi dòng hiện tại của các UserID, theo thứ tự DB nguồn trả về."""
+        rows = []
+        for chunk in _chunks(users):
+            cursor.execute(f"SELECT * FROM {table} WHERE {user_column} IN ({', '.join('?' * len(chunk))})", chunk)
+            rows.extend(cursor.fetchall())
+        return rows
+
+    def status(self) -> dict:
+        meta = self.meta()
+        return {
+            "path": self.path,
+            "enabled": config['ENABLED'],
+            "rows_at_full_load": meta.get("rows"),
+            "watermark_column": meta.get("watermark_column"),
+            "watermark": meta.get("watermark"),
+            "lag_seconds": round(self.lag_seconds(), 3),
+        }
+
+
+_READS = metrics.counter("device_replica_reads_total", "Device lookups against the local replica by outcome",
+                         ("outcome",))
+_SYNCS = metrics.counter("device_replica_syncs_total", "Replica sync runs", ("kind", "status"))
+_ROWS = metrics.counter("device_replica_rows_synced_total", "Rows copied from the device table", ("kind",))
+
+_replica = None
+_replica_lock = threading.Lock()
+_sync_thread = None
+
+
+def get_replica() -> DeviceReplica:
+    global _replica
+    with _replica_lock:
+        if _replica is None or _replica.path != config['PATH']:
+            _replica = DeviceReplica(config['PATH'])
+        return _replica
+
+
+def lookup(userid: str):
+    """Dòng DeviceInfo của userid từ replica, hoặc None khi phải đọc DB thật (tắt / trống / quá cũ / miss)."""
+    if not config['ENABLED']:
+        return None
+    with span("db.replica_lookup") as s:
+        try:
+            data, outcome = get_replica().lookup(userid)
+        except sqlite3.Error as e:
+            logging.warning(f"Device replica read failed, using live DB: {e}")
+            data, outcome = None, "error"
+        s.set_attribute("outcome", outcome)
+    _READS.inc(outcome=outcome)
+    return data
+
+
+def sync_once(connect, table: str = None, full: bool = False, min_interval: float = 0.0) -> dict:
+    """Một lần sync dưới file lock; bỏ qua nếu process khác vừa sync trong min_interval giây."""
+    table = table or config['TABLE']
+    if not table:
+        return {"status": "error", "message": "Missing TABLE env var"}
+    replica = get_replica()
+    with file_lock("device_replica"):
+        if not full and replica.lag_seconds() < min_interval:
+            return {"status": "skipped", "lag_seconds": round(replica.lag_seconds(), 3)}
+        kind = "full" if full else "auto"
+        try:
+            with span("db.replica_sync", table=table) as s:
+                source = connect()
+                try:
+                    result = replica.sync(source, table, full=full)
+                finally:
+                    source.close()
+                s.set_attributes(result)
+        except Exception:
+            _SYNCS.inc(kind=kind, status="error")
+            raise
+    _SYNCS.inc(kind=result["kind"], status="success")
+    return result
+
+
+def _sync_loop(connect, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            result = sync_once(connect, min_interval=config['SYNC_SECONDS'] / 2)
+            if result.get("rows"):
+                logging.info(f"Device replica sync: {result}")
+        except Exception as e:
+            logging.error(f"Device replica sync failed: {e}")
+        stop.wait(config['SYNC_SECONDS'])
+
+
+def start_sync_thread(connect):
+    """Sync nền (daemon thread) cho process agent; không chạy khi tắt replica hoặc worker chỉ đọc."""
+    global _sync_thread
+    if _sync_thread is not None or not config['ENABLED']:
+        return
+    with _replica_lock:
+        if _sync_thread is not None or read_only():
+            return
+        _sync_thread = threading.Thread(target=_sync_loop, args=(connect, threading.Event()),
+                                        name="device-replica-sync", daemon=True)
+        _sync_thread.start()
+
+
+metrics.gauge("device_replica_lag_seconds", "Seconds since the last successful replica sync",
+              fn=lambda: get_replica().lag_seconds() if config['ENABLED'] else 0)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replicate the device table into the local SQLite read store.")
+    parser.add_argument("command", choices=("sync", "status"))
+    parser.add_argument("--full", action="store_true", help="Bulk load lại toàn bộ bảng")
+    parser.add_argument("--loop", action="store_true", help="Sync liên tục mỗi DEVICE_REPLICA_SYNC_SECONDS")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "status":
+        print(json.dumps(get_replica().status(), ensure_ascii=False, indent=2))
+        return 0
+    from .db import get_connection
+    print(json.dumps(sync_once(get_connection, full=args.full), ensure_ascii=False, indent=2))
+    if args.loop:
+        stop = threading.Event()
+        try:
+            _sync_loop(get_connection, stop)
+        except KeyboardInterrupt:
+            stop.set()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,6 +23,10 @@ except ImportError:
     print("Missing 'python-docx' or 'Pillow'. Please install: pip install python-docx Pillow")
     sys.exit(1)
 
+from image_variants import generate_variants, save_image
+from tracing import traced, current_span
+from profiling import profiled, enable_from_argv
+
 def iter_block_items(parent):
     """
     Generate a reference to each paragraph and table child within parent, in document order.
@@ -100,10 +104,13 @@ def _save_image_data(image_data, filepath):
         elif image.mode != 'RGB':
             image = image.convert('RGB')
         
-        image.save(filepath, "JPEG", quality=85)
+        save_image(image, filepath, "JPEG", quality=85)
+        generate_variants(filepath)
     except Exception as e:
         logging.error(f"Error saving image {filepath}: {e}")
 
+@profiled("extract_content_sequential")
+@traced("extract.docx_sequential")
 def extract_content_sequential(docx_path, output_folder, folder_type_label):
     doc = Document(docx_path)
     if not os.path.exists(output_folder):
@@ -194,9 +201,11 @@ def extract_content_sequential(docx_path, output_folder, folder_type_label):
                 "folder_type": folder_type_label
              })
 
+    current_span().set_attributes({"folder_type": folder_type_label, "steps": len(results), "images": image_counter - 1})
     return results
 
 if __name__ == "__main__":
+    enable_from_argv()
     # Configuration
     target_file = "HELP_RASOATHONGHEO_AI.docx"
     output_json = "help_rasoathongheo_ai.json"
@@ -0,0 +1,44 @@
+"""
+Job trích xuất chạy trong process con của async_tools (ProcessPoolExecutor "spawn").
+
+Process con không import package agent theo đường thường (__init__ -> agent -> google.adk:
+nặng và không cần cho trích xuất). async_tools nạp module này bằng tên top-level
+(WORKER_MODULE) và process con tìm thấy nó nhờ thư mục package được thêm vào sys.path
+lúc khởi động. run() đăng ký package như module rỗng (không chạy __init__) rồi mới import tools.
+
+Process con không thấy config/patch của process cha: mọi thứ cần dùng (thư mục package,
+ARTIFACT_DIR, config các module, đường dẫn guide app) được truyền theo tham số trong job.
+Module này chỉ import stdlib.
+"""
+import os
+import sys
+import types
+import importlib
+
+WORKER_MODULE = "extract_worker"
+# Module có config được chép từ process cha sang process con (artifacts phải đứng đầu:
+# image_server/guide_index/guide_bundle đọc ARTIFACT_DIR lúc import)
+CONFIG_MODULES = ("artifacts", "tools", "guide_registry", "guide_index", "guide_bundle")
+
+
+def _package(package: str, package_dir: str):
+    module = sys.modules.get(package)
+    if module is None:
+        module = types.ModuleType(package)
+        module.__path__ = [package_dir]
+        module.__file__ = os.path.join(package_dir, "__init__.py")
+        sys.modules[package] = module
+    return module
+
+
+def run(job: dict):
+    """Chạy tools.<job["fn"]>(*job["args"]) với config của process cha."""
+    _package(job["package"], job["package_dir"])
+    for name in CONFIG_MODULES:
+        module = importlib.import_module(f"{job['package']}.{name}")
+        module.config.update(job["config"].get(name, {}))
+    tools = sys.modules[f"{job['package']}.tools"]
+    if job.get("app_guide_paths"):
+        app_guide_paths = tuple(job["app_guide_paths"])
+        tools._app_guide_paths = lambda: app_guide_paths
+    return getattr(tools, job["fn"])(*job["args"])
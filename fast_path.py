@@ -0,0 +1,154 @@
+"""
+Render fast path: bỏ qua lượt gọi LLM thứ hai khi turn chỉ là yêu cầu hướng dẫn.
+
+Sau khi tool hướng dẫn trả về, ADK gọi lại model chỉ để chép `rendered_markdown`
+theo format cố định. before_model_callback ở đây nhận ra trường hợp đó và trả
+thẳng markdown làm response của agent, không gọi model.
+
+Chỉ khi guide vừa trả về chắc chắn là guide cần hiển thị: get_poverty_app_download_guide /
+get_guide (guide đã được chọn rõ ràng), hoặc get_complete_location_guide khi guide đầu
+tiên trong suggested_guides chính là guide định vị đó. Còn lại (status_message trỏ tới
+guide cài app hay guide khác, hoặc không khớp guide nào) model vẫn chạy để đọc
+status_message như instruction yêu cầu.
+
+Thời gian tiết kiệm mỗi turn được ước lượng bằng trung bình trượt (EWMA) thời gian
+các lượt model "tóm tắt kết quả tool" thực sự đã chạy, log ra và cộng dồn vào
+session state ("fast_path_saved_seconds") cùng metrics:
+    agent_fast_path_turns_total, agent_fast_path_saved_seconds_total
+
+Tắt bằng RENDER_FAST_PATH=0.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Optional
+
+from google.genai import types
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.agents.callback_context import CallbackContext
+
+from . import metrics
+
+config = {
+    'ENABLED': os.getenv('RENDER_FAST_PATH', '1').lower() not in ('0', 'false', 'no'),
+    # Ước lượng ban đầu khi chưa đo được lượt tóm tắt nào
+    'BASELINE_SECONDS': float(os.getenv('RENDER_FAST_PATH_BASELINE_SECONDS', '2.5')),
+}
+
+# Tool trả về `rendered_markdown` hoàn chỉnh
+GUIDE_TOOLS = frozenset({'get_complete_location_guide', 'get_poverty_app_download_guide', 'get_guide'})
+# Tool trả guide theo thiết bị, kèm status_message mà model phải đọc
+LOCATION_TOOL = 'get_complete_location_guide'
+
+_STARTED_KEY = "temp:fast_path_model_started"
+_SAVED_KEY = "fast_path_saved_seconds"
+_EWMA_ALPHA = 0.2
+
+_FAST_PATH_TURNS = metrics.counter(
+    "agent_fast_path_turns_total", "Turns answered from rendered_markdown without a model call", ("tool",))
+_SAVED_SECONDS = metrics.counter(
+    "agent_fast_path_saved_seconds_total", "Estimated model latency skipped by the render fast path")
+_SUMMARY_LATENCY = metrics.histogram(
+    "agent_tool_summary_model_seconds", "Latency of model calls that only summarize tool results")
+
+
+class _LatencyEstimate:
+    """EWMA thời gian lượt model tóm tắt kết quả tool (thread-safe)."""
+
+    def __init__(self, initial: float, alpha: float = _EWMA_ALPHA):
+        self._value = initial
+        self._alpha = alpha
+        self._samples = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            if self._samples == 0:
+                self._value = seconds
+            else:
+                self._value += self._alpha * (seconds - self._value)
+            self._samples += 1
+
+    @property
+    def value(self) -> float:
+        with self._lock:
+            return self._value
+
+
+_summary_latency = _LatencyEstimate(config['BASELINE_SECONDS'])
+
+
+def _last_function_responses(llm_request: LlmRequest) -> list:
+    """function_response của content cuối nếu content đó chỉ gồm kết quả tool."""
+    if not llm_request.contents:
+        return []
+    parts = llm_request.contents[-1].parts or []
+    responses = [part.function_response for part in parts if part.function_response]
+    if not responses or len(responses) != len(parts):
+        return []
+    return responses
+
+
+def _is_requested_guide(tool_name: str, result: dict) -> bool:
+    """Guide vừa trả về là guide cần hiển thị, model không cần đọc thêm status_message."""
+    if tool_name != LOCATION_TOOL or "status_message" not in result:
+        return True
+    suggested = result.get("suggested_guides") or []
+    return bool(suggested) and suggested[0].get("guide_id") == result.get("guide_id")
+
+
+def _rendered_guides(responses) -> Optional[list]:
+    rendered = []
+    for response in responses:
+        result = response.response or {}
+        if response.name not in GUIDE_TOOLS or result.get("status") != "success":
+            return None
+        if not _is_requested_guide(response.name, result):
+            return None
+        markdown = result.get("rendered_markdown")
+        if not markdown:
+            return None
+        rendered.append((response.name, markdown))
+    return rendered
+
+
+def render_fast_path(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """before_model_callback: trả rendered_markdown thay cho lượt gọi model."""
+    if not config['ENABLED']:
+        return None
+    rendered = _rendered_guides(_last_function_responses(llm_request))
+    if not rendered:
+        return None
+
+    saved = _summary_latency.value
+    callback_context.state[_SAVED_KEY] = callback_context.state.get(_SAVED_KEY, 0.0) + saved
+    for tool_name, _ in rendered:
+        _FAST_PATH_TURNS.inc(tool=tool_name)
+    _SAVED_SECONDS.inc(saved)
+    logging.info(f"Render fast path ({', '.join(name for name, _ in rendered)}): "
+                 f"skipped model call, ~{saved:.2f}s saved")
+
+    return LlmResponse(content=types.Content(
+        role="model",
+        parts=[types.Part(text="\n\n".join(markdown for _, markdown in rendered))],
+    ))
+
+
+def start_model_timer(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """before_model_callback (đặt sau render_fast_path): bắt đầu đo lượt tóm tắt kết quả tool."""
+    if _last_function_responses(llm_request):
+        callback_context.state[_STARTED_KEY] = time.perf_counter()
+    return None
+
+
+def record_model_latency(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+    """after_model_callback: cập nhật ước lượng thời gian lượt tóm tắt."""
+    started = callback_context.state.get(_STARTED_KEY)
+    if started is None or llm_response.partial:
+        return None
+    callback_context.state[_STARTED_KEY] = None
+    elapsed = time.perf_counter() - started
+    _summary_latency.observe(elapsed)
+    _SUMMARY_LATENCY.observe(elapsed)
+    return None
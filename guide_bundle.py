@@ -0,0 +1,364 @@
+"""
+Guide bundle: mọi guide (metadata + các bước) và các ảnh mà bước của guide dùng (kèm variant
+w100/w300 và WebP) được đóng gói vào một file guides.bundle, process agent mmap file đó khi chạy.
+
+- get_complete_location_guide / get_poverty_app_download_guide / get_guide lấy các bước
+  từ bundle, không json.load file nguồn
+- ImageHandler trả ảnh bằng slice của mmap: không open/stat từng file, không cần body
+  cache; các worker process dùng chung page cache của cùng một file
+- Chưa có bundle (mặc định) thì mọi thứ chạy như trước từ JSON + thư mục ảnh
+
+Build sau khi đã trích xuất (`artifacts build` cũng build bundle):
+    python -m <tên thư mục agent>.guide_bundle build
+    python -m <tên thư mục agent>.guide_bundle status
+
+Khi bundle đã có, mỗi lần trích xuất lại (process_pdf_files, get_guide...) bundle được
+build lại; process khác thấy file đổi (size/mtime) thì mmap bản mới.
+
+Định dạng (little-endian, bảng kích thước cố định đọc bằng struct, không parse JSON):
+    header | bảng guide | bảng bước | bảng ảnh | string UTF-8 | dữ liệu ảnh (căn 4096)
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import hashlib
+import logging
+import argparse
+import threading
+from typing import NamedTuple, Optional
+
+from . import metrics
+from .artifacts import artifact_dir, artifact_path, file_lock, read_only
+from .guide_registry import GuideEntry, Step, CompiledGuide, compile_steps, get_registry
+from .image_variants import VARIANT_WIDTHS, variant_path, webp_path
+
+config = {
+    'PATH': os.getenv('GUIDE_BUNDLE_PATH') or artifact_path('guides.bundle'),
+    # Số giây giữa hai lần stat file bundle để phát hiện bản build mới từ process khác
+    'RECHECK_SECONDS': float(os.getenv('GUIDE_BUNDLE_RECHECK_SECONDS', '1.0')),
+}
+
+MAGIC = b"GUIDEBDL"
+FORMAT_VERSION = 1
+_ALIGN = 4096
+_NO_STEP_NUMBER = -1
+
+# magic, version, số guide, số bước, số ảnh, offset vùng string, offset vùng ảnh
+_HEADER = struct.Struct("<8sIIIIQQ")
+# id, title, layout (offset + length trong vùng string), image_width, bước đầu tiên, số bước
+_GUIDE = struct.Struct("<IIIIIIIII")
+# step_number, text, image_path
+_STEP = struct.Struct("<iIIII")
+# relpath, offset, length, mtime_ns, etag (sha256[:16] như image_server._content_etag)
+_IMAGE = struct.Struct("<IIQQQ16s")
+
+
+class BundledImage(NamedTuple):
+    rel: str
+    offset: int
+    length: int
+    mtime_ns: int
+    etag: str
+
+    # ImageHandler dùng chung code 304/Range với file thường (đọc st_size / st_mtime)
+    @property
+    def st_size(self) -> int:
+        return self.length
+
+    @property
+    def st_mtime(self) -> float:
+        return self.mtime_ns / 1e9
+
+
+class _Strings:
+    """Vùng string của bundle; string trùng nhau chỉ ghi một lần."""
+
+    def __init__(self):
+        self.blob = bytearray()
+        self._refs = {}
+
+    def ref(self, value: str) -> tuple:
+        value = value or ""
+        ref = self._refs.get(value)
+        if ref is None:
+            data = value.encode('utf-8')
+            ref = (len(self.blob), len(data))
+            self.blob += data
+            self._refs[value] = ref
+        return ref
+
+
+def _relative(image_path: str) -> str:
+    # JSON của các lần trích xuất cũ lưu đường dẫn tuyệt đối
+    if image_path and os.path.isabs(image_path):
+        image_path = os.path.relpath(image_path, artifact_dir())
+    return (image_path or "").replace('\\', '/')
+
+
+def _step_number(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return _NO_STEP_NUMBER
+
+
+def _referenced_images(index, rels) -> set:
+    """Relpath các ảnh mà bước của guide dùng, kèm variant w100/w300 và WebP của chúng."""
+    by_relpath = dict(index.items())
+    wanted = set()
+    for rel in filter(None, rels):
+        if rel not in by_relpath:
+            # Như _build_image_url -> ImageHandler: ảnh không đúng relpath được tra theo tên file
+            abs_path = index.resolve(rel)
+            if abs_path is None:
+                continue
+            rel = os.path.relpath(abs_path, index.base_dir).replace('\\', '/')
+        for candidate in (rel, *(variant_path(rel, width) for width in VARIANT_WIDTHS)):
+            for name in (candidate, webp_path(candidate)):
+                if name in by_relpath:
+                    wanted.add(name)
+    return wanted
+
+
+def build_bundle(path: str = None) -> dict:
+    """Đóng gói guide đã trích xuất + ảnh của chúng thành file bundle (ghi atomic)."""
+    from .image_server import PathIndex
+
+    path = path or config['PATH']
+    registry = get_registry()
+    strings = _Strings()
+    guides, steps = [], []
+    referenced = set()
+    for entry in registry.entries():
+        source = registry.source_path(entry)
+        if not os.path.exists(source):
+            continue
+        with open(source, 'r', encoding='utf-8') as f:
+            compiled = compile_steps(json.load(f))
+        guides.append((*strings.ref(entry.id), *strings.ref(entry.title), *strings.ref(entry.layout),
+                       entry.image_width, len(steps), len(compiled)))
+        for step in compiled:
+            image_rel = _relative(step.image_path)
+            referenced.add(image_rel)
+            steps.append((_step_number(step.number), *strings.ref(step.text), *strings.ref(image_rel)))
+
+    index = PathIndex(artifact_dir())
+    index.refresh()
+    # Chỉ ảnh của guide: demo_*.png, assets/, benchmarks/fixtures/... trong ARTIFACT_DIR không vào bundle
+    wanted = _referenced_images(index, referenced)
+    # Thứ tự ưu tiên của PathIndex được giữ trong bundle: tra theo tên file cho cùng kết quả
+    images = [(rel, abs_path, strings.ref(rel)) for rel, abs_path in index.items() if rel in wanted]
+
+    strings_offset = (_HEADER.size + len(guides) * _GUIDE.size + len(steps) * _STEP.size
+                      + len(images) * _IMAGE.size)
+    data_offset = -(-(strings_offset + len(strings.blob)) // _ALIGN) * _ALIGN
+    image_records = []
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.seek(data_offset)
+        offset = data_offset
+        for rel, abs_path, ref in images:
+            with open(abs_path, 'rb') as img:
+                data = img.read()
+                mtime_ns = os.fstat(img.fileno()).st_mtime_ns
+            f.write(data)
+            etag = hashlib.sha256(data).hexdigest()[:16].encode('ascii')
+            image_records.append((*ref, offset, len(data), mtime_ns, etag))
+            offset += len(data)
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(guides), len(steps), len(images),
+                             strings_offset, data_offset))
+        for record in guides:
+            f.write(_GUIDE.pack(*record))
+        for record in steps:
+            f.write(_STEP.pack(*record))
+        for record in image_records:
+            f.write(_IMAGE.pack(*record))
+        f.write(strings.blob)
+    # Windows không cho thay file đang được mmap: lỗi ở đây được tools/artifacts log lại
+    os.replace(tmp_path, path)
+
+    summary = {"path": path, "guides": len(guides), "steps": len(steps), "images": len(images),
+               "bytes": offset}
+    logging.info(f"Guide bundle built: {summary}")
+    return summary
+
+
+class GuideBundle:
+    """Bundle đã mmap: bảng guide/ảnh đọc một lần lúc nạp, bước và byte ảnh lấy thẳng từ mmap."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.signature = (st.st_size, st.st_mtime_ns)
+        self.size = st.st_size
+        try:
+            (magic, version, n_guides, n_steps, n_images,
+             self._strings_offset, self._data_offset) = _HEADER.unpack_from(self._mmap, 0)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} guide bundle")
+
+        # Không bao giờ close mmap: response đang gửi có thể còn giữ memoryview của nó,
+        # mmap cũ được giải phóng khi không còn ai tham chiếu
+        self._view = memoryview(self._mmap)
+        offset = _HEADER.size
+        self._guides = {}
+        for record in _GUIDE.iter_unpack(self._view[offset:offset + n_guides * _GUIDE.size]):
+            guide_id = self._string(*record[0:2])
+            self._guides[guide_id] = (self._string(*record[2:4]), self._string(*record[4:6]), *record[6:9])
+        self._steps_offset = offset + n_guides * _GUIDE.size
+        offset = self._steps_offset + n_steps * _STEP.size
+        self._images = {}
+        self._by_name = {}
+        for record in _IMAGE.iter_unpack(self._view[offset:offset + n_images * _IMAGE.size]):
+            rel = self._string(*record[0:2])
+            image = BundledImage(rel, record[2], record[3], record[4], record[5].decode('ascii'))
+            self._images[rel] = image
+            self._by_name.setdefault(rel.rsplit('/', 1)[-1], image)
+        self._compiled = {}
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings_offset + offset
+        return str(self._mmap[start:start + length], 'utf-8')
+
+    def guide_ids(self) -> list:
+        return list(self._guides)
+
+    def has_guide(self, guide_id: str) -> bool:
+        return guide_id in self._guides
+
+    def guide(self, guide_id: str) -> Optional[CompiledGuide]:
+        """Guide dạng CompiledGuide như GuideRegistry.get (không tính vào ngân sách LRU)."""
+        compiled = self._compiled.get(guide_id)
+        if compiled is not None:
+            return compiled
+        meta = self._guides.get(guide_id)
+        if meta is None:
+            return None
+        title, layout, image_width, first, count = meta
+        start = self._steps_offset + first * _STEP.size
+        steps = tuple(
+            Step(None if number == _NO_STEP_NUMBER else number,
+                 sys.intern(self._string(text_off, text_len)), sys.intern(self._string(img_off, img_len)))
+            for number, text_off, text_len, img_off, img_len
+            in _STEP.iter_unpack(self._view[start:start + count * _STEP.size])
+        )
+        entry = get_registry().entry(guide_id) or GuideEntry(guide_id, title, "", layout, image_width)
+        compiled = CompiledGuide(entry, steps, 0, ("bundle", *self.signature))
+        self._compiled[guide_id] = compiled
+        return compiled
+
+    def image(self, rel_path: str) -> Optional[BundledImage]:
+        return self._images.get(rel_path.replace('\\', '/'))
+
+    def resolve_image(self, clean_path: str, by_name: bool = True) -> Optional[BundledImage]:
+        """URL path (đã unquote) -> ảnh trong bundle, cùng quy tắc với PathIndex.resolve."""
+        rel = clean_path.replace('\\', '/')
+        image = self._images.get(rel)
+        if image is None and by_name:
+            image = self._by_name.get(rel.rsplit('/', 1)[-1])
+        return image
+
+    def body(self, image: BundledImage) -> memoryview:
+        return self._view[image.offset:image.offset + image.length]
+
+    def stats(self) -> dict:
+        return {"path": self.path, "bytes": self.size, "guides": len(self._guides), "images": len(self._images)}
+
+
+_bundle = None
+_bundle_signature = None
+_checked_at = None
+_bundle_lock = threading.Lock()
+
+_LOADS = metrics.counter("guide_bundle_loads_total", "Guide bundle files mapped into memory")
+
+
+def get_bundle() -> Optional[GuideBundle]:
+    """Bundle hiện hành, None nếu chưa build; mmap lại khi file bundle đổi."""
+    global _bundle, _bundle_signature, _checked_at
+    checked_at = _checked_at
+    if checked_at is not None and time.monotonic() - checked_at < config['RECHECK_SECONDS']:
+        return _bundle
+    with _bundle_lock:
+        if _checked_at is not checked_at:
+            return _bundle
+        path = config['PATH']
+        try:
+            st = os.stat(path)
+            signature = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            signature = None
+        if signature != _bundle_signature:
+            bundle = None
+            if signature is not None:
+                try:
+                    bundle = GuideBundle(path)
+                    signature = bundle.signature
+                    _LOADS.inc()
+                    logging.info(f"Guide bundle mapped: {bundle.stats()}")
+                except (OSError, ValueError) as e:
+                    logging.error(f"Ignoring guide bundle {path}: {e}")
+            _bundle, _bundle_signature = bundle, signature
+        _checked_at = time.monotonic()
+        return _bundle
+
+
+def invalidate():
+    """Lần get_bundle() tiếp theo stat lại file bundle ngay (sau khi bundle vừa được build)."""
+    global _checked_at
+    with _bundle_lock:
+        _checked_at = None
+
+
+def rebuild(path: str = None) -> dict:
+    """Build bundle dưới lock "guide_bundle"; process này nạp bản mới ở lần đọc sau."""
+    with file_lock("guide_bundle"):
+        summary = build_bundle(path)
+    invalidate()
+    return summary
+
+
+def rebuild_if_present() -> Optional[dict]:
+    """Gọi sau mỗi lần trích xuất: chỉ build lại khi deployment đã dùng bundle."""
+    if os.path.exists(config['PATH']):
+        return rebuild()
+    return None
+
+
+metrics.gauge("guide_bundle_bytes", "Size of the mapped guide bundle",
+              fn=lambda: _bundle.size if _bundle is not None else 0)
+metrics.gauge("guide_bundle_images", "Images served from the mapped guide bundle",
+              fn=lambda: len(_bundle._images) if _bundle is not None else 0)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build or inspect the memory-mapped guide bundle.")
+    parser.add_argument("command", choices=("build", "status"))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "build":
+        if read_only():
+            parser.error("ARTIFACT_READ_ONLY is set; run the build on the builder process")
+        print(json.dumps(rebuild(), ensure_ascii=False, indent=2))
+        return 0
+    bundle = get_bundle()
+    status = bundle.stats() if bundle else {"path": config['PATH'], "bytes": 0}
+    if bundle:
+        status["guide_ids"] = bundle.guide_ids()
+    print(json.dumps(status, ensure_ascii=False, indent=2))
+    return 0 if bundle else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Inverted index (BM25) từ text -> guide trong registry, để tra statusMessage của thiết bị.
+
+Mỗi guide là một document gồm title, keywords, status_messages đã biết (trọng số cao)
+và text các bước. Text được bỏ dấu tiếng Việt, lower-case, tách âm tiết; thêm bigram
+âm tiết vì từ tiếng Việt thường gồm nhiều âm tiết ("định vị", "mất mạng").
+
+Index được build lúc trích xuất (process_pdf_files / trích xuất DOCX gọi rebuild())
+và ghi ra GUIDE_INDEX_PATH; process agent nạp file đó khi tra lần đầu và nạp lại khi
+file đổi. lookup() chỉ cộng điểm theo posting list của các term trong câu tra, kết quả
+được cache theo text đã chuẩn hoá.
+
+    python -m <package>.guide_index "Chưa cấp quyền vị trí cho ứng dụng"
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import logging
+import threading
+import unicodedata
+from typing import NamedTuple
+
+from . import metrics
+from .guide_registry import get_registry
+from .artifacts import artifact_path, read_only
+
+config = {
+    'PATH': os.getenv('GUIDE_INDEX_PATH') or artifact_path('guide_index.json'),
+    'K1': float(os.getenv('GUIDE_INDEX_K1', '1.2')),
+    'B': float(os.getenv('GUIDE_INDEX_B', '0.75')),
+    # Điểm tối thiểu để guide vào shortlist
+    'MIN_SCORE': float(os.getenv('GUIDE_INDEX_MIN_SCORE', '1.0')),
+}
+
+INDEX_VERSION = 1
+# Term của title/keywords/status_messages được đếm lặp lại FIELD_BOOST lần
+FIELD_BOOST = 3
+_CACHE_SIZE = 4096
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _fold_table() -> dict:
+    table = {ord("đ"): "d", ord("Đ"): "D"}
+    for code in range(0x00C0, 0x1EFF + 1):
+        char = chr(code)
+        base = unicodedata.normalize("NFD", char)[0]
+        if base != char and base.isascii():
+            table[code] = base
+    return table
+
+
+_FOLD = _fold_table()
+
+
+def fold(text: str) -> str:
+    """'Chưa bật Định vị' -> 'chua bat dinh vi'."""
+    # NFC trước: text dán từ nơi khác có thể ở dạng dấu tổ hợp
+    return unicodedata.normalize("NFC", text or "").translate(_FOLD).lower()
+
+
+def tokenize(text: str) -> list:
+    """Âm tiết + bigram âm tiết liền kề của text đã bỏ dấu."""
+    syllables = _TOKEN.findall(fold(text))
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+class Match(NamedTuple):
+    guide_id: str
+    title: str
+    score: float
+
+
+def _document_terms(entry, steps) -> dict:
+    counts = {}
+    boosted = [entry.title, *entry.keywords, *entry.status_messages]
+    for text, weight in [(t, FIELD_BOOST) for t in boosted] + [(s.get("text", ""), 1) for s in steps]:
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + weight
+    return counts
+
+
+def _sources_signature(registry) -> list:
+    signature = []
+    for entry in registry.entries():
+        path = registry.source_path(entry)
+        try:
+            st = os.stat(path)
+            signature.append([entry.id, st.st_size, st.st_mtime_ns])
+        except OSError:
+            signature.append([entry.id, None, None])
+    return signature
+
+
+def build_index(registry=None) -> dict:
+    """Index dạng JSON: documents + posting list {term: [[doc, tf], ...]}."""
+    registry = registry or get_registry()
+    documents, postings = [], {}
+    for doc, entry in enumerate(registry.entries()):
+        steps = []
+        path = registry.source_path(entry)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    steps = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Indexing {entry.id} without steps: {e}")
+        terms = _document_terms(entry, steps)
+        documents.append({"guide_id": entry.id, "title": entry.title, "length": sum(terms.values())})
+        for term, tf in terms.items():
+            postings.setdefault(term, []).append([doc, tf])
+    return {
+        "version": INDEX_VERSION,
+        "sources": _sources_signature(registry),
+        "documents": documents,
+        "postings": postings,
+    }
+
+
+class GuideIndex:
+    """Index đã nạp: idf và độ dài document được tính sẵn."""
+
+    def __init__(self, data: dict, k1: float = None, b: float = None):
+        k1 = config['K1'] if k1 is None else k1
+        b = config['B'] if b is None else b
+        self.documents = [(d["guide_id"], d["title"]) for d in data["documents"]]
+        lengths = [d["length"] for d in data["documents"]]
+        avgdl = (sum(lengths) / len(lengths)) if lengths else 1.0
+        n = len(self.documents)
+        # Phần mẫu BM25 chỉ phụ thuộc document: tính trước một lần
+        norms = [k1 * (1 - b + b * length / (avgdl or 1.0)) for length in lengths]
+        self.postings = {}
+        for term, posting in data["postings"].items():
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            self.postings[term] = tuple(
+                (doc, idf * tf * (k1 + 1) / (tf + norms[doc])) for doc, tf in posting)
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def lookup(self, text: str, limit: int = 3, min_score: float = None) -> list:
+        min_score = config['MIN_SCORE'] if min_score is None else min_score
+        key = (" ".join(_TOKEN.findall(fold(text))), limit, min_score)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        scores = {}
+        for term in set(tokenize(key[0])):
+            for doc, weight in self.postings.get(term, ()):
+                scores[doc] = scores.get(doc, 0.0) + weight
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        result = [Match(*self.documents[doc], round(score, 3))
+                  for doc, score in ranked[:limit] if score >= min_score]
+
+        with self._cache_lock:
+            if len(self._cache) >= _CACHE_SIZE:
+                self._cache.clear()
+            self._cache[key] = result
+        return result
+
+
+_LOOKUPS = metrics.counter("guide_index_lookups_total", "Guide index lookups by outcome", ("outcome",))
+_LOOKUP_SECONDS = metrics.histogram(
+    "guide_index_lookup_seconds", "Guide index lookup latency",
+    buckets=(0.000005, 0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005))
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def rebuild(path: str = None) -> dict:
+    """Build index từ registry và ghi ra file (gọi sau mỗi lần trích xuất)."""
+    path = path or config['PATH']
+    data = build_index()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    logging.info(f"Guide index rebuilt: {len(data['documents'])} guides, {len(data['postings'])} terms")
+    return data
+
+
+def get_index() -> GuideIndex:
+    """Index hiện hành; nạp lại khi file index đổi, build nếu chưa có hoặc khác version."""
+    global _index, _index_mtime
+    path = config['PATH']
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    if _index is not None and mtime == _index_mtime:
+        return _index
+
+    with _index_lock:
+        if _index is not None and mtime == _index_mtime:
+            return _index
+        data = None
+        if mtime is not None:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Rebuilding unreadable guide index {path}: {e}")
+        # File guide đổi mà chưa build lại (sửa tay, manifest mới): build lại lúc nạp
+        if (data is None or data.get("version") != INDEX_VERSION
+                or data.get("sources") != _sources_signature(get_registry())):
+            try:
+                if read_only():
+                    # Worker chỉ đọc: index của builder chưa có/cũ thì dùng bản build trong bộ nhớ
+                    raise PermissionError("ARTIFACT_READ_ONLY")
+                data = rebuild(path)
+            except OSError as e:
+                # Thư mục agent chỉ đọc: vẫn dùng index trong bộ nhớ
+                logging.warning(f"Could not write guide index {path}: {e}")
+                data = build_index()
+            mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        _index, _index_mtime = GuideIndex(data), mtime
+        return _index
+
+
+def lookup(text: str, limit: int = 3) -> list:
+    """Shortlist [Match] các guide khớp text (statusMessage), điểm giảm dần."""
+    started = time.perf_counter()
+    result = get_index().lookup(text, limit) if text and text.strip() else []
+    _LOOKUP_SECONDS.observe(time.perf_counter() - started)
+    _LOOKUPS.inc(outcome="match" if result else "no_match")
+    return result
+
+
+if __name__ == "__main__":
+    for match in lookup(" ".join(sys.argv[1:]), limit=5):
+        print(f"{match.score:>8.3f}  {match.guide_id:<24} {match.title}")
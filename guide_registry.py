@@ -0,0 +1,275 @@
+"""
+Registry các hướng dẫn (guide) theo manifest, nạp lười và giới hạn bộ nhớ theo LRU.
+
+Mỗi guide là một file JSON các bước (định dạng output của _extract_docx_data / batch_extract:
+[{"step_number", "text", "image_path", ...}]). Guide mặc định là 3 guide có sẵn
+(định vị iOS/Android từ Location_Instruction.pdf, tải app Hộ Nghèo). Manifest
+GUIDE_MANIFEST (mặc định guides.json cạnh agent) thêm hoặc ghi đè guide:
+
+    {"guides": [
+        {"id": "network_reset", "title": "Khắc phục lỗi mất mạng",
+         "source": "network_reset.json", "docx": "NETWORK_RESET.docx",
+         "images_dir": "network_reset_images", "layout": "location", "image_width": 300,
+         "keywords": ["mất mạng", "không có sóng"], "status_messages": ["Lỗi mạng"]}
+    ]}
+
+"docx" tương đối tính từ thư mục agent; "source" và "images_dir" là artifact, tính từ
+ARTIFACT_DIR (xem artifacts.py). Nếu "source" chưa có mà có "docx" thì tool get_guide
+trích xuất DOCX trước (xem tools.py).
+
+Guide được compile một lần khi dùng lần đầu thành tuple các Step (__slots__, string
+đã intern), rồi giữ trong LRU với ngân sách GUIDE_MEMORY_BUDGET_MB. File nguồn đổi
+(size/mtime) thì lần đọc sau compile lại.
+"""
+import os
+import sys
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from . import metrics
+from .artifacts import artifact_dir
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+config = {
+    'MANIFEST': os.getenv('GUIDE_MANIFEST', os.path.join(PACKAGE_DIR, 'guides.json')),
+    'MEMORY_BUDGET_BYTES': int(float(os.getenv('GUIDE_MEMORY_BUDGET_MB', '16')) * 1024 * 1024),
+}
+
+
+class GuideEntry(NamedTuple):
+    id: str
+    title: str
+    source: str
+    # "location": "Bước N: text" + ảnh width 300; "app": instruction + ảnh width 100 (xem render.py)
+    layout: str = "location"
+    image_width: int = 300
+    docx: Optional[str] = None
+    images_dir: Optional[str] = None
+    keywords: tuple = ()
+    # statusMessage đã biết của thiết bị ứng với guide này (xem guide_index.py)
+    status_messages: tuple = ()
+    builtin: bool = False
+
+
+_LOCATION_STATUS_MESSAGES = (
+    "Không lấy được vị trí", "GPS bị tắt", "Chưa bật định vị",
+    "Chưa cấp quyền vị trí cho ứng dụng", "Location permission denied",
+)
+
+DEFAULT_GUIDES = (
+    GuideEntry("location_ios", "Bật định vị trên iPhone/iPad", "ios_instructions.json",
+               keywords=("định vị", "vị trí", "gps", "iphone"),
+               status_messages=_LOCATION_STATUS_MESSAGES, builtin=True),
+    GuideEntry("location_android", "Bật định vị trên Android", "android_instructions.json",
+               keywords=("định vị", "vị trí", "gps", "android"),
+               status_messages=_LOCATION_STATUS_MESSAGES, builtin=True),
+    GuideEntry("app_download", "Tải và cài app Quản lý Hộ Nghèo", "help_rasoathongheo_ai.json",
+               layout="app", image_width=100, docx="HELP_RASOATHONGHEO_AI.docx",
+               images_dir="extracted_images", keywords=("tải app", "cài đặt app", "hộ nghèo"),
+               status_messages=("Chưa cài ứng dụng Hộ Nghèo", "Không tìm thấy ứng dụng",
+                                "Ứng dụng cần cập nhật phiên bản mới"), builtin=True),
+)
+
+
+class Step:
+    """Một bước đã compile; text/image_path được intern để các guide dùng chung string."""
+    __slots__ = ("number", "text", "image_path")
+
+    def __init__(self, number, text, image_path):
+        self.number = number
+        self.text = text
+        self.image_path = image_path
+
+
+class CompiledGuide:
+    __slots__ = ("entry", "steps", "nbytes", "signature")
+
+    def __init__(self, entry: GuideEntry, steps: tuple, nbytes: int, signature: tuple):
+        self.entry = entry
+        self.steps = steps
+        self.nbytes = nbytes
+        self.signature = signature
+
+
+def _resolve(path: Optional[str], base_dir: str) -> Optional[str]:
+    if not path:
+        return path
+    return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+
+def _intern(value) -> str:
+    return sys.intern(value) if isinstance(value, str) else ""
+
+
+def load_manifest(path: str = None) -> list:
+    """Guide mặc định + guide trong manifest (cùng id thì manifest thắng)."""
+    entries = {entry.id: entry for entry in DEFAULT_GUIDES}
+    path = path or config['MANIFEST']
+    if not os.path.exists(path):
+        return list(entries.values())
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.error(f"Ignoring unreadable guide manifest {path}: {e}")
+        return list(entries.values())
+
+    for item in raw.get("guides", []):
+        if not item.get("id") or not item.get("source"):
+            logging.warning(f"Skipping guide manifest entry without id/source: {item}")
+            continue
+        entries[item["id"]] = GuideEntry(
+            id=item["id"],
+            title=item.get("title", item["id"]),
+            source=item["source"],
+            layout=item.get("layout", "location"),
+            image_width=int(item.get("image_width", 100 if item.get("layout") == "app" else 300)),
+            docx=item.get("docx"),
+            images_dir=item.get("images_dir"),
+            keywords=tuple(item.get("keywords", ())),
+            status_messages=tuple(item.get("status_messages", ())),
+        )
+    return list(entries.values())
+
+
+def compile_steps(raw_steps: list) -> tuple:
+    return tuple(
+        Step(step.get("step_number"), _intern((step.get("text") or "").strip()), _intern(step.get("image_path") or ""))
+        for step in raw_steps
+    )
+
+
+def _estimate_bytes(steps: tuple) -> int:
+    """Byte xấp xỉ của guide: object Step + string (string intern dùng chung chỉ tính một lần)."""
+    seen = set()
+    total = sys.getsizeof(steps)
+    for step in steps:
+        total += sys.getsizeof(step)
+        for value in (step.text, step.image_path):
+            if id(value) not in seen:
+                seen.add(id(value))
+                total += sys.getsizeof(value)
+    return total
+
+
+def _signature(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st.st_size, st.st_mtime_ns)
+
+
+_LOADS = metrics.counter("guide_registry_loads_total", "Guides compiled from their source JSON", ("guide",))
+_EVICTIONS = metrics.counter("guide_registry_evictions_total", "Guides evicted under the memory budget", ("guide",))
+
+
+class GuideRegistry:
+    def __init__(self, entries=(), budget_bytes: int = None):
+        self.budget_bytes = config['MEMORY_BUDGET_BYTES'] if budget_bytes is None else budget_bytes
+        self._entries = {entry.id: entry for entry in entries}
+        self._resident = OrderedDict()  # id -> CompiledGuide, cũ nhất trước
+        self._resident_bytes = 0
+        self._lock = threading.RLock()
+
+    def entries(self) -> list:
+        return list(self._entries.values())
+
+    def entry(self, guide_id: str) -> Optional[GuideEntry]:
+        return self._entries.get(guide_id)
+
+    def register(self, entry: GuideEntry):
+        with self._lock:
+            self._entries[entry.id] = entry
+            self._drop(entry.id)
+
+    def source_path(self, entry: GuideEntry) -> str:
+        return _resolve(entry.source, artifact_dir())
+
+    def docx_path(self, entry: GuideEntry) -> Optional[str]:
+        return _resolve(entry.docx, PACKAGE_DIR)
+
+    def get(self, guide_id: str, source: str = None) -> Optional[CompiledGuide]:
+        """Guide đã compile; None nếu id lạ hoặc file nguồn chưa có.
+
+        source ghi đè đường dẫn JSON của entry (tools dùng cho đường dẫn tính lúc chạy).
+        """
+        entry = self._entries.get(guide_id)
+        if entry is None:
+            return None
+        path = source or self.source_path(entry)
+        signature = _signature(path)
+        if signature is None:
+            return None
+
+        with self._lock:
+            guide = self._resident.get(guide_id)
+            if guide is not None and guide.signature == signature:
+                self._resident.move_to_end(guide_id)
+                return guide
+
+        # Compile ngoài lock: request đồng thời cho guide khác không phải chờ json.load
+        with open(path, 'r', encoding='utf-8') as f:
+            steps = compile_steps(json.load(f))
+        guide = CompiledGuide(entry, steps, _estimate_bytes(steps), signature)
+        _LOADS.inc(guide=guide_id)
+
+        with self._lock:
+            self._drop(guide_id)
+            self._resident[guide_id] = guide
+            self._resident_bytes += guide.nbytes
+            self._evict(keep=guide_id)
+        return guide
+
+    def _drop(self, guide_id: str):
+        guide = self._resident.pop(guide_id, None)
+        if guide is not None:
+            self._resident_bytes -= guide.nbytes
+
+    def _evict(self, keep: str):
+        # Guide vừa nạp luôn được giữ, kể cả khi một mình nó vượt ngân sách
+        while self._resident_bytes > self.budget_bytes and len(self._resident) > 1:
+            guide_id = next(iter(self._resident))
+            if guide_id == keep:
+                self._resident.move_to_end(guide_id)
+                continue
+            self._drop(guide_id)
+            _EVICTIONS.inc(guide=guide_id)
+            logging.info(f"Evicted guide {guide_id} (resident {self._resident_bytes} bytes)")
+
+    def resident(self) -> dict:
+        with self._lock:
+            return {guide_id: guide.nbytes for guide_id, guide in self._resident.items()}
+
+    def resident_bytes(self) -> int:
+        return self._resident_bytes
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> GuideRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = GuideRegistry(load_manifest())
+        return _registry
+
+
+def reload_manifest() -> GuideRegistry:
+    """Đọc lại manifest (guide đang nạp bị bỏ, nạp lại khi dùng)."""
+    global _registry
+    with _registry_lock:
+        _registry = GuideRegistry(load_manifest())
+        return _registry
+
+
+metrics.gauge("guide_registry_resident_bytes", "Estimated bytes of compiled guides held in memory",
+              fn=lambda: get_registry().resident_bytes())
+metrics.gauge("guide_registry_resident_guides", "Compiled guides held in memory",
+              fn=lambda: len(get_registry().resident()))
@@ -0,0 +1,851 @@
+"""
+HTTP server nội bộ phục vụ ảnh hướng dẫn trong phiên chat.
+
+Mặc định chạy ở chế độ "threaded": HTTP/1.1 keep-alive, mỗi connection một thread riêng
+(tối đa IMAGE_SERVER_MAX_CONNECTIONS), nên client chậm hay connection keep-alive đang rảnh
+không chặn ảnh của người dùng khác.
+Chế độ "single" giữ hành vi cũ (socketserver.TCPServer, HTTP/1.0, từng request một).
+
+Cấu hình qua biến môi trường:
+    IMAGE_SERVER_MODE=threaded|single
+    IMAGE_SERVER_WORKERS=16               # số request được xử lý đồng thời
+    IMAGE_SERVER_MAX_CONNECTIONS=64       # số connection mở tối đa (vượt quá -> 503)
+    IMAGE_SERVER_KEEPALIVE_TIMEOUT=15     # giây chờ request tiếp theo trên connection rảnh
+    IMAGE_CACHE_BYTES=33554432            # dung lượng tối đa của LRU cache cho ảnh hay dùng
+    IMAGE_CACHE_MAX_ITEM_BYTES=1048576    # ảnh lớn hơn luôn gửi bằng sendfile
+
+Nhiều worker process (xem artifacts.py):
+    IMAGE_BASE_URL=https://img.example.vn   # ảnh do server ngoài phục vụ, worker không mở port
+    IMAGE_SERVER_PORT=8765                  # mọi worker dùng chung một image server trên port này:
+                                            # worker bind được thì phục vụ, các worker khác dùng lại
+    python -m <tên thư mục agent>.image_server --port 8765   # chạy image server thành process riêng
+
+Server phục vụ ảnh trong ARTIFACT_DIR; khi có guide bundle (guide_bundle.py) thì ảnh
+có trong bundle được trả thẳng từ mmap.
+"""
+import os
+import time
+import atexit
+import socket
+import hashlib
+import logging
+import email.utils
+import json
+import threading
+import urllib.parse
+import urllib.request
+import argparse
+from collections import OrderedDict
+import http.server
+import socketserver
+
+from . import metrics
+from .image_variants import IMAGE_FOLDERS, webp_path
+from .artifacts import artifact_dir
+from .guide_bundle import get_bundle
+from .guide_registry import get_registry
+
+config = {
+    'MODE': os.getenv('IMAGE_SERVER_MODE', 'threaded'),
+    'WORKERS': int(os.getenv('IMAGE_SERVER_WORKERS', '16')),
+    'MAX_CONNECTIONS': int(os.getenv('IMAGE_SERVER_MAX_CONNECTIONS', '64')),
+    'KEEPALIVE_TIMEOUT': float(os.getenv('IMAGE_SERVER_KEEPALIVE_TIMEOUT', '15')),
+    'CACHE_BYTES': int(os.getenv('IMAGE_CACHE_BYTES', str(32 * 1024 * 1024))),
+    'CACHE_MAX_ITEM_BYTES': int(os.getenv('IMAGE_CACHE_MAX_ITEM_BYTES', str(1024 * 1024))),
+    'BASE_URL': os.getenv('IMAGE_BASE_URL', '').rstrip('/'),
+    'PORT': int(os.getenv('IMAGE_SERVER_PORT')) if os.getenv('IMAGE_SERVER_PORT') else None,
+}
+
+PORT_RANGE = range(8765, 8775)
+
+# Image Server Globals
+_image_server = None
+_image_server_port = None
+_image_server_thread = None
+_server_lock = threading.Lock()
+# Port của image server dùng chung do process khác chạy (IMAGE_SERVER_PORT)
+_shared_port = None
+_shared_checked_at = 0.0
+SHARED_RECHECK_SECONDS = 30.0
+
+
+def _get_mime_type(filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    return {
+        '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
+        '.png': 'image/png', '.gif': 'image/gif',
+        '.bmp': 'image/bmp', '.webp': 'image/webp'
+    }.get(ext, 'image/jpeg')
+
+def _accepts_webp(accept_header: str) -> bool:
+    """True nếu Accept header liệt kê image/webp với q > 0 (bỏ qua */* để an toàn với client cũ)."""
+    for media_range in (accept_header or "").split(','):
+        parts = [p.strip() for p in media_range.split(';')]
+        if parts[0].lower() != 'image/webp':
+            continue
+        for param in parts[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+_SKIP_DIRS = {'__pycache__', 'venv', '.venv', 'node_modules', 'benchmarks', 'tests'}
+# Thư mục ảnh theo quy ước "<id>_images" (guide trong manifest, batch_extract.py)
+IMAGE_DIR_SUFFIX = "_images"
+
+
+def image_roots() -> set:
+    """Thư mục cấp 1 của ARTIFACT_DIR được index: IMAGE_FOLDERS và images_dir của guide trong manifest."""
+    roots = set(IMAGE_FOLDERS)
+    for entry in get_registry().entries():
+        images_dir = (entry.images_dir or f"{entry.id}{IMAGE_DIR_SUFFIX}").replace('\\', '/')
+        roots.add(images_dir.strip('/').split('/', 1)[0])
+    return roots
+
+
+class PathIndex:
+    """
+    Index URL path -> file ảnh tuyệt đối, build một lần thay vì stat nhiều thư mục mỗi request.
+
+    - by_relpath: "IOS_Instruction/1.jpg" -> path tuyệt đối
+    - by_name: "1.jpg" -> path tuyệt đối; khi trùng tên, ưu tiên theo thứ tự IMAGE_FOLDERS
+      (IOS_Instruction, Android_Instruction, extracted_images) rồi tới relpath theo alphabet.
+    Chỉ file ảnh trong thư mục ảnh được index: thư mục cấp 1 phải nằm trong roots() (mặc định
+    image_roots()) hoặc có tên "*_images". Ảnh khác trong thư mục agent (demo_*.png,
+    benchmarks/fixtures/...) và các file không phải ảnh (.env, .py) không bị phục vụ.
+    """
+
+    def __init__(self, base_dir, priority_folders=IMAGE_FOLDERS, max_depth=4, miss_refresh_interval=5.0,
+                 roots=image_roots):
+        self.base_dir = base_dir
+        self.roots = roots
+        self.priority_folders = tuple(priority_folders)
+        self.max_depth = max_depth
+        self.miss_refresh_interval = miss_refresh_interval
+        self._by_relpath = {}
+        self._by_name = {}
+        self._paths = frozenset()
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self.ambiguous_names = 0
+
+    def _walk(self, directory, rel_prefix, depth, out, roots=None):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            rel = f"{rel_prefix}{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                if roots is not None and entry.name not in roots and not entry.name.endswith(IMAGE_DIR_SUFFIX):
+                    continue
+                if depth < self.max_depth and entry.name not in _SKIP_DIRS:
+                    self._walk(entry.path, rel + "/", depth + 1, out)
+            elif roots is None and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                out[rel] = os.path.abspath(entry.path)
+
+    def _name_priority(self, rel):
+        top = rel.split('/', 1)[0]
+        rank = self.priority_folders.index(top) if top in self.priority_folders else len(self.priority_folders)
+        return (rank, rel)
+
+    def refresh(self):
+        """Build lại index (gọi sau khi trích xuất ghi ảnh mới)."""
+        by_relpath = {}
+        # Cấp 1: chỉ vào thư mục ảnh, bỏ qua file ảnh nằm thẳng trong ARTIFACT_DIR
+        self._walk(self.base_dir, "", 0, by_relpath, roots=set(self.roots()))
+        by_name = {}
+        ambiguous = 0
+        for rel in sorted(by_relpath, key=self._name_priority):
+            name = rel.rsplit('/', 1)[-1]
+            if name in by_name:
+                ambiguous += 1
+                logging.debug(f"Ambiguous image name {name}: using {by_name[name]}, ignoring {rel}")
+                continue
+            by_name[name] = by_relpath[rel]
+        with self._lock:
+            self._by_relpath, self._by_name = by_relpath, by_name
+            self._paths = frozenset(by_relpath.values())
+            self._built_at = time.monotonic()
+            self.ambiguous_names = ambiguous
+        return len(by_relpath)
+
+    def _lookup(self, rel, by_name):
+        path = self._by_relpath.get(rel)
+        if path is None and by_name:
+            path = self._by_name.get(rel.rsplit('/', 1)[-1])
+        return path
+
+    def resolve(self, clean_path, by_name=True):
+        """URL path (đã unquote) -> path tuyệt đối hoặc None; by_name=False chỉ nhận relpath khớp đúng."""
+        rel = clean_path.replace('\\', '/')
+        path = self._lookup(rel, by_name)
+        # Ảnh được ghi bởi process khác (batch_extract.py, process_docx.py): refresh có giới hạn tần suất
+        if path is None and time.monotonic() - self._built_at >= self.miss_refresh_interval:
+            self.refresh()
+            path = self._lookup(rel, by_name)
+        return path
+
+    def items(self) -> list:
+        """[(relpath, path tuyệt đối)] theo thứ tự ưu tiên khi tra theo tên file."""
+        return sorted(self._by_relpath.items(), key=lambda item: self._name_priority(item[0]))
+
+    def contains(self, path) -> bool:
+        return path in self._paths
+
+    def __len__(self):
+        return len(self._by_relpath)
+
+
+_path_index = PathIndex(artifact_dir())
+
+
+def refresh_path_index() -> int:
+    """Build lại index ảnh; trả về số file đã index."""
+    return _path_index.refresh()
+
+
+class _CacheEntry:
+    __slots__ = ('mtime_ns', 'size', 'headers', 'body')
+
+    def __init__(self, mtime_ns, size, headers, body):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.headers = headers
+        self.body = body
+
+
+class BodyCache:
+    """
+    LRU cache (giới hạn theo bytes) lưu sẵn header + body của ảnh hay được request.
+    Ảnh chỉ được đưa vào cache từ lần request thứ hai, nên ảnh "lạnh" đi đường sendfile.
+    Entry bị bỏ khi mtime/size của file thay đổi.
+    """
+
+    def __init__(self, max_bytes, max_item_bytes, seen_limit=4096):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._entries = OrderedDict()
+        self._seen = OrderedDict()
+        self._seen_limit = seen_limit
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, st):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def should_admit(self, key, size) -> bool:
+        """True nếu file đủ nhỏ và đã được request trước đó."""
+        if size > self.max_item_bytes or size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._seen:
+                del self._seen[key]
+                return True
+            self._seen[key] = None
+            if len(self._seen) > self._seen_limit:
+                self._seen.popitem(last=False)
+            return False
+
+    def put(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.current_bytes += len(entry.headers) + len(entry.body)
+            while self.current_bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._seen.clear()
+            self.current_bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.current_bytes -= len(entry.headers) + len(entry.body)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_body_cache = BodyCache(config['CACHE_BYTES'], config['CACHE_MAX_ITEM_BYTES'])
+_served_stats = {"bytes_served": 0, "cache_responses": 0, "sendfile_responses": 0, "bundle_responses": 0,
+                 "not_modified_responses": 0}
+_served_stats_lock = threading.Lock()
+
+
+def _count_served(kind: str, nbytes: int):
+    with _served_stats_lock:
+        _served_stats[kind] += 1
+        _served_stats["bytes_served"] += nbytes
+
+
+_started_at = time.time()
+_REQUESTS = metrics.counter(
+    "image_server_requests_total", "Image server requests by HTTP status", ("status",))
+_LATENCY = metrics.histogram(
+    "image_server_request_duration_seconds", "Time from request line received to response sent")
+_IN_FLIGHT = metrics.gauge(
+    "image_server_in_flight_connections", "Client connections currently open")
+metrics.counter("image_server_bytes_sent_total", "Response body bytes sent",
+                fn=lambda: _served_stats["bytes_served"])
+metrics.counter("image_server_responses_total", "Responses by send path", ("path",),
+                fn=lambda: {k[:-len("_responses")]: v for k, v in _served_stats.items() if k.endswith("_responses")})
+metrics.counter("image_cache_hits_total", "Body cache hits", fn=lambda: _body_cache.hits)
+metrics.counter("image_cache_misses_total", "Body cache misses", fn=lambda: _body_cache.misses)
+metrics.counter("image_cache_evictions_total", "Body cache evictions", fn=lambda: _body_cache.evictions)
+metrics.gauge("image_cache_bytes", "Bytes held by the body cache", fn=lambda: _body_cache.current_bytes)
+metrics.gauge("image_cache_max_bytes", "Body cache byte budget", fn=lambda: _body_cache.max_bytes)
+metrics.gauge("image_server_indexed_images", "Image files in the path index", fn=lambda: len(_path_index))
+
+
+def get_server_stats() -> dict:
+    """Counters của image server: cache hit ratio, bytes đã gửi, số response theo đường gửi."""
+    with _served_stats_lock:
+        stats = dict(_served_stats)
+    stats["cache"] = _body_cache.stats()
+    return stats
+
+
+_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_REVALIDATE_CACHE_CONTROL = "no-cache"
+_file_etags = {}
+_file_etags_lock = threading.Lock()
+
+
+def _content_etag(file_path, st) -> str:
+    """Strong ETag từ sha256 nội dung file, tính lại chỉ khi mtime/size thay đổi."""
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _file_etags.get(file_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    etag = h.hexdigest()[:16]
+    with _file_etags_lock:
+        if len(_file_etags) > 10000:
+            _file_etags.clear()
+        _file_etags[file_path] = (key, etag)
+    return etag
+
+
+def content_version(file_path: str):
+    """Version (hash nội dung) dùng cho URL dạng ?v=..., hoặc None nếu file không tồn tại."""
+    try:
+        return _content_etag(file_path, os.stat(file_path))
+    except OSError:
+        return None
+
+
+def _parse_range(range_header: str, size: int):
+    """
+    Parse 'bytes=start-end' (một range). Trả về (start, end) inclusive, None nếu bỏ qua
+    header (không hợp lệ / nhiều range -> trả toàn bộ file), hoặc False nếu không thỏa mãn được.
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if first == '':
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            return (max(0, size - suffix), size - 1) if size else False
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class ImageHandler(http.server.SimpleHTTPRequestHandler):
+    # HTTP/1.1 để browser giữ connection cho 5-8 ảnh của một trang hướng dẫn
+    protocol_version = "HTTP/1.1"
+    timeout = config['KEEPALIVE_TIMEOUT']
+    # Header và body được gửi bằng 2 lần write; tắt Nagle để tránh delay ~40ms trên keep-alive
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        _IN_FLIGHT.inc()
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            _IN_FLIGHT.dec()
+
+    def handle_one_request(self):
+        self._request_started = None
+        self._response_status = None
+        self._request_slot = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._request_slot is not None:
+                self._request_slot.release()
+        # /metrics và /healthz không tính vào số liệu request ảnh
+        if self._request_started is not None and self._response_status is not None:
+            _REQUESTS.inc(status=self._response_status)
+            _LATENCY.observe(time.perf_counter() - self._request_started)
+
+    def parse_request(self):
+        # Chỉ chiếm slot xử lý khi request đã tới: connection rảnh chờ request kế tiếp thì không
+        slots = getattr(self.server, 'request_slots', None)
+        if slots is not None:
+            slots.acquire()
+            self._request_slot = slots
+        self._request_started = time.perf_counter()
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self._response_status = code
+        super().send_response(code, message)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _send_internal(self, content_type, body: bytes, send_body):
+        super().send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _serve(self, send_body):
+        try:
+            parsed = urllib.parse.urlparse(self.path)
+            if parsed.path == '/metrics':
+                self._request_started = None
+                self._send_internal('text/plain; version=0.0.4; charset=utf-8',
+                                    metrics.render_prometheus().encode('utf-8'), send_body)
+                return
+            if parsed.path == '/healthz':
+                self._request_started = None
+                health = {
+                    "status": "ok",
+                    "port": self.server.server_address[1],
+                    "uptime_seconds": round(time.time() - _started_at, 1),
+                    "indexed_images": len(_path_index),
+                    "artifact_dir": _path_index.base_dir,
+                    "bundle": get_bundle() is not None,
+                }
+                self._send_internal('application/json', json.dumps(health).encode('utf-8'), send_body)
+                return
+
+            clean_path = urllib.parse.unquote(parsed.path).lstrip('/')
+
+            # Prevent directory traversal
+            if '..' in clean_path or clean_path.startswith('/'):
+                 self.send_error(403, "Forbidden")
+                 return
+
+            version = urllib.parse.parse_qs(parsed.query).get('v')
+            # Relpath khớp đúng (bundle rồi tới đĩa) trước, tra theo tên file sau: ảnh ghi sau lần
+            # build bundle (batch_extract.py...) không bị thay bằng ảnh cùng tên trong bundle
+            bundle = get_bundle()
+            image = bundle.resolve_image(clean_path, by_name=False) if bundle is not None else None
+            file_path = None
+            if image is None:
+                file_path = _path_index.resolve(clean_path, by_name=False)
+                if file_path is None and bundle is not None:
+                    image = bundle.resolve_image(clean_path)
+            if image is not None:
+                immutable = bool(version) and version[0] == image.etag
+                webp = bundle.image(webp_path(image.rel)) if image.rel.lower().endswith(('.jpg', '.jpeg')) else None
+                if webp is not None and _accepts_webp(self.headers.get('Accept')):
+                    image = webp
+                self._send_bundled(bundle, image, vary_accept=webp is not None, immutable=immutable,
+                                   send_body=send_body)
+                return
+
+            if file_path is None:
+                file_path = _path_index.resolve(clean_path)
+            if file_path is None:
+                self.send_error(404, "File not found")
+                return
+
+            # URL có version (?v=<hash>) khớp nội dung hiện tại -> browser cache vĩnh viễn
+            immutable = bool(version) and version[0] == content_version(file_path)
+
+            # Format negotiation: WebP đã được tạo sẵn lúc trích xuất
+            has_webp = file_path.lower().endswith(('.jpg', '.jpeg')) and _path_index.contains(webp_path(file_path))
+            if has_webp and _accepts_webp(self.headers.get('Accept')):
+                file_path = webp_path(file_path)
+            try:
+                self._send_file(file_path, vary_accept=has_webp, immutable=immutable, send_body=send_body)
+            except FileNotFoundError:
+                # File bị xóa sau khi index được build
+                _path_index.refresh()
+                self.send_error(404, "File not found")
+        except Exception:
+            logging.exception(f"Image server error for {self.path}")
+            self.send_error(500, "Server Error")
+
+    def _validator_headers(self, etag, st, vary_accept, immutable) -> list:
+        lines = [
+            f'ETag: "{etag}"',
+            f"Last-Modified: {self.date_time_string(int(st.st_mtime))}",
+            f"Cache-Control: {_IMMUTABLE_CACHE_CONTROL if immutable else _REVALIDATE_CACHE_CONTROL}",
+        ]
+        if vary_accept:
+            lines.append("Vary: Accept")
+        return lines
+
+    def _entity_headers(self, file_path, etag, st, vary_accept, immutable) -> bytes:
+        """Header chung cho 200/206 (Content-Length được thêm riêng cho từng response)."""
+        lines = [
+            f"Content-Type: {_get_mime_type(file_path)}",
+            "Accept-Ranges: bytes",
+            "Access-Control-Allow-Origin: *",
+        ] + self._validator_headers(etag, st, vary_accept, immutable)
+        return ("\r\n".join(lines) + "\r\n").encode('latin-1')
+
+    def _send_prebuilt_headers(self, code, entity_headers: bytes, extra=()):
+        self.send_response(code)
+        # Header đã build sẵn được nối thẳng vào buffer, end_headers() flush một lần
+        self._headers_buffer.append(entity_headers)
+        for keyword, value in extra:
+            self.send_header(keyword, value)
+        self.end_headers()
+
+    def _is_not_modified(self, etag, st) -> bool:
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-None-Match được ưu tiên hơn If-Modified-Since (RFC 9110)
+            tags = [t.strip() for t in if_none_match.split(',')]
+            return '*' in tags or any(t.removeprefix('W/') == f'"{etag}"' for t in tags)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since is not None:
+                return int(st.st_mtime) <= since.timestamp()
+        return False
+
+    def _requested_range(self, etag, st):
+        range_header = self.headers.get('Range')
+        if not range_header:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range.strip() != f'"{etag}"' and if_range.strip() != self.date_time_string(int(st.st_mtime)):
+            return None
+        return _parse_range(range_header, st.st_size)
+
+    def _send_not_modified(self, etag, st, vary_accept, immutable) -> bool:
+        if not self._is_not_modified(etag, st):
+            return False
+        headers = ("\r\n".join(self._validator_headers(etag, st, vary_accept, immutable)) + "\r\n").encode('latin-1')
+        self._send_prebuilt_headers(304, headers)
+        _count_served("not_modified_responses", 0)
+        return True
+
+    def _start_body_response(self, etag, st, entity_headers):
+        """Gửi header 200/206 (hoặc 416); trả về (start, length) của body cần gửi, None nếu 416."""
+        size = st.st_size
+        byte_range = self._requested_range(etag, st)
+        if byte_range is False:
+            self._send_prebuilt_headers(416, entity_headers, [
+                ('Content-Range', f"bytes */{size}"), ('Content-Length', '0')])
+            return None
+        if byte_range:
+            start, end = byte_range
+            self._send_prebuilt_headers(206, entity_headers, [
+                ('Content-Range', f"bytes {start}-{end}/{size}"), ('Content-Length', str(end - start + 1))])
+        else:
+            start, end = 0, size - 1
+            self._send_prebuilt_headers(200, entity_headers, [('Content-Length', str(size))])
+        return start, end - start + 1
+
+    def _send_bundled(self, bundle, image, vary_accept=False, immutable=False, send_body=True):
+        """Ảnh trong guide bundle: body là slice của mmap, không open/stat file."""
+        if self._send_not_modified(image.etag, image, vary_accept, immutable):
+            return
+        body = self._start_body_response(
+            image.etag, image, self._entity_headers(image.rel, image.etag, image, vary_accept, immutable))
+        if body is not None and send_body and body[1] > 0:
+            start, length = body
+            self.wfile.write(bundle.body(image)[start:start + length])
+            _count_served("bundle_responses", length)
+
+    def _send_file(self, file_path, vary_accept=False, immutable=False, send_body=True):
+        st = os.stat(file_path)
+        etag = _content_etag(file_path, st)
+
+        if self._send_not_modified(etag, st, vary_accept, immutable):
+            return
+
+        key = (file_path, vary_accept, immutable)
+        entry = _body_cache.get(key, st)
+        if entry is None and send_body and _body_cache.should_admit(key, st.st_size):
+            with open(file_path, 'rb') as f:
+                body = f.read()
+            entry = _CacheEntry(st.st_mtime_ns, st.st_size,
+                                self._entity_headers(file_path, etag, st, vary_accept, immutable), body)
+            _body_cache.put(key, entry)
+        entity_headers = entry.headers if entry is not None else \
+            self._entity_headers(file_path, etag, st, vary_accept, immutable)
+
+        if entry is not None:
+            body = self._start_body_response(etag, st, entity_headers)
+            if body is not None and send_body:
+                start, length = body
+                self.wfile.write(memoryview(entry.body)[start:start + length])
+                _count_served("cache_responses", length)
+            return
+
+        # Ảnh lạnh hoặc lớn: zero-copy từ page cache ra socket (socket.sendfile tự
+        # fallback sang send() trên nền tảng không có os.sendfile, ví dụ Windows)
+        with open(file_path, 'rb') as f:
+            body = self._start_body_response(etag, st, entity_headers)
+            if body is not None and send_body and body[1] > 0:
+                start, length = body
+                sent = self.connection.sendfile(f, start, length)
+                _count_served("sendfile_responses", sent)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _SingleThreadImageHandler(ImageHandler):
+    # TCPServer chỉ xử lý một connection tại một thời điểm, không giữ keep-alive
+    protocol_version = "HTTP/1.0"
+    timeout = None
+
+
+class ThreadedImageServer(http.server.HTTPServer):
+    """
+    HTTPServer xử lý mỗi connection trên một thread riêng: connection keep-alive đang rảnh
+    chỉ giữ thread của nó, không chặn client khác. Số connection mở đồng thời bị giới hạn
+    bởi max_connections (vượt quá trả 503 ngay); số request được xử lý cùng lúc (đọc file,
+    gửi body) giới hạn bởi max_workers (xem ImageHandler.parse_request).
+    """
+
+    def __init__(self, server_address, handler_class, max_workers=16, max_connections=64):
+        # Khởi tạo trước super().__init__ vì server_close() được gọi khi bind thất bại
+        self.request_slots = threading.BoundedSemaphore(max_workers)
+        self._connection_slots = threading.BoundedSemaphore(max_connections)
+        self._open_connections = {}
+        self._connections_lock = threading.Lock()
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        if not self._connection_slots.acquire(blocking=False):
+            self._reject(request)
+            return
+        thread = threading.Thread(target=self._process_request_thread, args=(request, client_address),
+                                  name="image-server", daemon=True)
+        with self._connections_lock:
+            self._open_connections[request] = thread
+        thread.start()
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._connections_lock:
+                self._open_connections.pop(request, None)
+            self.shutdown_request(request)
+            self._connection_slots.release()
+
+    def _reject(self, request):
+        try:
+            request.sendall(
+                b"HTTP/1.1 503 Service Unavailable\r\n"
+                b"Content-Length: 0\r\nRetry-After: 1\r\nConnection: close\r\n\r\n"
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def handle_error(self, request, client_address):
+        logging.debug(f"Image server connection error from {client_address}", exc_info=True)
+
+    def server_close(self):
+        super().server_close()
+        # Đóng chiều đọc của các connection đang rảnh (keep-alive): response đang gửi
+        # vẫn hoàn tất, còn handler chờ request tiếp theo sẽ nhận EOF và thoát ngay.
+        with self._connections_lock:
+            connections = list(self._open_connections.items())
+        for conn, _ in connections:
+            try:
+                conn.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+        for _, thread in connections:
+            thread.join()
+
+
+def create_image_server(port: int, mode: str = None, host: str = ""):
+    """Tạo server (chưa chạy serve_forever) theo mode 'threaded' hoặc 'single'."""
+    mode = mode or config['MODE']
+    if mode == 'single':
+        return socketserver.TCPServer((host, port), _SingleThreadImageHandler)
+    return ThreadedImageServer(
+        (host, port), ImageHandler,
+        max_workers=config['WORKERS'],
+        max_connections=config['MAX_CONNECTIONS'],
+    )
+
+
+def _probe_shared_server(port: int) -> bool:
+    """True nếu port đang là image server của agent (không phải service khác chiếm port)."""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1.0) as resp:
+            health = json.load(resp)
+    except (OSError, ValueError):
+        return False
+    if health.get("status") != "ok" or "indexed_images" not in health:
+        return False
+    if health.get("artifact_dir") != _path_index.base_dir:
+        logging.warning(f"Shared image server on port {port} serves {health.get('artifact_dir')}, "
+                        f"this worker uses {_path_index.base_dir}")
+    return True
+
+
+def _start_on(port: int) -> bool:
+    global _image_server, _image_server_thread, _image_server_port
+    try:
+        _image_server = create_image_server(port)
+    except OSError:
+        return False
+    _image_server_port = port
+    _image_server_thread = threading.Thread(target=_image_server.serve_forever, daemon=True)
+    _image_server_thread.start()
+    logging.info(f"Image server started on port {_image_server_port} ({config['MODE']} mode)")
+    return True
+
+
+def start_image_server():
+    """Khởi động image server (một lần cho mỗi process), trả về port hoặc None.
+
+    Với IMAGE_SERVER_PORT: chỉ dùng port đó; nếu process khác đã phục vụ ở đó thì dùng lại
+    (kiểm tra lại mỗi SHARED_RECHECK_SECONDS, process đó dừng thì process này lên thay).
+    """
+    global _shared_port, _shared_checked_at
+    with _server_lock:
+        if _image_server: return _image_server_port
+        if _shared_port and time.monotonic() - _shared_checked_at < SHARED_RECHECK_SECONDS:
+            return _shared_port
+
+        refresh_path_index()
+        if config['PORT']:
+            port = config['PORT']
+            if _start_on(port):
+                _shared_port = None
+                return port
+            if _probe_shared_server(port):
+                if _shared_port != port:
+                    logging.info(f"Using shared image server on port {port}")
+                _shared_port, _shared_checked_at = port, time.monotonic()
+                return port
+            _shared_port = None
+            logging.error(f"Port {port} is busy and not serving images")
+            return None
+
+        for port in PORT_RANGE:
+            if _start_on(port):
+                return port
+        logging.error("Could not start image server")
+        return None
+
+
+def image_base_url() -> str:
+    """Base URL cho link ảnh: IMAGE_BASE_URL nếu có, ngược lại image server local (riêng hoặc dùng chung)."""
+    if config['BASE_URL']:
+        return config['BASE_URL']
+    port = start_image_server()
+    return f"http://localhost:{port}" if port else ""
+
+
+def stop_image_server(timeout: float = 5.0):
+    """Dừng nhận connection mới, chờ các request đang xử lý hoàn tất rồi đóng server."""
+    global _image_server, _image_server_thread, _image_server_port
+    with _server_lock:
+        server, thread = _image_server, _image_server_thread
+        _image_server = _image_server_thread = _image_server_port = None
+    if server is None:
+        return
+    server.shutdown()
+    server.server_close()
+    if thread is not None:
+        thread.join(timeout)
+    logging.info("Image server stopped")
+
+
+atexit.register(stop_image_server)
+
+
+def main(argv=None):
+    """Chạy image server dùng chung cho các worker (foreground)."""
+    parser = argparse.ArgumentParser(description="Shared image server for agent workers.")
+    parser.add_argument("--host", default="")
+    parser.add_argument("--port", type=int, default=config['PORT'] or PORT_RANGE[0])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    logging.info(f"Indexed {refresh_path_index()} images in {_path_index.base_dir}")
+    server = create_image_server(args.port, host=args.host)
+    logging.info(f"Image server listening on {args.host or '0.0.0.0'}:{args.port} ({config['MODE']} mode)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
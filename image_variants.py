@@ -0,0 +1,166 @@
+"""
+Tạo các phiên bản ảnh (variants) cho ảnh hướng dẫn.
+
+Agent hiển thị ảnh với width="100" (hướng dẫn tải app) và width="300" (hướng dẫn định vị),
+nên khi trích xuất ta tạo sẵn 1.w100.jpg, 1.w300.jpg bên cạnh ảnh gốc 1.jpg.
+Ảnh gốc được đọc bằng JPEG draft mode để decoder chỉ giải mã ở độ phân giải gần nhất cần thiết.
+Mỗi JPEG (gốc và thu nhỏ) có thêm bản WebP (1.webp, 1.w300.webp) để image server
+trả về khi client gửi Accept: image/webp.
+
+Usage:
+    python image_variants.py            # tạo variants cho ảnh đã trích xuất trước đó
+    python image_variants.py report     # báo cáo dung lượng tiết kiệm được nhờ WebP
+"""
+import os
+import sys
+import json
+import logging
+
+try:
+    from PIL import Image, features
+    HAS_WEBP = features.check('webp')
+except ImportError:
+    Image = None
+    HAS_WEBP = False
+
+# Các width khớp với width trong instruction của agent
+VARIANT_WIDTHS = (100, 300)
+IMAGE_FOLDERS = ("IOS_Instruction", "Android_Instruction", "extracted_images")
+WEBP_QUALITY = 80
+_VARIANT_MARKER = ".w"
+
+
+def variant_path(image_path: str, width: int) -> str:
+    """'IOS_Instruction/1.jpg' -> 'IOS_Instruction/1.w300.jpg'"""
+    root, _ = os.path.splitext(image_path)
+    return f"{root}{_VARIANT_MARKER}{width}.jpg"
+
+
+def webp_path(image_path: str) -> str:
+    """'IOS_Instruction/1.w300.jpg' -> 'IOS_Instruction/1.w300.webp'"""
+    root, _ = os.path.splitext(image_path)
+    return f"{root}.webp"
+
+
+def is_variant(image_path: str) -> bool:
+    root, _ = os.path.splitext(os.path.basename(image_path))
+    _, sep, width = root.rpartition(_VARIANT_MARKER)
+    return bool(sep) and width.isdigit()
+
+
+def save_image(image, path: str, format: str, **params):
+    """
+    Ghi ảnh qua file tạm + rename (như artifacts.write_json): worker khác đang phục vụ ảnh
+    từ cùng ARTIFACT_DIR không bao giờ gửi JPEG/WebP ghi dở.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        image.save(tmp_path, format, **params)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _save_webp(image, jpeg_path: str):
+    if not HAS_WEBP:
+        return None
+    out_path = webp_path(jpeg_path)
+    save_image(image, out_path, "WEBP", quality=WEBP_QUALITY, method=6)
+    return out_path
+
+
+def generate_variants(image_path: str, widths=VARIANT_WIDTHS) -> list:
+    """
+    Tạo ảnh thu nhỏ cho từng width (không phóng to ảnh nhỏ hơn width)
+    và bản WebP cho ảnh gốc cũng như từng ảnh thu nhỏ.
+
+    Returns:
+        list: Đường dẫn các file variant đã tạo
+    """
+    created = []
+    if Image is None:
+        logging.warning("Pillow not installed, skipping image variants")
+        return created
+
+    try:
+        with Image.open(image_path) as image:
+            webp = _save_webp(image.convert('RGB'), image_path)
+        if webp:
+            created.append(webp)
+    except Exception as e:
+        logging.error(f"Error creating WebP for {image_path}: {e}")
+
+    for width in sorted(widths):
+        try:
+            with Image.open(image_path) as image:
+                src_w, src_h = image.size
+                if src_w <= width:
+                    continue
+                height = max(1, round(src_h * width / src_w))
+                # Chỉ có tác dụng với JPEG: decode ở scale 1/2, 1/4, 1/8 gần nhất >= (width, height)
+                image.draft('RGB', (width, height))
+                resized = image.convert('RGB').resize((width, height), Image.LANCZOS)
+            out_path = variant_path(image_path, width)
+            save_image(resized, out_path, "JPEG", quality=85, optimize=True)
+            created.append(out_path)
+            webp = _save_webp(resized, out_path)
+            if webp:
+                created.append(webp)
+        except Exception as e:
+            logging.error(f"Error creating {width}px variant for {image_path}: {e}")
+    return created
+
+
+def generate_variants_for_folder(folder: str, widths=VARIANT_WIDTHS) -> int:
+    """Tạo variants cho mọi ảnh gốc trong folder. Trả về số file variant đã tạo."""
+    if not os.path.isdir(folder):
+        return 0
+    count = 0
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(('.jpg', '.jpeg', '.png')) or is_variant(name):
+            continue
+        count += len(generate_variants(os.path.join(folder, name), widths))
+    return count
+
+
+def webp_savings_report(base_dir: str, folders=IMAGE_FOLDERS) -> dict:
+    """So sánh tổng dung lượng JPEG với WebP tương ứng trong các thư mục ảnh."""
+    report = {"folders": {}, "total": {"images": 0, "jpeg_bytes": 0, "webp_bytes": 0, "missing_webp": 0}}
+    for folder_name in folders:
+        folder = os.path.join(base_dir, folder_name)
+        if not os.path.isdir(folder):
+            continue
+        stats = {"images": 0, "jpeg_bytes": 0, "webp_bytes": 0, "missing_webp": 0}
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(('.jpg', '.jpeg')):
+                continue
+            jpeg = os.path.join(folder, name)
+            webp = webp_path(jpeg)
+            if not os.path.exists(webp):
+                stats["missing_webp"] += 1
+                continue
+            stats["images"] += 1
+            stats["jpeg_bytes"] += os.path.getsize(jpeg)
+            stats["webp_bytes"] += os.path.getsize(webp)
+        report["folders"][folder_name] = stats
+        for key, value in stats.items():
+            report["total"][key] += value
+
+    for stats in list(report["folders"].values()) + [report["total"]]:
+        saved = stats["jpeg_bytes"] - stats["webp_bytes"]
+        stats["saved_bytes"] = saved
+        stats["saved_percent"] = round(100.0 * saved / stats["jpeg_bytes"], 1) if stats["jpeg_bytes"] else 0.0
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    if len(sys.argv) > 1 and sys.argv[1] == "report":
+        print(json.dumps(webp_savings_report(current_dir), indent=2))
+    else:
+        for folder_name in IMAGE_FOLDERS:
+            created = generate_variants_for_folder(os.path.join(current_dir, folder_name))
+            logging.info(f"{folder_name}: created {created} variant files")
@@ -0,0 +1,202 @@
+"""
+Pre-router: nhận diện tên đăng nhập bằng regex trước khi gọi model.
+
+Bước 1 của instruction bắt model trích username từ câu như "tên đăng nhập là X",
+"Tôi là X", "Username: X" rồi gọi get_complete_location_guide. Khi rule khớp với độ
+tin cậy cao, before_model_callback ở đây trả luôn function_call cho tool đó, tiết
+kiệm một lượt model; câu mơ hồ (nhiều ứng viên, hỏi về app Hộ Nghèo, ...) vẫn để
+model xử lý.
+
+Pattern chạy trên text đã bỏ dấu (giữ nguyên độ dài, nên span map ngược lại text
+gốc), vì người dùng hay gõ không dấu: "ten dang nhap la abc".
+
+Cấu hình:
+    PRE_ROUTER=1
+    PRE_ROUTER_MIN_CONFIDENCE=0.8
+
+Đo hit-rate / latency trên corpus có nhãn: python benchmarks/bench_pre_router.py
+"""
+import os
+import re
+import time
+import logging
+import unicodedata
+from typing import NamedTuple, Optional
+
+from google.genai import types
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.agents.callback_context import CallbackContext
+
+from . import metrics
+
+config = {
+    'ENABLED': os.getenv('PRE_ROUTER', '1').lower() not in ('0', 'false', 'no'),
+    'MIN_CONFIDENCE': float(os.getenv('PRE_ROUTER_MIN_CONFIDENCE', '0.8')),
+}
+
+ROUTED_TOOL = "get_complete_location_guide"
+
+_TOKEN = r"(?P<username>[A-Za-z0-9][A-Za-z0-9._@-]{1,63})(?![^\s.,!?;:\"'”’)])"
+_QUOTE = r"[\"'“”‘’]?"
+_PRONOUN = r"(?:toi|minh|em|anh|chi|tui|to|bac|co|chu)\b"
+
+# (rule, pattern, confidence) - pattern chạy trên text đã bỏ dấu, không phân biệt hoa thường
+_RULES = [
+    ("keyword", re.compile(
+        r"\b(?:ten\s*dang\s*nhap|ten\s*tai\s*khoan|tai\s*khoan|user\s*name|user\s*id|"
+        r"login(?:\s*name)?|account|acc|tk)"
+        rf"(?:\s+(?:(?:cua|of)\s+)?{_PRONOUN}|\s+my)?"
+        r"(?:\s*(?P<sep>[:=]|\b(?:la|is)\b)\s*|\s+)" + _QUOTE + _TOKEN,
+        re.IGNORECASE), 0.95),
+    ("self_intro", re.compile(
+        rf"(?:^|[,.!]\s*){_PRONOUN}\s+(?:la|ten\s+la)\s+" + _QUOTE + _TOKEN,
+        re.IGNORECASE), 0.7),
+]
+# Sau username chỉ còn dấu câu / trợ từ: "là abc nhé", không phải "là nguyen van a"
+_CLAUSE_END = re.compile(r"[\"'”’]?\s*(?:$|[,.!?;)]|(?:nhe|nha|nhi|a|ha)\b\s*[.!?]*\s*$)", re.IGNORECASE)
+_BARE = re.compile(r"^\s*" + _QUOTE + _TOKEN + _QUOTE + r"\s*[.!]?\s*$")
+# Câu về app Hộ Nghèo đi theo nhánh riêng của instruction
+_APP_GUIDE_HINT = re.compile(r"ho\s*ngheo|tai\s+app|cai\s+(?:dat\s+)?app", re.IGNORECASE)
+# Câu hỏi username của agent (xem bước 1 của instruction)
+_ASKED_USERNAME = re.compile(r"ten\s*dang\s*nhap|username", re.IGNORECASE)
+
+# Từ thường gặp ngay sau "tài khoản ..." / "tôi là ..." nhưng không phải username
+_STOPWORDS = frozenset("""
+    la gi dau nao bi da dang khong ko k chua van roi nhe a oi the nay do
+    cua toi minh em anh chi ban nguoi dung moi cu ten hay duoc voi va
+    is my the a an not none locked login user name account password
+    was has have failed disabled blocked expired hacked suspended deleted banned invalid wrong
+    ok oke okay vang yes no hi hello chao alo thanks help
+""".split())
+
+_DECISIONS = metrics.counter(
+    "agent_pre_router_decisions_total", "Pre-router decisions by outcome and rule", ("outcome", "rule"))
+_LATENCY = metrics.histogram(
+    "agent_pre_router_seconds", "Pre-router matching latency",
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01))
+
+
+class Decision(NamedTuple):
+    """username=None nghĩa là để model xử lý; rule ghi lý do."""
+    username: Optional[str]
+    confidence: float
+    rule: str
+
+
+def _fold_char(char: str) -> str:
+    if char in "đĐ":
+        return "d" if char == "đ" else "D"
+    base = unicodedata.normalize("NFD", char)[0]
+    return base if base.isascii() else char
+
+
+def fold(text: str) -> str:
+    """Bỏ dấu tiếng Việt, giữ nguyên số ký tự: 'Tên đăng nhập' -> 'Ten dang nhap'."""
+    return "".join(_fold_char(c) for c in text)
+
+
+def _candidate(original: str, match) -> Optional[str]:
+    start, end = match.span("username")
+    username = original[start:end].rstrip(".-")
+    # Token gốc có dấu là từ tiếng Việt, không phải username
+    if not username.isascii() or len(username) < 2 or username.lower() in _STOPWORDS:
+        return None
+    return username
+
+
+def _looks_like_username(username: str) -> bool:
+    return any(c.isdigit() or c in "._@" for c in username)
+
+
+def _confidence(rule: str, base: float, username: str, folded: str, match) -> float:
+    """
+    Độ tin cậy cao chỉ khi có dấu hiệu rõ: "là/is/:/=" ngay trước username và username có
+    dạng tên đăng nhập (số, . _ @) hoặc đứng cuối mệnh đề. "login failed", "tk sai mat khau",
+    "Username: nguyen van a", "toi la giao vien" đều để model xử lý.
+    """
+    looks = _looks_like_username(username)
+    clause_end = _CLAUSE_END.match(folded, match.end("username")) is not None
+    if rule == "keyword":
+        if match.group("sep"):
+            return base if looks or clause_end else 0.6
+        return 0.85 if looks else 0.5
+    # self_intro: "là" luôn có, nên chỉ tin khi username có dạng tên đăng nhập ("tôi là admin")
+    if looks:
+        return 0.85
+    return base if clause_end else 0.5
+
+
+def detect_username(text: str, asked_for_username: bool = False) -> Decision:
+    """Tìm username trong tin nhắn; asked_for_username: lượt trước agent vừa hỏi tên đăng nhập."""
+    original = unicodedata.normalize("NFC", text or "").strip()
+    if not original:
+        return Decision(None, 0.0, "empty")
+    folded = fold(original)
+    if _APP_GUIDE_HINT.search(folded):
+        return Decision(None, 0.0, "app_guide")
+
+    candidates = {}
+    for rule, pattern, confidence in _RULES:
+        for match in pattern.finditer(folded):
+            username = _candidate(original, match)
+            if username is None:
+                continue
+            score = _confidence(rule, confidence, username, folded, match)
+            best = candidates.get(username)
+            if best is None or score > best[0]:
+                candidates[username] = (score, rule)
+
+    if not candidates:
+        bare = _BARE.match(folded)
+        username = _candidate(original, bare) if bare else None
+        if username is None:
+            return Decision(None, 0.0, "no_match")
+        confidence = 0.9 if asked_for_username else (0.6 if _looks_like_username(username) else 0.4)
+        return Decision(username, confidence, "bare")
+
+    if len(candidates) > 1:
+        return Decision(None, 0.0, "ambiguous")
+    username, (confidence, rule) = next(iter(candidates.items()))
+    return Decision(username, confidence, rule)
+
+
+def _last_user_text(llm_request: LlmRequest) -> Optional[str]:
+    """Text của content cuối nếu đó là tin nhắn người dùng (không phải kết quả tool)."""
+    if not llm_request.contents:
+        return None
+    last = llm_request.contents[-1]
+    if last.role != "user" or not last.parts or any(p.function_response for p in last.parts):
+        return None
+    texts = [p.text for p in last.parts if p.text]
+    return "\n".join(texts) if texts else None
+
+
+def _agent_asked_username(llm_request: LlmRequest) -> bool:
+    for content in reversed(llm_request.contents[:-1]):
+        if content.role == "model":
+            text = " ".join(p.text for p in content.parts or [] if p.text)
+            return bool(_ASKED_USERNAME.search(fold(text)))
+    return False
+
+
+def route_username(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """before_model_callback: gọi thẳng get_complete_location_guide khi nhận ra username."""
+    if not config['ENABLED'] or ROUTED_TOOL not in llm_request.tools_dict:
+        return None
+    text = _last_user_text(llm_request)
+    if text is None:
+        return None
+
+    started = time.perf_counter()
+    decision = detect_username(text, _agent_asked_username(llm_request))
+    _LATENCY.observe(time.perf_counter() - started)
+
+    if decision.username is None or decision.confidence < config['MIN_CONFIDENCE']:
+        _DECISIONS.inc(outcome="fallback", rule=decision.rule)
+        return None
+    _DECISIONS.inc(outcome="routed", rule=decision.rule)
+    logging.info(f"Pre-router: {decision.rule} ({decision.confidence:.2f}) -> {ROUTED_TOOL}(userid={decision.username!r})")
+    return LlmResponse(content=types.Content(
+        role="model",
+        parts=[types.Part(function_call=types.FunctionCall(name=ROUTED_TOOL, args={"userid": decision.username}))],
+    ))
@@ -8,8 +8,10 @@ import os
 import json
 import logging
 import base64
+import hashlib
 import io
 import re
+import pickle
 import sys
 import xml.etree.ElementTree as ET
 from pathlib import Path
@@ -36,9 +38,14 @@ except ImportError as e:
     _import_errors.append("python-docx is not installed! Please run: pip install python-docx")
     Document = None
 
+from image_variants import generate_variants, save_image
+from tracing import span, traced, current_span
+from profiling import profiled, enable_from_argv
+
 logging.basicConfig(level=logging.INFO)
 
 
+@traced("extract.docx_images")
 def extract_images_from_docx(docx_path: str, output_folder: str) -> dict:
     """
     Tách hình ảnh từ file Word và lưu vào thư mục theo thứ tự xuất hiện trong document.
@@ -95,7 +102,8 @@ def extract_images_from_docx(docx_path: str, output_folder: str) -> dict:
                                             elif image.mode != 'RGB':
                                                 image = image.convert('RGB')
                                             
-                                            image.save(image_path, "JPEG", quality=85)
+                                            save_image(image, image_path, "JPEG", quality=85)
+                                            generate_variants(image_path)
                                             image_mapping[image_counter] = image_path
                                             seen_image_ids.add(r_embed)
                                             logging.info(f"Saved image {image_counter} to {image_path}")
@@ -133,7 +141,8 @@ def extract_images_from_docx(docx_path: str, output_folder: str) -> dict:
                             elif image.mode != 'RGB':
                                 image = image.convert('RGB')
                             
-                            image.save(image_path, "JPEG", quality=85)
+                            save_image(image, image_path, "JPEG", quality=85)
+                            generate_variants(image_path)
                             image_mapping[image_counter] = image_path
                             seen_image_ids.add(rel_id)
                             logging.info(f"Saved image {image_counter} to {image_path}")
@@ -149,9 +158,11 @@ def extract_images_from_docx(docx_path: str, output_folder: str) -> dict:
         logging.error(traceback.format_exc())
     
     logging.info(f"Extracted {len(image_mapping)} images in order")
+    current_span().set_attribute("images", len(image_mapping))
     return image_mapping
 
 
+@traced("extract.docx_parse")
 def parse_docx_to_json(docx_path: str, image_mapping: dict, folder_type: str) -> list:
     """
     Parse nội dung Word thành JSON với đường dẫn hình ảnh.
@@ -333,6 +344,7 @@ def parse_docx_to_json(docx_path: str, image_mapping: dict, folder_type: str) ->
                     logging.error(f"Error creating steps: {e}")
                     import traceback
                     traceback.print_exc()
+    current_span().set_attributes({"folder_type": folder_type, "steps": len(steps), "images": len(image_mapping)})
     return steps
 
 
@@ -387,34 +399,109 @@ def _parse_by_paragraphs(docx_path: str, image_mapping: dict, folder_type: str)
     return steps
 
 
+_GUIDE_TABLE_CACHE_VERSION = 1
+_guide_table = None  # Bảng hướng dẫn đã compile, giữ trong memory
+
+
+def _guide_excel_path() -> str:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(current_dir, "device_models_with_location.xlsx")
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _normalize_model_name(model_name) -> str:
+    return re.sub(r'\s+', ' ', str(model_name)).strip().lower()
+
+
+def _compile_guide_table(excel_path: str, workbook_hash: str) -> dict:
+    """Đọc Excel (openpyxl) một lần và build index theo folder_type và model name."""
+    df = pd.read_excel(excel_path).dropna(subset=['How_to_Enable_Location'])
+
+    by_folder_type = {}
+    by_model = {}
+    for row in df.itertuples(index=False):
+        model_name = str(getattr(row, 'ModelName', ''))
+        guide_text = str(row.How_to_Enable_Location).strip()
+        folder_type = "IOS" if re.search(r'iPhone|iOS|iPad', model_name, re.IGNORECASE) else "Android"
+        # Giữ hành vi cũ: dòng đầu tiên khớp folder_type quyết định hướng dẫn
+        by_folder_type.setdefault(folder_type, (model_name, guide_text))
+        for key in (model_name, getattr(row, 'ModelCode', None)):
+            if key is not None and not pd.isna(key):
+                by_model.setdefault(_normalize_model_name(key), guide_text)
+
+    return {
+        "version": _GUIDE_TABLE_CACHE_VERSION,
+        "workbook_hash": workbook_hash,
+        "by_folder_type": by_folder_type,
+        "by_model": by_model,
+    }
+
+
+@traced("excel.load_guide_table")
+def _load_guide_table():
+    """
+    Trả về bảng hướng dẫn đã compile (hoặc None nếu không có file Excel).
+    Thứ tự: memory (stat không đổi) -> file cache .pkl (hash khớp) -> đọc lại Excel.
+    """
+    global _guide_table
+    excel_path = _guide_excel_path()
+    if not os.path.exists(excel_path):
+        logging.warning(f"Excel file not found: {excel_path}")
+        return None
+
+    st = os.stat(excel_path)
+    stat_key = (st.st_size, st.st_mtime_ns)
+    if _guide_table is not None and _guide_table.get("stat_key") == stat_key:
+        current_span().set_attribute("guide_table_cache", "memory")
+        return _guide_table
+
+    workbook_hash = _file_sha256(excel_path)
+    cache_path = os.path.splitext(excel_path)[0] + ".cache.pkl"
+    table = None
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get("version") == _GUIDE_TABLE_CACHE_VERSION and cached.get("workbook_hash") == workbook_hash:
+                table = cached
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable guide cache {cache_path}: {e}")
+
+    current_span().set_attribute("guide_table_cache", "file" if table is not None else "miss")
+    if table is None:
+        with span("excel.compile_guide_table"):
+            table = _compile_guide_table(excel_path, workbook_hash)
+        try:
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logging.warning(f"Could not write guide cache {cache_path}: {e}")
+
+    table["stat_key"] = stat_key
+    _guide_table = table
+    return table
+
+
 def _get_guide_from_excel(folder_type: str) -> str:
     """Lấy hướng dẫn từ Excel dựa trên folder_type."""
     try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        excel_path = os.path.join(current_dir, "device_models_with_location.xlsx")
-        
-        if not os.path.exists(excel_path):
-            logging.warning(f"Excel file not found: {excel_path}")
+        table = _load_guide_table()
+        if not table:
             return ""
-        
-        df = pd.read_excel(excel_path).dropna(subset=['How_to_Enable_Location'])
-        
-        if df.empty:
-            return ""
-        
-        if folder_type == "IOS":
-            mask = df['ModelName'].astype(str).str.contains('iPhone|iOS|iPad', case=False, na=False, regex=True)
-        else:
-            mask = ~df['ModelName'].astype(str).str.contains('iPhone|iOS|iPad', case=False, na=False, regex=True)
-        
-        matches = df[mask]
-        if not matches.empty:
-            result = matches.iloc[0]
-            guide_text_raw = result.get('How_to_Enable_Location', '')
-            guide_text = "" if pd.isna(guide_text_raw) else str(guide_text_raw).strip()
-            
+
+        match = table["by_folder_type"].get("IOS" if folder_type == "IOS" else "Android")
+        if match:
+            model_name, guide_text = match
             if guide_text:
-                model_name = str(result.get('ModelName', ''))
                 logging.info(f"Found guide from Excel for {model_name} ({folder_type})")
                 return guide_text
             
@@ -426,6 +513,17 @@ def _get_guide_from_excel(folder_type: str) -> str:
     return ""
 
 
+def get_guide_by_model_name(model_name: str) -> str:
+    """Lấy hướng dẫn từ Excel theo ModelName hoặc ModelCode (không phân biệt hoa thường)."""
+    try:
+        table = _load_guide_table()
+        if table:
+            return table["by_model"].get(_normalize_model_name(model_name), "")
+    except Exception as e:
+        logging.error(f"Error reading Excel: {e}")
+    return ""
+
+
 def _create_steps_from_images(docx_path: str, image_mapping: dict, folder_type: str) -> list:
     """
     Tạo steps dựa vào số lượng images và text từ Excel.
@@ -542,6 +640,8 @@ def _create_steps_from_images(docx_path: str, image_mapping: dict, folder_type:
     return steps
 
 
+@profiled("process_docx_files")
+@traced("extract.process_docx_files")
 def process_docx_files():
     """Xử lý cả 2 file IOS.docx và Android.docx."""
     if _import_errors:
@@ -608,6 +708,7 @@ def process_docx_files():
 
 
 if __name__ == "__main__":
+    enable_from_argv()
     try:
         process_docx_files()
     except Exception as e:
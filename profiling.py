@@ -0,0 +1,154 @@
+"""
+Profiling theo yêu cầu cho các lần trích xuất (cProfile + tracemalloc).
+
+Bật bằng biến môi trường hoặc cờ --profile của script:
+    PROFILE_EXTRACTION=cpu,mem   # cpu | mem | cpu,mem (1/true = cả hai)
+    PROFILE_DIR=profiles
+    PROFILE_TOP_N=30
+
+    python process_docx.py --profile
+    python batch_extract.py IOS.docx --profile=cpu
+
+Mỗi lần chạy một entry point được bọc @profiled ghi vào PROFILE_DIR:
+    <name>-<thời gian>-<pid>.prof        cProfile (mở bằng pstats / snakeviz)
+    <name>-<thời gian>-<pid>.cpu.txt     top-N hàm theo cumulative time
+    <name>-<thời gian>-<pid>.alloc.txt   top-N dòng cấp phát bộ nhớ + peak
+
+Khi tắt, wrapper chỉ kiểm tra một biến rồi gọi thẳng hàm gốc.
+Module chỉ dùng stdlib để cả package agent lẫn các script độc lập cùng import được.
+"""
+import os
+import io
+import sys
+import time
+import pstats
+import logging
+import cProfile
+import functools
+import threading
+import tracemalloc
+
+ENV_VAR = 'PROFILE_EXTRACTION'
+
+config = {
+    'DIR': os.getenv('PROFILE_DIR', 'profiles'),
+    'TOP_N': int(os.getenv('PROFILE_TOP_N', '30')),
+}
+
+# Mỗi lúc chỉ profile một lần chạy: cProfile không lồng được (entry point gọi entry point
+# khác) và tracemalloc là toàn process; lần chạy trùng thời điểm chạy không profile
+_profile_lock = threading.Lock()
+
+
+def _parse_modes(value: str) -> frozenset:
+    value = (value or '').strip().lower()
+    if value in ('', '0', 'false', 'no', 'off'):
+        return frozenset()
+    if value in ('1', 'true', 'yes', 'on', 'all'):
+        return frozenset({'cpu', 'mem'})
+    modes = frozenset(m.strip() for m in value.split(',') if m.strip())
+    unknown = modes - {'cpu', 'mem'}
+    if unknown:
+        logging.warning(f"Ignoring unknown {ENV_VAR} modes: {', '.join(sorted(unknown))}")
+    return modes & {'cpu', 'mem'}
+
+
+def enable(modes: str = "cpu,mem", directory: str = None):
+    """Bật profiling (và ghi vào env để process con spawn cũng bật theo)."""
+    global _modes
+    _modes = _parse_modes(modes)
+    os.environ[ENV_VAR] = ",".join(sorted(_modes))
+    if directory:
+        config['DIR'] = directory
+        os.environ['PROFILE_DIR'] = directory
+
+
+def enabled() -> bool:
+    return bool(_modes)
+
+
+def enable_from_argv(argv=None) -> list:
+    """Xử lý cờ --profile / --profile=cpu trong argv; trả về argv đã bỏ cờ."""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    remaining = []
+    for arg in argv:
+        if arg == '--profile':
+            enable()
+        elif arg.startswith('--profile='):
+            enable(arg.split('=', 1)[1])
+        else:
+            remaining.append(arg)
+    return remaining
+
+
+def _write_reports(base: str, profiler, snapshot, peak: int, elapsed: float):
+    top_n = config['TOP_N']
+    if profiler is not None:
+        profiler.dump_stats(base + ".prof")
+        buffer = io.StringIO()
+        stats = pstats.Stats(profiler, stream=buffer)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_n)
+        with open(base + ".cpu.txt", 'w', encoding='utf-8') as f:
+            f.write(f"wall time: {elapsed:.3f}s\n")
+            f.write(buffer.getvalue())
+    if snapshot is not None:
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        with open(base + ".alloc.txt", 'w', encoding='utf-8') as f:
+            f.write(f"wall time: {elapsed:.3f}s\npeak traced memory: {peak / 1e6:.1f} MB\n\n")
+            f.write(f"Top {top_n} allocation sites (still allocated at end of run):\n")
+            for stat in snapshot.statistics('lineno')[:top_n]:
+                f.write(f"{stat}\n")
+
+
+def _run_profiled(name: str, fn, args, kwargs):
+    os.makedirs(config['DIR'], exist_ok=True)
+    base = os.path.join(config['DIR'], f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+    profiler = cProfile.Profile() if 'cpu' in _modes else None
+    started_tracing = 'mem' in _modes and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(10)
+    elif 'mem' in _modes:
+        tracemalloc.reset_peak()
+
+    started = time.perf_counter()
+    try:
+        if profiler is not None:
+            return profiler.runcall(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - started
+        snapshot, peak = None, 0
+        if 'mem' in _modes:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+        try:
+            _write_reports(base, profiler, snapshot, peak, elapsed)
+            logging.info(f"Profile for {name} written to {base}.*")
+        except OSError as e:
+            logging.warning(f"Could not write profile for {name}: {e}")
+
+
+def profiled(name: str = None):
+    """Decorator cho entry point trích xuất; no-op khi profiling tắt."""
+    def decorator(fn):
+        profile_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _modes or not _profile_lock.acquire(blocking=False):
+                return fn(*args, **kwargs)
+            try:
+                return _run_profiled(profile_name, fn, args, kwargs)
+            finally:
+                _profile_lock.release()
+        return wrapper
+    return decorator
+
+
+# Chế độ đang bật ('cpu', 'mem'); rỗng = tắt
+_modes = _parse_modes(os.getenv(ENV_VAR, ''))
@@ -0,0 +1,49 @@
+"""
+Render kết quả tool thành markdown đúng format mà instruction của agent yêu cầu,
+để agent (hoặc fast path trong fast_path.py) trả thẳng cho người dùng.
+
+Hướng dẫn định vị:            Hướng dẫn tải app:
+    Bước 1: Cài đặt               Bước 1: Chọn biểu tượng Play Store...
+                                  <img src="url" width="100"/>
+    <img src="url" width="300"/>
+                                  Bước 2: ...
+    Bước 2: ...
+"""
+import re
+
+_STEP_PREFIX = re.compile(r'^\s*(?:Bước|Step)\s*\d+', re.IGNORECASE)
+
+
+def step_heading(step_number, text) -> str:
+    """'Cài đặt' -> 'Bước 1: Cài đặt'; giữ nguyên text đã có 'Bước N'."""
+    # Text trích từ bảng PDF có xuống dòng giữa câu
+    text = ' '.join((text or '').split())
+    if _STEP_PREFIX.match(text):
+        return text
+    return f"Bước {step_number}: {text}" if text else f"Bước {step_number}"
+
+
+def img_tag(url: str, width: int) -> str:
+    return f'<img src="{url}" width="{width}"/>'
+
+
+def render_location_steps(steps, width: int) -> str:
+    """steps: [(step_number, text, image_url hoặc None)]"""
+    blocks = []
+    for step_number, text, url in steps:
+        block = step_heading(step_number, text)
+        if url:
+            block += "\n\n" + img_tag(url, width)
+        blocks.append(block)
+    return "\n\n".join(blocks)
+
+
+def render_app_steps(steps, width: int) -> str:
+    """steps: [(step_number, instruction, image_url hoặc None)]"""
+    blocks = []
+    for step_number, text, url in steps:
+        block = (text or '').strip() or step_heading(step_number, '')
+        if url:
+            block += "\n" + img_tag(url, width)
+        blocks.append(block)
+    return "\n\n".join(blocks)
@@ -0,0 +1,23 @@
+"""
+Các module của agent dùng relative import: đăng ký thư mục agent thành package
+"guide_agent" (không chạy __init__.py, tránh import agent / google.adk), như
+benchmarks/_common.import_package_module.
+
+ARTIFACT_DIR trỏ vào thư mục tạm trước khi import: test không đọc/ghi artifact thật.
+"""
+import os
+import sys
+import types
+import tempfile
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "guide_agent"
+
+os.environ['ARTIFACT_DIR'] = tempfile.mkdtemp(prefix="guide-agent-tests-")
+# Module dùng import tuyệt đối (batch_extract.py, profiling.py...)
+sys.path.insert(0, PACKAGE_DIR)
+
+if PACKAGE_NAME not in sys.modules:
+    package = types.ModuleType(PACKAGE_NAME)
+    package.__path__ = [PACKAGE_DIR]
+    sys.modules[PACKAGE_NAME] = package
@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+from guide_agent.admission import PRIORITY_ACTIVE, PRIORITY_NEW, AdmissionController, Busy
+
+
+def _controller(limit=1, max_queue=2, timeout=5.0):
+    return AdmissionController("test", limit, max_queue, timeout)
+
+
+async def _hold(controller, release: asyncio.Event, priority=PRIORITY_NEW, order=None, name=None):
+    async with controller.admit(priority):
+        if order is not None:
+            order.append(name)
+        await release.wait()
+
+
+def test_queue_full_returns_busy():
+    async def scenario():
+        controller = _controller(limit=1, max_queue=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, release))
+        waiter = asyncio.create_task(_hold(controller, release))
+        await asyncio.sleep(0)
+        with pytest.raises(Busy) as excinfo:
+            await controller._acquire(PRIORITY_NEW)
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return controller, excinfo.value
+
+    controller, busy = asyncio.run(scenario())
+    assert busy.reason == "queue_full"
+    assert busy.result()["status"] == "busy"
+    assert busy.result()["retry_after_seconds"] == 5.0
+    assert controller.active == 0
+
+
+def test_active_sessions_are_admitted_before_new_ones():
+    async def scenario():
+        controller = _controller(limit=1, max_queue=4)
+        release, order = asyncio.Event(), []
+        holder = asyncio.create_task(_hold(controller, release, order=order, name="holder"))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.create_task(_hold(controller, release, PRIORITY_NEW, order, "new-1")),
+            asyncio.create_task(_hold(controller, release, PRIORITY_NEW, order, "new-2")),
+            asyncio.create_task(_hold(controller, release, PRIORITY_ACTIVE, order, "active")),
+        ]
+        await asyncio.sleep(0)
+        assert controller.queue_depth() == 3
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+    # Ưu tiên trước, cùng mức thì FIFO
+    assert order == ["holder", "active", "new-1", "new-2"]
+    assert controller.active == 0
+
+
+def test_higher_priority_displaces_last_waiter_when_queue_is_full():
+    async def scenario():
+        controller = _controller(limit=1, max_queue=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, release))
+        await asyncio.sleep(0)
+        displaced = asyncio.create_task(_hold(controller, release, PRIORITY_NEW))
+        await asyncio.sleep(0)
+        active = asyncio.create_task(_hold(controller, release, PRIORITY_ACTIVE))
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(holder, displaced, active, return_exceptions=True)
+        return controller, results
+
+    controller, results = asyncio.run(scenario())
+    assert isinstance(results[1], Busy) and results[1].reason == "displaced"
+    assert results[2] is None
+    assert controller.active == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = _controller(limit=1, max_queue=2)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_hold(controller, release))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        depth = controller.queue_depth()
+        release.set()
+        await holder
+        return controller, depth
+
+    controller, depth = asyncio.run(scenario())
+    assert depth == 0
+    assert controller.active == 0
+
+
+def test_waiter_cancelled_after_being_handed_the_slot_releases_it():
+    async def scenario():
+        controller = _controller(limit=1, max_queue=2)
+        release, order = asyncio.Event(), []
+        await controller._acquire(PRIORITY_NEW)
+        first = asyncio.create_task(_hold(controller, release, order=order, name="first"))
+        second = asyncio.create_task(_hold(controller, release, order=order, name="second"))
+        await asyncio.sleep(0)
+        # Slot được chuyển thẳng cho "first" (future đã có kết quả) nhưng "first" bị huỷ
+        # trước khi kịp chạy: slot phải sang "second" thay vì bị mất
+        controller._release()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        release.set()
+        await second
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+    assert order == ["second"]
+    assert controller.active == 0
+    assert controller.queue_depth() == 0
+
+
+def test_waiter_times_out_with_busy():
+    async def scenario():
+        controller = _controller(limit=1, max_queue=2, timeout=0.01)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, release))
+        await asyncio.sleep(0)
+        with pytest.raises(Busy) as excinfo:
+            await controller._acquire(PRIORITY_NEW)
+        release.set()
+        await holder
+        return controller, excinfo.value
+
+    controller, busy = asyncio.run(scenario())
+    assert busy.reason == "timeout"
+    assert controller.active == 0
+
+
+def test_waiter_cancelled_after_timing_out_does_not_release_a_slot():
+    async def scenario():
+        controller = _controller(limit=1, max_queue=2)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(controller._acquire(PRIORITY_NEW))
+        await asyncio.sleep(0)
+        # Hết hạn chờ (future mang Busy) rồi bị huỷ trước khi thấy exception
+        controller._expire(controller._waiters[0])
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        active_while_held = controller.active
+        release.set()
+        await holder
+        return controller, active_while_held
+
+    controller, active_while_held = asyncio.run(scenario())
+    assert active_while_held == 1
+    assert controller.active == 0
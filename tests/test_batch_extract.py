@@ -0,0 +1,30 @@
+import os
+
+from batch_extract import find_collisions, output_paths
+
+
+def test_unique_stems_do_not_collide():
+    assert find_collisions(["/docs/a.docx", "/docs/b.pdf", "/docs/sub/c.docx"]) == {}
+
+
+def test_same_stem_different_extension_collides():
+    collisions = find_collisions(["/docs/x.docx", "/docs/x.pdf", "/docs/y.docx"])
+    assert collisions == {"/docs/x.docx": ["/docs/x.pdf"], "/docs/x.pdf": ["/docs/x.docx"]}
+
+
+def test_same_name_in_different_folders_collides():
+    collisions = find_collisions(["/docs/a/x.docx", "/docs/b/x.docx"])
+    assert set(collisions) == {"/docs/a/x.docx", "/docs/b/x.docx"}
+
+
+def test_collision_is_case_insensitive():
+    # JSON output viết thường: X.docx và x.docx cùng ghi x.json
+    sources = ["/docs/X.docx", "/docs/sub/x.docx"]
+    assert output_paths(sources[0], "/out")[0] == output_paths(sources[1], "/out")[0]
+    assert set(find_collisions(sources)) == set(sources)
+
+
+def test_output_paths():
+    json_path, images_dir = output_paths("/docs/Guide.docx", "/out")
+    assert json_path == os.path.join("/out", "guide.json")
+    assert images_dir == os.path.join("/out", "Guide_images")
@@ -0,0 +1,100 @@
+import sqlite3
+
+import pytest
+
+from guide_agent.device_replica import DeviceReplica
+
+
+@pytest.fixture
+def source(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "source.sqlite"))
+    conn.execute("CREATE TABLE DeviceInfo (UserID TEXT, DeviceName TEXT, StatusMessage TEXT, ModifiedAt TEXT)")
+    conn.executemany("INSERT INTO DeviceInfo VALUES (?, ?, ?, ?)", [
+        ("u1", "iPhone 12", "OK", "2026-01-01T00:00:00"),
+        ("u2", "Samsung A52", "GPS bị tắt", "2026-01-01T00:00:01"),
+    ])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def replica(tmp_path):
+    return DeviceReplica(str(tmp_path / "replica.sqlite"))
+
+
+def test_lookup_before_first_sync_is_empty(replica):
+    assert replica.lookup("u1") == (None, "empty")
+
+
+def test_full_load_then_lookup(replica, source):
+    result = replica.sync(source, "DeviceInfo")
+    assert result["kind"] == "full"
+    assert result["rows"] == 2
+    data, outcome = replica.lookup("u2")
+    assert outcome == "hit"
+    assert data == [{"UserID": "u2", "DeviceName": "Samsung A52", "StatusMessage": "GPS bị tắt",
+                     "ModifiedAt": "2026-01-01T00:00:01"}]
+    assert replica.lookup("u9") == (None, "miss")
+
+
+def test_incremental_sync_pulls_rows_from_watermark(replica, source):
+    replica.sync(source, "DeviceInfo")
+    assert replica.meta()["watermark"] == {"value": "2026-01-01T00:00:01"}
+
+    source.execute("UPDATE DeviceInfo SET StatusMessage = 'Chưa bật định vị', ModifiedAt = '2026-01-02T00:00:00' "
+                   "WHERE UserID = 'u1'")
+    source.execute("INSERT INTO DeviceInfo VALUES ('u3', 'iPad', 'OK', '2026-01-02T00:00:05')")
+    source.commit()
+
+    result = replica.sync(source, "DeviceInfo")
+    assert result["kind"] == "incremental"
+    # >= watermark: dòng u2 (bằng watermark cũ) được kéo lại cùng hai dòng mới
+    assert result["rows"] == 3
+    assert replica.meta()["watermark"] == {"value": "2026-01-02T00:00:05"}
+    assert replica.lookup("u1")[0][0]["StatusMessage"] == "Chưa bật định vị"
+    assert replica.lookup("u3")[1] == "hit"
+
+    # Không có gì mới: chỉ dòng bằng watermark
+    assert replica.sync(source, "DeviceInfo")["rows"] == 1
+
+
+def test_stale_replica_falls_back(replica, source, monkeypatch):
+    from guide_agent import device_replica
+    replica.sync(source, "DeviceInfo")
+    monkeypatch.setitem(device_replica.config, 'MAX_STALENESS', -1)
+    assert replica.lookup("u1") == (None, "stale")
+
+
+def test_user_with_several_devices_keeps_every_row_in_source_order(replica, source):
+    source.execute("INSERT INTO DeviceInfo VALUES ('u1', 'iPad', 'Lỗi mạng', '2026-01-01T00:00:02')")
+    source.commit()
+    replica.sync(source, "DeviceInfo")
+    live = source.execute("SELECT DeviceName FROM DeviceInfo WHERE UserID = 'u1'").fetchall()
+    assert [row["DeviceName"] for row in replica.lookup("u1")[0]] == [name for name, in live]
+
+    source.execute("UPDATE DeviceInfo SET StatusMessage = 'OK', ModifiedAt = '2026-01-03T00:00:00' "
+                   "WHERE UserID = 'u1' AND DeviceName = 'iPad'")
+    source.execute("INSERT INTO DeviceInfo VALUES ('u1', 'Vivo Y21', 'OK', '2026-01-03T00:00:01')")
+    source.commit()
+    replica.sync(source, "DeviceInfo")
+    data, outcome = replica.lookup("u1")
+    assert outcome == "hit"
+    assert [(row["DeviceName"], row["StatusMessage"]) for row in data] == [
+        ("iPhone 12", "OK"), ("iPad", "OK"), ("Vivo Y21", "OK")]
+
+
+def test_empty_source_table_does_not_force_full_reload(replica, source):
+    source.execute("DELETE FROM DeviceInfo")
+    source.commit()
+    assert replica.sync(source, "DeviceInfo")["kind"] == "full"
+    assert replica.meta()["watermark"] is None
+    result = replica.sync(source, "DeviceInfo")
+    assert (result["kind"], result["rows"]) == ("incremental", 0)
+
+    source.execute("INSERT INTO DeviceInfo VALUES ('u5', 'iPhone SE', 'OK', '2026-02-01T00:00:00')")
+    source.commit()
+    result = replica.sync(source, "DeviceInfo")
+    assert (result["kind"], result["rows"]) == ("incremental", 1)
+    assert replica.meta()["watermark"] == {"value": "2026-02-01T00:00:00"}
+    assert replica.lookup("u5")[1] == "hit"
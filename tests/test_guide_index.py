@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from guide_agent import guide_index
+from guide_agent.guide_index import GuideIndex, build_index, fold, tokenize
+from guide_agent.guide_registry import GuideEntry
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Chưa bật Định vị", "chua bat dinh vi"),
+    ("ĐIỆN THOẠI mất mạng", "dien thoai mat mang"),
+    # Dấu tổ hợp (NFD) như text dán từ nơi khác
+    ("Chưa cài", "chua cai"),
+    ("GPS bị tắt!", "gps bi tat!"),
+])
+def test_fold(text, expected):
+    assert fold(text) == expected
+
+
+def test_tokenize_adds_bigrams():
+    assert tokenize("Bật định vị") == ["bat", "dinh", "vi", "bat_dinh", "dinh_vi"]
+
+
+class _Registry:
+    def __init__(self, entries, sources):
+        self._entries = entries
+        self._sources = sources
+
+    def entries(self):
+        return self._entries
+
+    def source_path(self, entry):
+        return self._sources[entry.id]
+
+
+@pytest.fixture
+def index(tmp_path):
+    guides = {
+        "location": (GuideEntry("location", "Bật định vị", "location.json", keywords=("gps", "vị trí"),
+                                status_messages=("Chưa bật định vị",)),
+                     [{"text": "Bước 1: Mở Cài đặt, chọn Quyền riêng tư"}, {"text": "Bước 2: Bật Dịch vụ định vị"}]),
+        "app": (GuideEntry("app", "Tải app Hộ Nghèo", "app.json", keywords=("tải app", "hộ nghèo"),
+                           status_messages=("Chưa cài ứng dụng Hộ Nghèo",)),
+                [{"text": "Mở CH Play và tìm ứng dụng"}]),
+        "network": (GuideEntry("network", "Mất mạng", "network.json", keywords=("mạng", "wifi")),
+                    [{"text": "Tắt rồi bật lại chế độ máy bay"}]),
+    }
+    sources = {}
+    for guide_id, (_, steps) in guides.items():
+        path = tmp_path / f"{guide_id}.json"
+        path.write_text(json.dumps(steps, ensure_ascii=False), encoding="utf-8")
+        sources[guide_id] = str(path)
+    registry = _Registry([entry for entry, _ in guides.values()], sources)
+    return GuideIndex(build_index(registry))
+
+
+def test_lookup_ranks_matching_guide_first(index):
+    assert [m.guide_id for m in index.lookup("Chưa bật định vị GPS", min_score=0.0)][0] == "location"
+    assert [m.guide_id for m in index.lookup("Chưa cài ứng dụng Hộ Nghèo", min_score=0.0)][0] == "app"
+    assert [m.guide_id for m in index.lookup("mất mạng wifi", min_score=0.0)][0] == "network"
+
+
+def test_lookup_ignores_diacritics(index):
+    with_marks = index.lookup("Chưa cài ứng dụng Hộ Nghèo")
+    without_marks = index.lookup("chua cai ung dung ho ngheo")
+    assert with_marks == without_marks
+    assert with_marks[0].guide_id == "app"
+
+
+def test_lookup_scores_are_descending_and_limited(index):
+    matches = index.lookup("bật định vị ứng dụng mạng", limit=2, min_score=0.0)
+    assert len(matches) == 2
+    assert matches[0].score >= matches[1].score
+
+
+def test_lookup_min_score_filters_noise(index):
+    assert index.lookup("xin chào", min_score=guide_index.config['MIN_SCORE']) == []
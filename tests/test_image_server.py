@@ -0,0 +1,147 @@
+import os
+import http.client
+import threading
+
+import pytest
+
+from guide_agent import image_server
+from guide_agent.image_server import PathIndex, _parse_range
+
+
+@pytest.mark.parametrize("header, size, expected", [
+    ("bytes=0-9", 100, (0, 9)),
+    ("bytes=90-", 100, (90, 99)),
+    ("bytes=-10", 100, (90, 99)),
+    ("bytes=50-500", 100, (50, 99)),
+    ("bytes=-500", 100, (0, 99)),
+    ("bytes=100-", 100, False),
+    ("bytes=-0", 100, False),
+    ("bytes=0-0", 0, False),
+    ("bytes=0-1,5-6", 100, None),
+    ("items=0-9", 100, None),
+    ("bytes=9-0", 100, None),
+    ("bytes=a-b", 100, None),
+    ("bytes=10", 100, None),
+])
+def test_parse_range(header, size, expected):
+    assert _parse_range(header, size) == expected
+
+
+def _write(path, data=b"\xff\xd8jpeg"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return os.path.abspath(path)
+
+
+@pytest.fixture
+def index(tmp_path):
+    paths = {
+        "ios": _write(tmp_path / "IOS_Instruction" / "1.jpg"),
+        "android": _write(tmp_path / "Android_Instruction" / "1.jpg"),
+        "android_2": _write(tmp_path / "Android_Instruction" / "2.jpg"),
+    }
+    _write(tmp_path / "IOS_Instruction" / "notes.txt", b"secret")
+    index = PathIndex(str(tmp_path), miss_refresh_interval=0.0)
+    index.refresh()
+    return index, paths
+
+
+def test_path_index_exact_relpath(index):
+    index, paths = index
+    assert index.resolve("Android_Instruction/1.jpg") == paths["android"]
+    assert index.resolve("Android_Instruction\\1.jpg") == paths["android"]
+
+
+def test_path_index_name_fallback_uses_folder_priority(index):
+    index, paths = index
+    # IOS_Instruction đứng trước Android_Instruction trong IMAGE_FOLDERS
+    assert index.resolve("1.jpg") == paths["ios"]
+    assert index.resolve("other/2.jpg") == paths["android_2"]
+    assert index.resolve("other/2.jpg", by_name=False) is None
+
+
+def test_path_index_only_serves_images(index):
+    index, _ = index
+    assert index.resolve("IOS_Instruction/notes.txt") is None
+    assert index.resolve("missing.jpg") is None
+
+
+def test_path_index_picks_up_new_files_on_miss(index, tmp_path):
+    index, _ = index
+    path = _write(tmp_path / "IOS_Instruction" / "3.jpg")
+    assert index.resolve("IOS_Instruction/3.jpg") == path
+
+
+def test_path_index_skips_files_outside_image_folders(index, tmp_path):
+    index, _ = index
+    _write(tmp_path / "benchmarks" / "fixtures" / "artifacts" / "bench_images" / "bench_1.jpg")
+    _write(tmp_path / "assets" / "logo.png")
+    _write(tmp_path / "demo_1.png")
+    guide = _write(tmp_path / "network_reset_images" / "1.jpg")
+    index.refresh()
+    assert index.resolve("benchmarks/fixtures/artifacts/bench_images/bench_1.jpg") is None
+    assert index.resolve("bench_1.jpg") is None
+    assert index.resolve("assets/logo.png") is None
+    assert index.resolve("demo_1.png") is None
+    assert index.resolve("network_reset_images/1.jpg") == guide
+
+
+@pytest.fixture
+def server():
+    base = image_server._path_index.base_dir
+    _write(os.path.join(base, "IOS_Instruction", "etag.jpg"), b"\xff\xd8" + bytes(range(256)) * 4)
+    image_server.refresh_path_index()
+    server = image_server.create_image_server(0, mode="threaded", host="127.0.0.1")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def _get(port, path, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def test_etag_and_not_modified(server):
+    status, headers, body = _get(server, "/IOS_Instruction/etag.jpg")
+    assert status == 200
+    assert len(body) == 2 + 256 * 4
+    etag = headers["ETag"]
+
+    status, headers, body = _get(server, "/IOS_Instruction/etag.jpg", {"If-None-Match": etag})
+    assert status == 304
+    assert body == b""
+    assert headers["ETag"] == etag
+
+    status, _, _ = _get(server, "/IOS_Instruction/etag.jpg", {"If-None-Match": '"other"'})
+    assert status == 200
+
+
+def test_range_request(server):
+    status, headers, body = _get(server, "/IOS_Instruction/etag.jpg", {"Range": "bytes=2-5"})
+    assert status == 206
+    assert body == bytes(range(4))
+    assert headers["Content-Range"] == f"bytes 2-5/{2 + 256 * 4}"
+
+
+def test_directory_traversal_forbidden(server):
+    status, _, _ = _get(server, "/../etc/passwd.jpg")
+    assert status in (403, 404)
+
+
+def test_server_does_not_serve_benchmark_fixtures(server):
+    base = image_server._path_index.base_dir
+    _write(os.path.join(base, "benchmarks", "fixtures", "artifacts", "bench_images", "fixture.jpg"))
+    image_server.refresh_path_index()
+    status, _, _ = _get(server, "/benchmarks/fixtures/artifacts/bench_images/fixture.jpg")
+    assert status == 404
+    status, _, _ = _get(server, "/fixture.jpg")
+    assert status == 404
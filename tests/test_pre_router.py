@@ -0,0 +1,32 @@
+import os
+import json
+
+import pytest
+
+from guide_agent import pre_router
+from conftest import PACKAGE_DIR
+
+CORPUS = os.path.join(PACKAGE_DIR, "benchmarks", "corpus", "pre_router.jsonl")
+
+
+def _corpus():
+    with open(CORPUS, 'r', encoding='utf-8') as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    return [pytest.param(item, id=item["text"]) for item in items]
+
+
+@pytest.mark.parametrize("item", _corpus())
+def test_corpus(item):
+    decision = pre_router.detect_username(item["text"], bool(item.get("asked")))
+    routed = decision.username if decision.confidence >= pre_router.config['MIN_CONFIDENCE'] else None
+    if item["expected"] is None or item.get("may_fallback"):
+        # Route sai là lỗi đắt nhất: chỉ được route đúng username hoặc để model xử lý
+        assert routed in (None, item["expected"]), decision
+    else:
+        assert routed == item["expected"], decision
+
+
+def test_fold_keeps_length():
+    text = "Tên đăng nhập là Đức"
+    assert pre_router.fold(text) == "Ten dang nhap la Duc"
+    assert len(pre_router.fold(text)) == len(text)
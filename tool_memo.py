@@ -0,0 +1,135 @@
+"""
+Memo kết quả tool trong phạm vi một session, qua before/after_tool_callback của ADK.
+
+Trong một cuộc hội thoại model hay gọi query_DeviceInfo rồi get_complete_location_guide
+cho cùng user (tool sau lại truy vấn DB lần nữa), hoặc lặp process_pdf_files + retry
+theo nhánh lỗi của instruction. Kết quả thành công được lưu trong session state
+(key "tool_memo"), theo tên tool + args đã chuẩn hoá; lần gọi giống hệt trả ngay.
+
+Mỗi tool có policy riêng (POLICIES):
+    cacheable       có memo hay không
+    ttl             số giây còn hiệu lực (None: hết session)
+    invalidated_by  tool nào chạy thật thì xoá memo của tool này
+
+get_complete_location_guide còn được dựng từ query_DeviceInfo đã memo cho cùng userid,
+không truy vấn DB lại.
+"""
+import json
+import time
+import logging
+from typing import NamedTuple, Optional
+
+from google.adk.tools import BaseTool, ToolContext
+
+from . import metrics
+from . import tools
+from . import async_tools
+
+STATE_KEY = "tool_memo"
+
+
+class MemoPolicy(NamedTuple):
+    cacheable: bool = True
+    ttl: Optional[float] = None
+    invalidated_by: tuple = ()
+
+
+POLICIES = {
+    'query_DeviceInfo': MemoPolicy(ttl=300),
+    'get_complete_location_guide': MemoPolicy(ttl=300, invalidated_by=('process_pdf_files',)),
+    'get_poverty_app_download_guide': MemoPolicy(ttl=3600),
+    'get_guide': MemoPolicy(ttl=3600, invalidated_by=('process_pdf_files',)),
+    'determine_folder_type_from_device_name': MemoPolicy(),
+    # Chặn vòng lặp "process_pdf_files rồi retry" gọi rebuild nhiều lần liên tiếp
+    'process_pdf_files': MemoPolicy(ttl=60),
+}
+
+_MEMO_EVENTS = metrics.counter(
+    "agent_tool_memo_total", "Session tool memo lookups and updates by outcome", ("tool", "outcome"))
+
+# function_call_id của các lần gọi được trả từ memo: after_tool_callback vẫn chạy cho chúng
+_served_calls = set()
+
+
+def memo_key(args: dict) -> str:
+    """Args chuẩn hoá: bỏ khoảng trắng thừa ở string, sort key."""
+    normalized = {k: v.strip() if isinstance(v, str) else v for k, v in (args or {}).items()}
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _lookup(state, tool_name: str, key: str) -> Optional[dict]:
+    policy = POLICIES.get(tool_name)
+    if policy is None or not policy.cacheable:
+        return None
+    entry = (state.get(STATE_KEY) or {}).get(tool_name, {}).get(key)
+    if entry is None:
+        return None
+    if policy.ttl is not None and time.time() - entry["stored_at"] > policy.ttl:
+        return None
+    return entry["result"]
+
+
+def _store(state, tool_name: str, key: str, result: dict):
+    memo = dict(state.get(STATE_KEY) or {})
+    entries = dict(memo.get(tool_name, {}))
+    entries[key] = {"result": result, "stored_at": time.time()}
+    memo[tool_name] = entries
+    # Gán lại cả dict để ADK ghi nhận state delta
+    state[STATE_KEY] = memo
+
+
+def _invalidate(state, executed_tool: str):
+    memo = state.get(STATE_KEY) or {}
+    stale = [name for name, policy in POLICIES.items() if executed_tool in policy.invalidated_by and memo.get(name)]
+    if not stale:
+        return
+    state[STATE_KEY] = {name: entries for name, entries in memo.items() if name not in stale}
+    for name in stale:
+        _MEMO_EVENTS.inc(tool=name, outcome="invalidated")
+
+
+async def _location_guide_from_device_info(state, args: dict) -> Optional[dict]:
+    dev_info = _lookup(state, 'query_DeviceInfo', memo_key({"userid": (args or {}).get("userid")}))
+    if not dev_info or not dev_info.get("data"):
+        return None
+    row = dev_info['data'][0]
+    return await async_tools.location_guide_for_device(row.get('DeviceName', ''), tools._status_message(row))
+
+
+async def memo_before_tool(tool: BaseTool, args: dict, tool_context: ToolContext) -> Optional[dict]:
+    """before_tool_callback: trả kết quả đã memo, bỏ qua lần chạy tool."""
+    key = memo_key(args)
+    result = _lookup(tool_context.state, tool.name, key)
+    outcome = "hit"
+    if result is None and tool.name == 'get_complete_location_guide':
+        result = await _location_guide_from_device_info(tool_context.state, args)
+        outcome = "derived"
+        if result is not None and result.get("status") == "success":
+            _store(tool_context.state, tool.name, key, result)
+    if result is None:
+        if tool.name in POLICIES:
+            _MEMO_EVENTS.inc(tool=tool.name, outcome="miss")
+        return None
+
+    _MEMO_EVENTS.inc(tool=tool.name, outcome=outcome)
+    logging.info(f"Tool memo {outcome}: {tool.name}({key})")
+    _served_calls.add(tool_context.function_call_id)
+    return result
+
+
+def memo_after_tool(tool: BaseTool, args: dict, tool_context: ToolContext, tool_response: dict) -> Optional[dict]:
+    """after_tool_callback: lưu kết quả thành công, xoá memo bị tool này làm cũ."""
+    if tool_context.function_call_id in _served_calls:
+        _served_calls.discard(tool_context.function_call_id)
+        return None
+
+    _invalidate(tool_context.state, tool.name)
+    policy = POLICIES.get(tool.name)
+    if policy is None or not policy.cacheable:
+        return None
+    # Chỉ memo kết quả thành công; lỗi (DB timeout, thiếu JSON, ...) phải được thử lại
+    if isinstance(tool_response, dict) and tool_response.get("status") not in (None, "success"):
+        return None
+    _store(tool_context.state, tool.name, memo_key(args), tool_response)
+    _MEMO_EVENTS.inc(tool=tool.name, outcome="stored")
+    return None
@@ -1,14 +1,21 @@
-from .db import get_connection
+from .image_variants import generate_variants, save_image, variant_path
+from .image_server import ImageHandler, start_image_server, stop_image_server, refresh_path_index, content_version, image_base_url
+from .render import render_location_steps, render_app_steps
+from .guide_registry import get_registry
+from .guide_bundle import get_bundle
+from . import guide_bundle
+from . import device_replica
+from . import guide_index
+from . import artifacts
+from .artifacts import artifact_dir, artifact_path
+from .tracing import span, traced, current_span
+from .profiling import profiled
 from dotenv import load_dotenv
 import logging
 import os
 import re
 import json
 import io
-import urllib.parse
-import threading
-import http.server
-import socketserver
 import pdfplumber
 import sys 
 import xml.etree.ElementTree as ET
@@ -24,13 +31,14 @@ config = {
     'DATABASE': os.getenv('DATABASE'),
     'UID': os.getenv('UID'),
     'PWD': os.getenv('PWD'),
-    'TABLE': os.getenv('TABLE')
+    'TABLE': os.getenv('TABLE'),
+    # Thêm ?v=<hash nội dung> vào URL ảnh để browser cache vĩnh viễn (Cache-Control: immutable)
+    'IMAGE_VERSIONED_URLS': os.getenv('IMAGE_VERSIONED_URLS', '').lower() in ('1', 'true', 'yes')
 }
 
-# Image Server Globals
-_image_server = None
-_image_server_port = None
-_image_server_thread = None
+# Width hiển thị ảnh trong instruction của agent (xem agent.py)
+LOCATION_IMAGE_WIDTH = 300
+APP_GUIDE_IMAGE_WIDTH = 100
 
 # --- UTILS ---
 def convert_value_to_json_serializable(value):
@@ -49,79 +57,73 @@ def determine_folder_type_from_device_name(device_name: str) -> str:
     is_ios = any(keyword in device_lower for keyword in ['iphone', 'ios', 'ipad'])
     return "IOS" if is_ios else "Android"
 
-def _get_mime_type(filename: str) -> str:
-    ext = os.path.splitext(filename)[1].lower()
-    return {
-        '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', 
-        '.png': 'image/png', '.gif': 'image/gif', 
-        '.bmp': 'image/bmp'
-    }.get(ext, 'image/jpeg')
+def _build_image_url(base_url: str, rel_path: str, width: int = None) -> str:
+    """URL cho ảnh (rel_path tính từ ARTIFACT_DIR); dùng variant đúng width nếu đã được tạo lúc trích xuất."""
+    current_dir = artifact_dir()
+    bundle = get_bundle()
+    if width:
+        candidate = variant_path(rel_path, width)
+        if (bundle is not None and bundle.image(candidate)) or os.path.exists(os.path.join(current_dir, candidate)):
+            rel_path = candidate
+    url_path = rel_path.replace(os.sep, '/')
+    if not base_url:
+        return url_path
+    url = f"{base_url}/{url_path}"
+    if config['IMAGE_VERSIONED_URLS']:
+        image = bundle.image(rel_path) if bundle is not None else None
+        version = image.etag if image is not None else content_version(os.path.join(current_dir, rel_path))
+        if version:
+            url += f"?v={version}"
+    return url
 
 # --- IMAGE SERVER ---
-class ImageHandler(http.server.SimpleHTTPRequestHandler):
-    def do_GET(self):
-        try:
-            parsed = urllib.parse.urlparse(self.path)
-            clean_path = urllib.parse.unquote(parsed.path).lstrip('/')
-            
-            # Prevent directory traversal
-            if '..' in clean_path or clean_path.startswith('/'):
-                 self.send_error(403, "Forbidden")
-                 return
-                 
-            # Logic to find file:
-            # 1. Check if relative to current dir
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            file_path = os.path.join(current_dir, clean_path)
-            
-            if not os.path.exists(file_path):
-                # 2. If it's just a filename, look in known image folders
-                filename = os.path.basename(clean_path)
-                folders = [
-                    os.path.join(current_dir, "IOS_Instruction"),
-                    os.path.join(current_dir, "Android_Instruction"),
-                    os.path.join(current_dir, "extracted_images")
-                ]
-                for fld in folders:
-                    potential_path = os.path.join(fld, filename)
-                    if os.path.exists(potential_path):
-                        file_path = potential_path
-                        break
-            
-            if file_path and os.path.exists(file_path) and os.path.isfile(file_path):
-                with open(file_path, 'rb') as f:
-                    content = f.read()
-                self.send_response(200)
-                self.send_header('Content-Type', _get_mime_type(file_path))
-                self.send_header('Content-Length', len(content))
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(content)
-            else:
-                self.send_error(404, "File not found")
-        except Exception:
-            self.send_error(500, "Server Error")
-
-    def log_message(self, format, *args):
-        pass
-
 def _start_image_server():
-    global _image_server, _image_server_thread, _image_server_port
-    if _image_server: return _image_server_port
-    
-    for port in range(8765, 8775):
-        try:
-            _image_server = socketserver.TCPServer(("", port), ImageHandler)
-            _image_server_port = port
-            _image_server_thread = threading.Thread(target=_image_server.serve_forever, daemon=True)
-            _image_server_thread.start()
-            logging.info(f"Image server started on port {_image_server_port}")
-            return port
-        except OSError:
-            continue
-    logging.error("Could not start image server")
+    return start_image_server()
+
+# --- GUIDE INDEX ---
+def _rebuild_guide_index():
+    """Build lại index statusMessage -> guide sau khi trích xuất (lỗi không làm hỏng trích xuất)."""
+    try:
+        guide_index.rebuild()
+    except Exception as e:
+        logging.error(f"Could not rebuild guide index: {e}")
+
+def _rebuild_guide_bundle():
+    """Build lại guide bundle nếu deployment đang dùng bundle (lỗi không làm hỏng trích xuất)."""
+    try:
+        guide_bundle.rebuild_if_present()
+    except Exception as e:
+        logging.error(f"Could not rebuild guide bundle: {e}")
+
+def _load_guide(guide_id: str, source: str = None):
+    """Guide đã compile: từ guide bundle (mmap) nếu có, ngược lại từ JSON nguồn qua registry."""
+    bundle = get_bundle()
+    guide = bundle.guide(guide_id) if bundle is not None else None
+    return guide if guide is not None else get_registry().get(guide_id, source=source)
+
+def _guide_ready(guide_id: str) -> bool:
+    """Guide đọc được ngay, không cần trích xuất: có trong bundle hoặc đã có JSON nguồn."""
+    bundle = get_bundle()
+    if bundle is not None and bundle.has_guide(guide_id):
+        return True
+    if guide_id == "app_download":
+        return not _app_guide_needs_extraction()
+    registry = get_registry()
+    return os.path.exists(registry.source_path(registry.entry(guide_id)))
+
+def _status_message(row: dict):
+    """Cột StatusMessage của DeviceInfo (tên cột không phân biệt hoa thường)."""
+    for key, value in row.items():
+        if key.replace('_', '').lower() == 'statusmessage':
+            return value
     return None
 
+def _suggest_guides(status_message: str, folder_type: str = None, limit: int = 3) -> list:
+    """Shortlist guide cho statusMessage; bỏ guide định vị của hệ điều hành khác."""
+    skip = {"IOS": "location_android", "Android": "location_ios"}.get(folder_type)
+    matches = guide_index.lookup(status_message or "", limit + 1)
+    return [m._asdict() for m in matches if m.guide_id != skip][:limit]
+
 # --- DOC PARSING HELPERS (DOCX) ---
 try:
     from docx import Document
@@ -175,10 +177,12 @@ def _save_image_data(image_data, filepath):
             image = bg
         elif image.mode != 'RGB':
             image = image.convert('RGB')
-        image.save(filepath, "JPEG", quality=85)
+        save_image(image, filepath, "JPEG", quality=85)
+        generate_variants(filepath)
     except Exception as e:
         logging.error(f"Error saving image {filepath}: {e}")
 
+@traced("extract.docx")
 def _extract_docx_data(docx_path, output_folder, folder_type_label):
     if not HAS_DOCX: return []
     doc = Document(docx_path)
@@ -230,21 +234,29 @@ def _extract_docx_data(docx_path, output_folder, folder_type_label):
                 "image_path": "",
                 "folder_type": folder_type_label
              })
+    current_span().set_attributes({"folder_type": folder_type_label, "steps": len(results), "images": image_counter - 1})
     return results
 
 # --- DOC PARSING HELPERS (PDF) ---
 def process_pdf_files() -> dict:
     """Extract location guides from PDF."""
+    return artifacts.build("location", _build_location_artifacts)
+
+@profiled("process_pdf_files")
+@traced("extract.pdf")
+def _build_location_artifacts() -> dict:
+    """Location_Instruction.pdf -> ios/android_instructions.json + ảnh trong ARTIFACT_DIR (gọi khi giữ lock "location")."""
     try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        pdf_path = os.path.join(current_dir, "Location_Instruction.pdf")
+        current_dir = artifact_dir()
+        pdf_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Location_Instruction.pdf")
         if not os.path.exists(pdf_path): return {"status": "error", "message": "PDF not found"}
         
         tables = []
-        with pdfplumber.open(pdf_path) as pdf:
+        with span("pdf.extract_tables") as s, pdfplumber.open(pdf_path) as pdf:
             for page in pdf.pages:
                 extracted = page.extract_tables()
                 for table in extracted: tables.extend(table[1:])
+            s.set_attributes({"pages": len(pdf.pages), "rows": len(tables)})
         
         if not tables: return {"status": "error", "message": "No tables in PDF"}
         
@@ -261,11 +273,12 @@ def process_pdf_files() -> dict:
         
         # Re-implementing exact logic to ensure no regression
         all_images = []
-        with pdfplumber.open(pdf_path) as pdf:
+        with span("pdf.extract_images") as s, pdfplumber.open(pdf_path) as pdf:
             for page in pdf.pages:
                 for img in page.images:
                     bbox = (img['x0'], img['top'], img['x1'], img['bottom'])
                     all_images.append(page.within_bbox(bbox).to_image().original)
+            s.set_attribute("images", len(all_images))
         
         ios_imgs = all_images[0:5] if len(all_images) >= 5 else []
         android_imgs = all_images[5:8] if len(all_images) >= 8 else []
@@ -277,16 +290,19 @@ def process_pdf_files() -> dict:
         os.makedirs(android_folder, exist_ok=True)
         
         ios_paths = []
-        for i, img in enumerate(ios_imgs, 1):
-             p = os.path.join(ios_folder, f"{i}.jpg")
-             img.convert('RGB').save(p, "JPEG")
-             ios_paths.append(os.path.relpath(p, current_dir))
-             
         android_paths = []
-        for i, img in enumerate(android_imgs, 1):
-             p = os.path.join(android_folder, f"{i}.jpg")
-             img.convert('RGB').save(p, "JPEG")
-             android_paths.append(os.path.relpath(p, current_dir))
+        with span("pdf.save_images", images=len(ios_imgs) + len(android_imgs)):
+            for i, img in enumerate(ios_imgs, 1):
+                 p = os.path.join(ios_folder, f"{i}.jpg")
+                 save_image(img.convert('RGB'), p, "JPEG")
+                 generate_variants(p)
+                 ios_paths.append(os.path.relpath(p, current_dir))
+                 
+            for i, img in enumerate(android_imgs, 1):
+                 p = os.path.join(android_folder, f"{i}.jpg")
+                 save_image(img.convert('RGB'), p, "JPEG")
+                 generate_variants(p)
+                 android_paths.append(os.path.relpath(p, current_dir))
              
         # Create Steps (Simplified parsing logic from original)
         def _make_steps(text, img_paths, type_):
@@ -300,8 +316,12 @@ def process_pdf_files() -> dict:
         ios_steps = _make_steps(ios_rows.iloc[0]['How_to_Enable_Location'] if not ios_rows.empty else "", ios_paths, "IOS")
         android_steps = _make_steps(android_rows.iloc[0]['How_to_Enable_Location'] if not android_rows.empty else "", android_paths, "Android")
         
-        with open(os.path.join(current_dir, "ios_instructions.json"), 'w', encoding='utf-8') as f: json.dump(ios_steps, f, indent=2)
-        with open(os.path.join(current_dir, "android_instructions.json"), 'w', encoding='utf-8') as f: json.dump(android_steps, f, indent=2)
+        artifacts.write_json(os.path.join(current_dir, "ios_instructions.json"), ios_steps, indent=2)
+        artifacts.write_json(os.path.join(current_dir, "android_instructions.json"), android_steps, indent=2)
+        refresh_path_index()
+        _rebuild_guide_index()
+        _rebuild_guide_bundle()
+        current_span().set_attributes({"ios_steps": len(ios_steps), "android_steps": len(android_steps)})
         
         return {"status": "success"}
     except Exception as e:
@@ -309,20 +329,132 @@ def process_pdf_files() -> dict:
 
 # --- CORE TOOLS ---
 
+@traced("tool.query_DeviceInfo")
 def query_DeviceInfo(userid: str) -> dict:
     """Get device info from DB."""
+    replica_data = _replica_lookup(userid)
+    if replica_data is not None:
+        return {"status": "success", "data": replica_data}
+    return _query_device_live(userid)
+
+def get_connection():
+    """Kết nối SQL Server. db (pyodbc) import lúc gọi để tools import được trên máy không có libodbc."""
+    from .db import get_connection as connect
+    return connect()
+
+def _replica_lookup(userid: str):
+    """Dòng DeviceInfo từ replica SQLite cục bộ (DEVICE_REPLICA=1); None: miss / quá cũ / tắt."""
+    device_replica.start_sync_thread(lambda: get_connection())
+    return device_replica.lookup(userid)
+
+def _query_device_live(userid: str) -> dict:
+    """Truy vấn DeviceInfo trên SQL Server."""
     if not config.get('TABLE'): return {"status": "error", "message": "Missing TABLE env var"}
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT * FROM {config['TABLE']} WHERE UserID = ?", (str(userid),))
-        columns = [c[0] for c in cursor.description]
-        rows = cursor.fetchall()
+        with span("db.connect"):
+            conn = get_connection()
+        with span("db.select", table=config['TABLE']) as s:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT * FROM {config['TABLE']} WHERE UserID = ?", (str(userid),))
+            columns = [c[0] for c in cursor.description]
+            rows = cursor.fetchall()
+            s.set_attribute("rows", len(rows))
         data = [{columns[i]: convert_value_to_json_serializable(row[i]) for i in range(len(columns))} for row in rows]
         return {"status": "success", "data": data}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+def _location_json_path(folder_type: str) -> str:
+    return artifact_path("ios_instructions.json" if folder_type == "IOS" else "android_instructions.json")
+
+def _location_guide_id(folder_type: str) -> str:
+    return "location_ios" if folder_type == "IOS" else "location_android"
+
+def _relative_image_path(image_path: str) -> str:
+    # JSON của các lần trích xuất cũ lưu đường dẫn tuyệt đối
+    return os.path.relpath(image_path, artifact_dir()) if os.path.isabs(image_path) else image_path
+
+def _format_location_steps(steps, base_url: str, width: int = LOCATION_IMAGE_WIDTH) -> dict:
+    """guide / images / rendered_markdown theo format "Bước N" + ảnh."""
+    images_data = []
+    guide_parts = []
+    rendered_steps = []
+    
+    for step in sorted(steps, key=lambda x: x.number or 0):
+        txt = step.text
+        img_url = None
+        if txt: guide_parts.append(f"Bước {step.number}: {txt}")
+        
+        if step.image_path:
+            img_url = _build_image_url(base_url, _relative_image_path(step.image_path), width)
+            images_data.append({
+                "step_number": step.number,
+                "url": img_url,
+                "filename": os.path.basename(step.image_path)
+            })
+        if txt or img_url:
+            rendered_steps.append((step.number, txt, img_url))
+    return {
+        "guide": " -> ".join(guide_parts),
+        "images": images_data,
+        # Markdown đúng format của instruction, agent trả nguyên văn (xem fast_path.py)
+        "rendered_markdown": render_location_steps(rendered_steps, width)
+    }
+
+def _format_app_steps(steps, base_url: str, width: int = APP_GUIDE_IMAGE_WIDTH) -> dict:
+    """steps / rendered_markdown theo format instruction + ảnh nhỏ."""
+    formatted_steps = []
+    for step in steps:
+        img_url = None
+        if step.image_path:
+            img_url = _build_image_url(base_url, _relative_image_path(step.image_path), width)
+        formatted_steps.append({
+            "step": step.number,
+            "instruction": step.text,
+            "image_url": img_url
+        })
+    return {
+        "steps": formatted_steps,
+        "rendered_markdown": render_app_steps(
+            [(s["step"], s["instruction"], s["image_url"]) for s in formatted_steps], width
+        )
+    }
+
+def _image_base_url() -> str:
+    with span("image_server.start") as s:
+        base_url = image_base_url()
+        s.set_attribute("base_url", base_url)
+    return base_url
+
+@traced("guide.location")
+def _build_location_guide(device_name: str, folder_type: str, status_message: str = None) -> dict:
+    """Đọc guide (tạo JSON từ PDF nếu chưa có) và format response cho thiết bị."""
+    # 2. Get Guide (Check JSON, generate if needed)
+    json_path = _location_json_path(folder_type)
+    cache_hit = _guide_ready(_location_guide_id(folder_type))
+    current_span().set_attributes({"folder_type": folder_type, "device_name": device_name, "cache_hit": cache_hit})
+    
+    if not cache_hit:
+        built = artifacts.ensure("location", lambda: os.path.exists(json_path), _build_location_artifacts)
+        if built.get("status") != "success":
+            return built
+        
+    with span("guide.json_load", folder_type=folder_type) as s:
+        guide = _load_guide(_location_guide_id(folder_type), source=json_path)
+        steps = guide.steps if guide else ()
+        s.set_attribute("steps", len(steps))
+        
+    # 3. Format Response
+    formatted = _format_location_steps(steps, _image_base_url())
+    current_span().set_attribute("images", len(formatted["images"]))
+    result = {"status": "success", "device_name": device_name,
+              "guide_id": _location_guide_id(folder_type), **formatted}
+    if status_message is not None:
+        result["status_message"] = status_message
+        result["suggested_guides"] = _suggest_guides(status_message, folder_type)
+    return result
+
+@traced("tool.get_complete_location_guide")
 def get_complete_location_guide(userid: str) -> dict:
     """Get location enable guide for user's device."""
     # 1. Get Device Info
@@ -330,106 +462,165 @@ def get_complete_location_guide(userid: str) -> dict:
     if dev_info.get("status") != "success" or not dev_info.get("data"):
          return {"status": "error", "message": "Device info not found"}
     
-    device_name = dev_info['data'][0].get('DeviceName', '')
+    row = dev_info['data'][0]
+    device_name = row.get('DeviceName', '')
     folder_type = determine_folder_type_from_device_name(device_name)
+    return _build_location_guide(device_name, folder_type, _status_message(row))
+
+def _app_guide_paths() -> tuple:
+    """(json_path, docx_path, images_dir) của hướng dẫn tải app Hộ Nghèo."""
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # 2. Get Guide (Check JSON, generate if needed)
-    json_path = os.path.join(current_dir, "ios_instructions.json" if folder_type == "IOS" else "android_instructions.json")
-    
+    return (
+        artifact_path("help_rasoathongheo_ai.json"),
+        os.path.join(current_dir, "HELP_RASOATHONGHEO_AI.docx"),
+        artifact_path("extracted_images"),
+    )
+
+def _app_guide_needs_extraction() -> bool:
+    json_path, _, images_dir = _app_guide_paths()
     if not os.path.exists(json_path):
-        process_pdf_files()
-        
-    if os.path.exists(json_path):
-        with open(json_path, 'r', encoding='utf-8') as f: steps = json.load(f)
-    else:
-        steps = []
-        
-    # 3. Format Response
-    port = _start_image_server()
-    base_url = f"http://localhost:{port}" if port else ""
-    
-    images_data = []
-    guide_parts = []
-    
-    for step in sorted(steps, key=lambda x: x.get('step_number', 0)):
-        txt = step.get('text', '').strip()
-        img_rel = step.get('image_path')
-        if txt: guide_parts.append(f"Bước {step.get('step_number')}: {txt}")
+        return True
+    return not os.path.exists(images_dir) or not os.listdir(images_dir)
+
+def _extract_app_guide() -> dict:
+    """Trích xuất hướng dẫn tải app nếu chưa có (một process build, các process khác chờ lock)."""
+    return artifacts.ensure("app_guide", lambda: not _app_guide_needs_extraction(), _build_app_guide)
+
+@traced("extract.app_guide")
+def _build_app_guide() -> dict:
+    """Trích xuất HELP_RASOATHONGHEO_AI.docx -> JSON + extracted_images."""
+    json_path, docx_path, images_dir = _app_guide_paths()
+    logging.info("Extracting data from HELP_RASOATHONGHEO_AI.docx...")
+    if not os.path.exists(docx_path):
+        return {"status": "error", "message": "Source DOCX file not found."}
         
-        if img_rel:
-            images_data.append({
-                "step_number": step.get('step_number'),
-                "url": f"{base_url}/{img_rel.replace(os.sep, '/')}" if base_url else img_rel,
-                "filename": os.path.basename(img_rel)
-            })
+    try:
+        data = _extract_docx_data(docx_path, images_dir, "RASOATHONGHEO")
+        artifacts.write_json(json_path, data, ensure_ascii=False, indent=2)
+        refresh_path_index()
+        _rebuild_guide_index()
+        _rebuild_guide_bundle()
+    except Exception as e:
+        return {"status": "error", "message": f"Extraction failed: {str(e)}"}
+    return {"status": "success"}
+
+@traced("guide.app")
+def _read_app_guide() -> dict:
+    """Đọc JSON hướng dẫn tải app và format response."""
+    json_path, _, _ = _app_guide_paths()
+    try:
+        with span("guide.json_load") as s:
+            guide = _load_guide("app_download", source=json_path)
+            if guide is None:
+                raise FileNotFoundError(json_path)
+            s.set_attribute("steps", len(guide.steps))
             
-    return {
-        "status": "success",
-        "device_name": device_name,
-        "guide": " -> ".join(guide_parts),
-        "images": images_data
-    }
+        formatted = _format_app_steps(guide.steps, _image_base_url())
+        current_span().set_attribute("images", sum(1 for s in formatted["steps"] if s["image_url"]))
+        return {"status": "success", "app_name": "Quản lý Hộ Nghèo", **formatted}
+    except Exception as e:
+        return {"status": "error", "message": f"Error reading guide: {str(e)}"}
 
+@traced("tool.get_poverty_app_download_guide")
 def get_poverty_app_download_guide() -> dict:
     """
     Get instructions for downloading "Hộ Nghèo" app (Quản lý hộ nghèo).
     Automagically extracts from DOCX if JSON not present.
     """
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    json_path = os.path.join(current_dir, "help_rasoathongheo_ai.json")
-    docx_path = os.path.join(current_dir, "HELP_RASOATHONGHEO_AI.docx")
-    images_dir = os.path.join(current_dir, "extracted_images")
-    
-    # Check if we need to extract
-    needs_extraction = False
-    if not os.path.exists(json_path):
-        needs_extraction = True
-    elif not os.path.exists(images_dir) or not os.listdir(images_dir):
-        needs_extraction = True
-        
+    needs_extraction = not _guide_ready("app_download")
+    current_span().set_attribute("cache_hit", not needs_extraction)
     if needs_extraction:
-        logging.info("Extracting data from HELP_RASOATHONGHEO_AI.docx...")
-        if not os.path.exists(docx_path):
-            return {"status": "error", "message": "Source DOCX file not found."}
-            
-        try:
-            data = _extract_docx_data(docx_path, images_dir, "RASOATHONGHEO")
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            return {"status": "error", "message": f"Extraction failed: {str(e)}"}
-            
-    # Read Data
+        extracted = _extract_app_guide()
+        if extracted.get("status") != "success":
+            return extracted
+    return _read_app_guide()
+
+# --- GUIDE REGISTRY ---
+
+@traced("extract.guide")
+def _extract_guide(guide_id: str) -> dict:
+    """Tạo JSON nguồn cho guide trong registry nếu chưa có (PDF định vị hoặc DOCX của manifest)."""
+    registry = get_registry()
+    entry = registry.entry(guide_id)
+    if entry is None:
+        return {"status": "error", "message": f"Unknown guide_id '{guide_id}'"}
+    if entry.id in ("location_ios", "location_android"):
+        json_path = _location_json_path("IOS" if entry.id == "location_ios" else "Android")
+        return artifacts.ensure("location", lambda: os.path.exists(json_path), _build_location_artifacts)
+    if entry.id == "app_download":
+        return _extract_app_guide()
+    source = registry.source_path(entry)
+    return artifacts.ensure(f"guide-{guide_id}", lambda: os.path.exists(source), lambda: _build_guide(guide_id))
+
+def _build_guide(guide_id: str) -> dict:
+    """DOCX của guide trong manifest -> JSON + ảnh trong ARTIFACT_DIR."""
+    registry = get_registry()
+    entry = registry.entry(guide_id)
+    if not entry.docx:
+        return {"status": "error", "message": f"Guide '{guide_id}' has no source file."}
+
+    docx_path = registry.docx_path(entry)
+    if not os.path.exists(docx_path):
+        return {"status": "error", "message": "Source DOCX file not found."}
+    images_dir = artifact_path(entry.images_dir or f"{entry.id}_images")
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            steps = json.load(f)
-            
-        port = _start_image_server()
-        base_url = f"http://localhost:{port}" if port else ""
-        
-        formatted_steps = []
-        for step in steps:
-            img_path = step.get("image_path")
-            img_url = None
-            if img_path:
-                # Handle absolute paths from previous extraction script
-                if os.path.isabs(img_path):
-                    rel_path = os.path.relpath(img_path, current_dir)
-                else:
-                    rel_path = img_path
-                img_url = f"{base_url}/{rel_path.replace(os.sep, '/')}" if base_url else rel_path
-
-            formatted_steps.append({
-                "step": step.get("step_number"),
-                "instruction": step.get("text"),
-                "image_url": img_url
-            })
-            
-        return {
-            "status": "success",
-            "app_name": "Quản lý Hộ Nghèo",
-            "steps": formatted_steps
-        }
+        data = _extract_docx_data(docx_path, images_dir, entry.id.upper())
+        for step in data:
+            if step["image_path"]:
+                step["image_path"] = os.path.relpath(step["image_path"], artifact_dir())
+        artifacts.write_json(registry.source_path(entry), data, ensure_ascii=False, indent=2)
+        refresh_path_index()
+        _rebuild_guide_index()
+        _rebuild_guide_bundle()
     except Exception as e:
-        return {"status": "error", "message": f"Error reading guide: {str(e)}"}
\ No newline at end of file
+        return {"status": "error", "message": f"Extraction failed: {str(e)}"}
+    return {"status": "success"}
+
+def _read_guide(guide_id: str) -> dict:
+    """Format guide đã có JSON nguồn theo layout của nó."""
+    entry = get_registry().entry(guide_id)
+    guide = _load_guide(guide_id)
+    if guide is None:
+        return {"status": "error", "message": f"Guide '{guide_id}' is not available."}
+    base_url = _image_base_url()
+    if entry.layout == "app":
+        formatted = _format_app_steps(guide.steps, base_url, entry.image_width)
+    else:
+        formatted = _format_location_steps(guide.steps, base_url, entry.image_width)
+    return {"status": "success", "guide_id": entry.id, "title": entry.title, **formatted}
+
+def _guide_catalog_response(guide_id: str):
+    """Danh sách guide khi guide_id rỗng / lỗi khi id lạ; None nếu id hợp lệ."""
+    catalog = [{"guide_id": e.id, "title": e.title, "keywords": list(e.keywords)} for e in get_registry().entries()]
+    if not guide_id:
+        return {"status": "success", "guides": catalog}
+    if get_registry().entry(guide_id) is None:
+        return {"status": "error", "message": f"Unknown guide_id '{guide_id}'", "guides": catalog}
+    return None
+
+@traced("tool.get_guide")
+def get_guide(guide_id: str = "") -> dict:
+    """
+    Get any registered troubleshooting guide (network, app crash, permissions, location...) by guide_id.
+    Call with an empty guide_id to list available guides (guide_id, title, keywords).
+    """
+    guide_id = (guide_id or "").strip()
+    current_span().set_attribute("guide_id", guide_id)
+    catalog = _guide_catalog_response(guide_id)
+    if catalog is not None:
+        return catalog
+    if not _guide_ready(guide_id):
+        extracted = _extract_guide(guide_id)
+        if extracted.get("status") != "success":
+            return extracted
+    return _read_guide(guide_id)
+
+@traced("tool.find_guides_for_status")
+def find_guides_for_status(status_message: str) -> dict:
+    """
+    Find the guides that best match a device statusMessage (ranked shortlist with scores).
+    Use the top guide_id with get_guide to show the fix.
+    """
+    guides = _suggest_guides(status_message)
+    current_span().set_attribute("matches", len(guides))
+    return {"status": "success", "status_message": status_message, "guides": guides}
@@ -0,0 +1,233 @@
+"""
+Tracing theo stage cho tool, DB và trích xuất - span tương thích OpenTelemetry.
+
+Exporter chọn qua biến môi trường TRACING_EXPORTER:
+    none     (mặc định) span là no-op, gần như không tốn chi phí
+    console  mỗi span một dòng log khi kết thúc
+    json     mỗi span một dòng JSON, ghi vào TRACING_FILE (mặc định traces.jsonl)
+    otel     chuyển sang OpenTelemetry tracer (cần opentelemetry-api; ADK đã cài sẵn),
+             span nằm chung trace với span của ADK
+
+    with span("db.query_DeviceInfo", table=table) as s:
+        rows = cursor.fetchall()
+        s.set_attribute("rows", len(rows))
+
+Module chỉ dùng stdlib để cả package agent lẫn các script độc lập
+(process_docx.py, extract_docx_data.py) cùng import được.
+"""
+import os
+import json
+import time
+import logging
+import functools
+import threading
+import contextvars
+
+config = {
+    'EXPORTER': os.getenv('TRACING_EXPORTER', 'none').lower(),
+    'FILE': os.getenv('TRACING_FILE', 'traces.jsonl'),
+}
+
+_current_span = contextvars.ContextVar("tracing_current_span", default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Span cục bộ; khi kết thúc được gửi sang exporter."""
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "attributes",
+                 "start_ns", "end_ns", "status", "_exporter", "_token", "_started")
+
+    def __init__(self, name, attributes, exporter):
+        parent = _current_span.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.status = "OK"
+        self._exporter = exporter
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._started
+        self.end_ns = self.start_ns + int(duration * 1e9)
+        if exc_type is not None:
+            self.status = "ERROR"
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        try:
+            self._exporter(self.to_dict())
+        except Exception:
+            logging.exception("Trace exporter failed")
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def _export_console(record: dict):
+    attributes = " ".join(f"{k}={v}" for k, v in record["attributes"].items())
+    depth = "  " if record["parent_span_id"] else ""
+    logging.info(f"[trace {record['trace_id'][:8]}] {depth}{record['name']} "
+                 f"{record['duration_ms']}ms {record['status']} {attributes}")
+
+
+class _JsonExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            # Append từng dòng: process trích xuất (spawn) ghi chung file được
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class _OtelSpan:
+    __slots__ = ("_manager", "_span")
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._span = None
+
+    def set_attribute(self, key, value):
+        self._span.set_attribute(key, _otel_value(value))
+
+    def set_attributes(self, attributes):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def __enter__(self):
+        self._span = self._manager.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._manager.__exit__(exc_type, exc, tb)
+
+
+def _otel_value(value):
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+_exporter = None
+_otel_tracer = None
+
+
+def configure(exporter: str = None, path: str = None):
+    """Đổi exporter lúc chạy (CLI, benchmark); mặc định đọc từ config."""
+    global _exporter, _otel_tracer
+    exporter = (exporter or config['EXPORTER']).lower()
+    config['EXPORTER'] = exporter
+    if path:
+        config['FILE'] = path
+    _exporter, _otel_tracer = None, None
+    if exporter == "console":
+        _exporter = _export_console
+    elif exporter == "json":
+        _exporter = _JsonExporter(config['FILE'])
+    elif exporter == "otel":
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            logging.warning("TRACING_EXPORTER=otel but opentelemetry-api is not installed; tracing disabled")
+            config['EXPORTER'] = "none"
+            return
+        _otel_tracer = trace.get_tracer("guide_agent")
+    elif exporter != "none":
+        logging.warning(f"Unknown TRACING_EXPORTER={exporter!r}; tracing disabled")
+        config['EXPORTER'] = "none"
+
+
+def enabled() -> bool:
+    return _exporter is not None or _otel_tracer is not None
+
+
+def span(name: str, **attributes):
+    """Context manager span; no-op khi tracing tắt."""
+    if _exporter is not None:
+        return Span(name, attributes, _exporter)
+    if _otel_tracer is not None:
+        return _OtelSpan(_otel_tracer.start_as_current_span(
+            name, attributes={k: _otel_value(v) for k, v in attributes.items()}))
+    return _NOOP_SPAN
+
+
+def current_span():
+    """Span đang mở (để gắn attribute mà không cần truyền span qua tham số)."""
+    if _exporter is not None:
+        return _current_span.get() or _NOOP_SPAN
+    if _otel_tracer is not None:
+        from opentelemetry import trace
+        return _OtelCurrentSpan(trace.get_current_span())
+    return _NOOP_SPAN
+
+
+class _OtelCurrentSpan(_OtelSpan):
+    __slots__ = ()
+
+    def __init__(self, otel_span):
+        super().__init__(None)
+        self._span = otel_span
+
+
+def traced(name: str = None):
+    """Decorator bọc cả hàm trong một span; tool trả dict có "status" thì ghi vào attribute."""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return fn(*args, **kwargs)
+            with span(span_name) as s:
+                result = fn(*args, **kwargs)
+                if isinstance(result, dict) and "status" in result:
+                    s.set_attribute("result_status", result["status"])
+                return result
+        return wrapper
+    return decorator
+
+
+configure()
@@ -0,0 +1,197 @@
+"""
+Triage hàng loạt toàn bộ bảng DeviceInfo: tìm mọi thiết bị có statusMessage báo lỗi
+định vị hoặc cài app, để làm báo cáo hằng đêm.
+
+- Đọc TABLE bằng cursor forward-only của pyodbc (SQL Server stream kết quả, không
+  nạp cả bảng) theo từng chunk fetchmany(--chunk-size)
+- Mỗi chunk là một DataFrame: statusMessage được phân loại theo giá trị duy nhất
+  (qua guide_index, có cache giữa các chunk) rồi map ngược cho cả cột; folder type
+  tính bằng phép string vector hoá
+- Thiết bị bị gắn cờ được ghi nối vào devices-<ngày>.csv sau mỗi chunk; số đếm theo
+  (DeviceModel, folder_type, category) cộng dồn trong bộ nhớ, ghi ra summary-<ngày>.csv
+  ở cuối. Bộ nhớ chỉ phụ thuộc chunk size và số model, không phụ thuộc số dòng.
+
+Usage (từ thư mục cha của agent):
+    python -m <tên thư mục agent>.triage --out triage/ --chunk-size 5000
+    python -m <tên thư mục agent>.triage --categories location,app_install,other --all
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import date
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from . import guide_index
+from .tracing import span
+
+load_dotenv()
+config = {
+    'TABLE': os.getenv('TABLE'),
+    'CHUNK_SIZE': int(os.getenv('TRIAGE_CHUNK_SIZE', '5000')),
+}
+
+CATEGORIES = ("location", "app_install", "other", "ok")
+DEFAULT_FLAGGED = ("location", "app_install")
+# Giữ cache phân loại có giới hạn: statusMessage chứa mã lỗi/thời gian có thể gần như duy nhất
+_CLASSIFY_CACHE_LIMIT = 50000
+
+OUTPUT_COLUMNS = ["UserID", "DeviceName", "DeviceModel", "folder_type", "StatusMessage",
+                  "category", "guide_id", "score"]
+
+
+def _category(guide_id) -> str:
+    if guide_id is None:
+        return "ok"
+    if guide_id.startswith("location_"):
+        return "location"
+    if guide_id == "app_download":
+        return "app_install"
+    return "other"
+
+
+class StatusClassifier:
+    """statusMessage -> (category, guide_id, score), tra index một lần cho mỗi giá trị."""
+
+    def __init__(self):
+        self._cache = {}
+
+    def classify(self, messages: pd.Series) -> pd.DataFrame:
+        messages = messages.fillna("").astype(str)
+        unknown = [m for m in messages.unique() if m not in self._cache]
+        if len(self._cache) + len(unknown) > _CLASSIFY_CACHE_LIMIT:
+            self._cache.clear()
+        for message in unknown:
+            matches = guide_index.lookup(message, limit=1)
+            top = matches[0] if matches else None
+            self._cache[message] = (_category(top.guide_id if top else None),
+                                    top.guide_id if top else "", top.score if top else 0.0)
+        classified = messages.map(self._cache)
+        return pd.DataFrame(classified.tolist(), index=messages.index, columns=["category", "guide_id", "score"])
+
+
+def _column_map(description) -> dict:
+    """Tên cột chuẩn -> tên cột thật trong bảng (không phân biệt hoa thường / gạch dưới)."""
+    actual = {c[0].replace('_', '').lower(): c[0] for c in description}
+    wanted = {"UserID": "userid", "DeviceName": "devicename", "DeviceModel": "devicemodel",
+              "StatusMessage": "statusmessage"}
+    return {name: actual[key] for name, key in wanted.items() if key in actual}
+
+
+def classify_chunk(df: pd.DataFrame, classifier: StatusClassifier) -> pd.DataFrame:
+    """Thêm folder_type / category / guide_id / score cho một chunk (vector hoá)."""
+    device = df["DeviceName"].fillna("").astype(str).str.lower()
+    # Cùng quy tắc với tools.determine_folder_type_from_device_name
+    df["folder_type"] = device.str.contains("iphone|ios|ipad", regex=True).map({True: "IOS", False: "Android"})
+    return df.join(classifier.classify(df["StatusMessage"]))
+
+
+def iter_chunks(conn, table: str, chunk_size: int):
+    """DataFrame từng chunk; chỉ giữ một chunk trong bộ nhớ."""
+    cursor = conn.cursor()
+    cursor.arraysize = chunk_size
+    cursor.execute(f"SELECT * FROM {table}")
+    columns = [c[0] for c in cursor.description]
+    mapping = _column_map(cursor.description)
+    missing = {"UserID", "DeviceName", "StatusMessage"} - set(mapping)
+    if missing:
+        raise ValueError(f"Table {table} is missing columns: {', '.join(sorted(missing))}")
+    rename = {actual: name for name, actual in mapping.items()}
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records((tuple(row) for row in rows), columns=columns).rename(columns=rename)
+            if "DeviceModel" not in df:
+                df["DeviceModel"] = df["DeviceName"]
+            yield df[["UserID", "DeviceName", "DeviceModel", "StatusMessage"]]
+    finally:
+        cursor.close()
+
+
+def run_triage(conn, table: str, out_dir: str, chunk_size: int = None,
+               flagged=DEFAULT_FLAGGED, write_all: bool = False) -> dict:
+    """Stream bảng, ghi devices CSV theo chunk và summary CSV ở cuối; trả về summary dict."""
+    chunk_size = chunk_size or config['CHUNK_SIZE']
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = date.today().strftime("%Y%m%d")
+    devices_path = os.path.join(out_dir, f"devices-{stamp}.csv")
+    summary_path = os.path.join(out_dir, f"summary-{stamp}.csv")
+    started = time.perf_counter()
+
+    classifier = StatusClassifier()
+    totals = {}  # (DeviceModel, folder_type, category) -> count
+    rows = flagged_rows = chunks = 0
+    tmp_path = devices_path + ".tmp"
+    # Ghi vào file tạm rồi rename: báo cáo cũ không bị thay bằng file dở dang nếu lỗi giữa chừng
+    with open(tmp_path, 'w', encoding='utf-8-sig', newline='') as f:
+        pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(f, index=False)
+        for df in iter_chunks(conn, table, chunk_size):
+            with span("triage.chunk", rows=len(df)) as s:
+                df = classify_chunk(df, classifier)
+                for key, count in df.groupby(["DeviceModel", "folder_type", "category"], dropna=False).size().items():
+                    totals[key] = totals.get(key, 0) + int(count)
+                selected = df if write_all else df[df["category"].isin(flagged)]
+                selected[OUTPUT_COLUMNS].to_csv(f, header=False, index=False)
+                s.set_attribute("flagged", len(selected))
+            rows += len(df)
+            flagged_rows += len(selected)
+            chunks += 1
+            if chunks % 20 == 0:
+                logging.info(f"Triage: {rows} rows, {flagged_rows} flagged")
+    os.replace(tmp_path, devices_path)
+
+    summary = pd.DataFrame(
+        [(*key, count) for key, count in totals.items()],
+        columns=["DeviceModel", "folder_type", "category", "devices"],
+    ).sort_values(["category", "devices"], ascending=[True, False])
+    summary.to_csv(summary_path, index=False, encoding='utf-8-sig')
+
+    by_category = {c: 0 for c in CATEGORIES}
+    for (_, _, category), count in totals.items():
+        by_category[category] = by_category.get(category, 0) + count
+    return {
+        "table": table,
+        "rows": rows,
+        "flagged": flagged_rows,
+        "chunks": chunks,
+        "by_category": by_category,
+        "devices_csv": os.path.abspath(devices_path),
+        "summary_csv": os.path.abspath(summary_path),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk triage of DeviceInfo statusMessage values.")
+    parser.add_argument("--out", default="triage", help="Thư mục ghi báo cáo")
+    parser.add_argument("--table", default=None, help="Bảng cần quét (mặc định TABLE trong .env)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Số dòng mỗi lần fetchmany")
+    parser.add_argument("--categories", default=",".join(DEFAULT_FLAGGED),
+                        help=f"Nhóm được ghi vào devices CSV: {', '.join(CATEGORIES)}")
+    parser.add_argument("--all", action="store_true", help="Ghi mọi thiết bị, không chỉ thiết bị bị gắn cờ")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    table = args.table or config['TABLE']
+    if not table:
+        parser.error("Missing TABLE env var (or --table)")
+    from .db import get_connection
+    conn = get_connection()
+    try:
+        summary = run_triage(conn, table, args.out, args.chunk_size,
+                             flagged=tuple(c.strip() for c in args.categories.split(",") if c.strip()),
+                             write_all=args.all)
+    finally:
+        conn.close()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())